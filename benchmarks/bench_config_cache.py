@@ -0,0 +1,69 @@
+"""Benchmark: loading the product config with and without the compiled-config cache
+
+Loads configs of growing size (every rule with its own `ref_name` regex, every tenth with a `repo`
+regex) three ways: without a git directory (no cache), cold (the cache is built and written) and
+warm (the cache is loaded). The regex cache of the `re` module is purged before every load, so
+each load pays what a fresh CLI process would.
+
+    python -m benchmarks.bench_config_cache
+"""
+
+import json
+import re
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_config_matching import CONFIGURATIONS
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.repocontext import RepoContext
+
+RULE_COUNTS = [10, 100, 1000, 5000]
+RUNS = 20
+
+
+def generate_config(rules=int):
+    config = {f"config-{c}": [] for c in range(CONFIGURATIONS)}
+    for i in range(rules):
+        repo = f"team-{i}/.*" if i % 10 == 0 else f"org/component-{i}"
+        config[f"config-{i % CONFIGURATIONS}"].append(
+            {"repo": repo, "ref_type": "tag", "ref_name": rf"^{i}\.\d+\.\d+(-rc\.\d+)?$"}
+        )
+    return config
+
+
+def time_load(root, runs, before=None):
+    timings = []
+    for _ in range(runs):
+        if before is not None:
+            before()
+        re.purge()
+        start = time.perf_counter()
+        ProductConfig(context=RepoContext(git_root=str(root)))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e3
+
+
+def main():
+    print(f"{'rules':>7} {'no cache (ms)':>14} {'cold (ms)':>10} {'warm (ms)':>10} {'speedup':>8}")
+    for rules in RULE_COUNTS:
+        root = Path(tempfile.mkdtemp())
+        try:
+            (root / "config-rotator.json").write_text(json.dumps(generate_config(rules), indent=2))
+            no_cache = time_load(root, RUNS)
+
+            (root / ".git").mkdir()
+            cache_dir = root / ".git" / "gh-rotator" / "cache"
+            cold = time_load(
+                root, RUNS, before=lambda d=cache_dir: shutil.rmtree(d, ignore_errors=True)
+            )
+            warm = time_load(root, RUNS)
+        finally:
+            shutil.rmtree(root)
+        print(f"{rules:>7} {no_cache:>14.2f} {cold:>10.2f} {warm:>10.2f} {no_cache / warm:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
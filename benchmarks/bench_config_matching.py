@@ -0,0 +1,68 @@
+"""Benchmark: configuration lookup time against the number of rules in config-rotator.json
+
+Compares the original lookup (walk every rule, `re.fullmatch` on the raw pattern strings) with the
+compiled `ConfigMatcher`, for a hit on the last declared rule and for a miss.
+
+    python -m benchmarks.bench_config_matching
+"""
+
+import re
+import timeit
+
+from gh_rotator.classes.configmatcher import ConfigMatcher
+
+CONFIGURATIONS = 12
+RULE_COUNTS = [10, 100, 500, 1000, 5000]
+SEMVER = r"^\d+\.\d+\.\d+$"
+
+
+def generate_config(rules=int):
+    """Generate a config with `rules` rules spread over CONFIGURATIONS configurations
+
+    Every tenth rule uses a `repo` regex, the rest name a repo literally.
+    """
+    config = {f"config-{c}": [] for c in range(CONFIGURATIONS)}
+    for i in range(rules):
+        repo = f"team-{i}/.*" if i % 10 == 0 else f"org/component-{i}"
+        config[f"config-{i % CONFIGURATIONS}"].append(
+            {"repo": repo, "ref_type": "tag", "ref_name": SEMVER}
+        )
+    return config
+
+
+def naive_match(config, repo, event_name, event_type):
+    for configuration, rules in config.items():
+        for rule in rules:
+            if (
+                re.fullmatch(rule["repo"], repo)
+                and rule["ref_type"] == event_type
+                and re.fullmatch(rule["ref_name"], event_name)
+            ):
+                return configuration
+    return None
+
+
+def best_of(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"{'rules':>7} {'case':>5} {'naive (µs)':>12} {'compiled (µs)':>14} {'speedup':>8}")
+    for rules in RULE_COUNTS:
+        config = generate_config(rules)
+        matcher = ConfigMatcher(config)
+        last = f"org/component-{rules - 1}" if (rules - 1) % 10 else f"team-{rules - 1}/x"
+        cases = {"hit": (last, "1.2.3", "tag"), "miss": ("nobody/nothing", "1.2.3", "tag")}
+        number = max(1, 20000 // rules)
+
+        for case, event in cases.items():
+            assert naive_match(config, *event) == matcher.match(*event)
+            naive = best_of(lambda c=config, e=event: naive_match(c, *e), number)
+            compiled = best_of(lambda m=matcher, e=event: m.match(*e), number)
+            print(
+                f"{rules:>7} {case:>5} {naive:>12.1f} {compiled:>14.1f} {naive / compiled:>7.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
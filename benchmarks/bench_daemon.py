@@ -0,0 +1,110 @@
+"""Benchmark: latency of the CLI running commands itself vs forwarding them to `gh rotator serve`
+
+Sets up a product repo with a 1000 rule config and 10k entry manifests, starts a daemon for it
+and times `manifest` lookups three ways: the CLI on its own, the CLI forwarding to the daemon,
+and a bare request to the daemon (what other tooling talking to the socket directly pays).
+
+    python -m benchmarks.bench_daemon
+"""
+
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_config_matching import generate_config
+from gh_rotator.modules.rotator_client import NO_DAEMON_ENV
+from gh_rotator.modules.rotator_transport import request
+
+RUNS = 20
+ENTRIES = 10_000
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_product(root):
+    (root / ".git").mkdir()
+    config = generate_config(1000)
+    (root / "config-rotator.json").write_text(json.dumps(config, indent=2))
+    for configuration in config:
+        entries = [
+            {
+                "repo": f"org/component-{i}",
+                "version": f"{i:040x}",
+                "ref_type": "tag",
+                "ref_name": "1.0.0",
+                "last_update": "2025-05-15 (07:51:28) [UTC]",
+            }
+            for i in range(ENTRIES)
+        ]
+        manifest = root / "configurations" / configuration / f"config-{configuration}-manifest.json"
+        manifest.parent.mkdir(parents=True)
+        manifest.write_text(json.dumps({configuration: entries}, indent=4))
+
+
+def time_cli(argv, env):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "gh_rotator", *argv], env=env, check=True, capture_output=True
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    print(
+        f"{name:<28} mean {statistics.mean(timings) * 1e3:8.2f} ms"
+        f"   p50 {statistics.median(timings) * 1e3:8.2f} ms"
+    )
+
+
+def main():
+    root = Path(tempfile.mkdtemp())
+    daemon = None
+    try:
+        setup_product(root)
+        env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+        argv = ["manifest", "--configuration", "config-3", "--repo", "org/component-42"]
+        argv += ["--git-root", str(root)]
+
+        report("CLI, no daemon", time_cli(argv, {**env, NO_DAEMON_ENV: "1"}))
+
+        socket_path = root / ".git" / "gh-rotator" / "daemon.sock"
+        daemon = subprocess.Popen(
+            [sys.executable, "-m", "gh_rotator", "serve", "--git-root", str(root)], env=env
+        )
+        while not socket_path.exists():
+            time.sleep(0.05)
+
+        report("CLI, forwarded to daemon", time_cli(argv, env))
+
+        payload = {
+            "command": "manifest",
+            "configuration": "config-3",
+            "repo": "org/component-42",
+            "git_root": str(root),
+            "config_file": None,
+            "manifest_dir": "configurations",
+            "verbose": False,
+        }
+        timings = []
+        for _ in range(RUNS * 10):
+            start = time.perf_counter()
+            request(str(socket_path), "POST", "/run", payload)
+            timings.append(time.perf_counter() - start)
+        report("Direct request to daemon", timings)
+    finally:
+        if daemon is not None:
+            daemon.terminate()
+            daemon.wait()
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
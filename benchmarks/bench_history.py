@@ -0,0 +1,99 @@
+"""Benchmark: point-in-time manifest queries on a rotation history of 100k events
+
+Appends 100k rotations of 1000 repos to a history (in batches, as `lock --events-file` does) and
+times `at` queries for random event numbers and timestamps: with a snapshot every 1000 events
+(the default) and with the initial snapshot only, which means replaying the log from the start.
+
+    python -m benchmarks.bench_history
+"""
+
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from gh_rotator.classes.manifesthistory import SNAPSHOT_INTERVAL, ManifestHistory, upsert
+
+EVENTS = 100_000
+REPOS = 1000
+BATCH = 100
+QUERIES = 20
+START = 1_700_000_000.0
+
+
+def build(directory, snapshot_interval):
+    """Build a history of EVENTS rotations, one batch per second
+
+    Returns:
+        history (ManifestHistory): The history
+        timings (list): The time of each append (seconds)
+    """
+    rng = random.Random(7)
+    history = ManifestHistory(str(directory), snapshot_interval=snapshot_interval)
+    history.start([], START)
+    entries, index, timings = [], {}, []
+    for batch in range(EVENTS // BATCH):
+        events = [
+            {
+                "repo": f"org/component-{rng.randrange(REPOS)}",
+                "version": f"{rng.getrandbits(160):040x}",
+                "ref_type": "branch",
+                "ref_name": "main",
+                "last_update": "2025-05-15 (07:51:28) [UTC]",
+            }
+            for _ in range(BATCH)
+        ]
+        for event in events:
+            upsert(entries, index, event)
+        begin = time.perf_counter()
+        history.append(events, entries, START + batch)
+        timings.append(time.perf_counter() - begin)
+    return history, timings
+
+
+def time_queries(history, key, points):
+    timings = []
+    for point in points:
+        begin = time.perf_counter()
+        history.at(key, point)
+        timings.append(time.perf_counter() - begin)
+    return timings
+
+
+def size(directory):
+    return sum(f.stat().st_size for f in Path(directory).iterdir()) / 1e6
+
+
+def report(name, timings, unit="ms"):
+    print(
+        f"{name:<40} mean {statistics.mean(timings) * 1e3:9.2f} {unit}"
+        f"   p95 {statistics.quantiles(timings, n=20)[-1] * 1e3:9.2f} {unit}"
+    )
+
+
+def main():
+    rng = random.Random(3)
+    seqs = [rng.randrange(EVENTS + 1) for _ in range(QUERIES)]
+    times = [START + rng.uniform(0, EVENTS // BATCH) for _ in range(QUERIES)]
+
+    root = Path(tempfile.mkdtemp())
+    try:
+        setups = [
+            (f"snapshots every {SNAPSHOT_INTERVAL}", SNAPSHOT_INTERVAL),
+            ("initial snapshot only", EVENTS * 10),
+        ]
+        for name, interval in setups:
+            directory = root / name.replace(" ", "-")
+            history, appends = build(directory, interval)
+            print(f"{name} - {EVENTS} events, {size(directory):.1f} MB on disk")
+            report(f"  append ({BATCH} events)", appends)
+            report("  at <seq>", time_queries(history, "seq", seqs))
+            report("  at <timestamp>", time_queries(history, "time", times))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
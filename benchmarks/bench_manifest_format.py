@@ -0,0 +1,59 @@
+"""Benchmark: file size, serialize time and parse time of the pretty and the compact manifest format
+
+python -m benchmarks.bench_manifest_format
+"""
+
+import json
+import random
+import statistics
+import time
+
+from gh_rotator.modules.manifestformat import dumps_manifest, timestamp
+
+ENTRY_COUNTS = [1000, 10_000, 50_000]
+ROUNDS = 5
+
+
+def generate_manifest(entries, manifest_format):
+    rng = random.Random(9)
+    return {
+        "prod": [
+            {
+                "repo": f"org-{i % 20}/component-{i}",
+                "ref_type": "branch",
+                "ref_name": "main",
+                "version": f"{rng.getrandbits(160):040x}",
+                "last_update": timestamp(manifest_format),
+            }
+            for i in range(entries)
+        ]
+    }
+
+
+def best_of(function):
+    timings = []
+    for _ in range(ROUNDS):
+        begin = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - begin)
+    return min(timings), statistics.mean(timings)
+
+
+def main():
+    print(
+        f"{'entries':>8} {'format':>8} {'size (KB)':>10} {'serialize (ms)':>15} {'parse (ms)':>11}"
+    )
+    for entries in ENTRY_COUNTS:
+        for manifest_format in ("pretty", "compact"):
+            manifest = generate_manifest(entries, manifest_format)
+            content = dumps_manifest(manifest, manifest_format).encode("utf-8")
+            serialize, _ = best_of(lambda m=manifest, f=manifest_format: dumps_manifest(m, f))
+            parse, _ = best_of(lambda c=content: json.loads(c))
+            print(
+                f"{entries:>8} {manifest_format:>8} {len(content) / 1e3:>10,.0f}"
+                f" {serialize * 1e3:>15.1f} {parse * 1e3:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark: repo lookups in a loaded manifest - linear scan vs the repo index
+
+Times 1000 lookups of random repos (the pattern batch tooling uses when it calls get_version or
+rotate in a loop) against manifests with 10, 1k and 50k entries, plus the one-off cost of building
+the index when the manifest is first accessed.
+
+    python -m benchmarks.bench_manifest_index
+"""
+
+import random
+import timeit
+
+ENTRY_COUNTS = [10, 1_000, 50_000]
+LOOKUPS = 1000
+
+
+def generate_entries(count=int):
+    return [
+        {
+            "repo": f"org/component-{i}",
+            "version": f"{i:040x}",
+            "ref_type": "branch",
+            "ref_name": "main",
+            "last_update": "2025-05-15 (07:51:28) [UTC]",
+        }
+        for i in range(count)
+    ]
+
+
+def linear_lookup(entries, repo):
+    for entry in entries:
+        if entry["repo"] == repo:
+            return entry
+    return None
+
+
+def build_index(entries):
+    index = {}
+    for entry in entries:
+        index.setdefault(entry["repo"], entry)
+    return index
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'entries':>8} {'linear (ms)':>12} {'indexed (ms)':>13} {'index build (ms)':>17}")
+    for count in ENTRY_COUNTS:
+        entries = generate_entries(count)
+        repos = [f"org/component-{rng.randrange(count)}" for _ in range(LOOKUPS)]
+        index = build_index(entries)
+
+        linear = min(
+            timeit.repeat(lambda e=entries, r=repos: [linear_lookup(e, x) for x in r], number=1)
+        )
+        indexed = min(timeit.repeat(lambda i=index, r=repos: [i.get(x) for x in r], number=1))
+        build = min(timeit.repeat(lambda e=entries: build_index(e), number=1))
+        print(f"{count:>8} {linear * 1e3:>12.2f} {indexed * 1e3:>13.3f} {build * 1e3:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
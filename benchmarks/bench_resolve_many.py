@@ -0,0 +1,72 @@
+"""Benchmark: classification throughput of a stream of events, in events per second
+
+Classifies 50k events (a day's worth of push and tag webhooks, a third of them matching no rule)
+against configs of growing size: with ProductConfig.resolve_many in-process, and end to end with
+`config --events-file`, JSONL in and JSONL out.
+
+    python -m benchmarks.bench_resolve_many
+"""
+
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_config_matching import generate_config
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.repocontext import RepoContext
+
+EVENTS = 50_000
+RULE_COUNTS = [10, 1000, 5000]
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def generate_events(rules, count):
+    rng = random.Random(5)
+    for _ in range(count):
+        i = rng.randrange(rules)
+        repo = f"team-{i}/x" if i % 10 == 0 else f"org/component-{i}"
+        if rng.random() < 1 / 3:
+            repo = f"nobody/{repo}"
+        event_type, event_name = rng.choice([("tag", "1.2.3"), ("branch", "main")])
+        yield {"repo": repo, "event_type": event_type, "event_name": event_name}
+
+
+def main():
+    print(f"{'rules':>7} {'resolve_many (events/s)':>24} {'config --events-file (events/s)':>32}")
+    for rules in RULE_COUNTS:
+        root = Path(tempfile.mkdtemp())
+        try:
+            (root / ".git").mkdir()
+            (root / "config-rotator.json").write_text(json.dumps(generate_config(rules)))
+            events_file = root / "events.jsonl"
+            with events_file.open("w") as f:
+                f.writelines(json.dumps(event) + "\n" for event in generate_events(rules, EVENTS))
+
+            config = ProductConfig(context=RepoContext(git_root=str(root)))
+            start = time.perf_counter()
+            for _result in config.resolve_many(generate_events(rules, EVENTS)):
+                pass
+            in_process = EVENTS / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "-m", "gh_rotator", "config", "--events-file", str(events_file)],
+                cwd=root,
+                env={**os.environ, "PYTHONPATH": str(REPO_ROOT), "GH_ROTATOR_NO_DAEMON": "1"},
+                check=False,
+                stdout=subprocess.DEVNULL,
+            )
+            cli = EVENTS / (time.perf_counter() - start)
+        finally:
+            shutil.rmtree(root)
+        print(f"{rules:>7} {in_process:>24,.0f} {cli:>32,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark: bytes and time written per rotation, flat manifest vs sharded manifest
+
+Rotates random repos of manifests of growing size and saves each rotation the way
+ProductManifest.save does: the whole manifest file in the flat layout, only the shard of the
+rotated repo (by hash) in the sharded one.
+
+    python -m benchmarks.bench_shards
+"""
+
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from gh_rotator.classes.manifestshards import ManifestShards, shard_name
+from gh_rotator.modules.fileio import write_if_changed
+
+REPO_COUNTS = [100, 1000, 10_000]
+ROTATIONS = 200
+
+
+def generate_entries(repos):
+    return [
+        {
+            "repo": f"org-{i % 20}/component-{i}",
+            "ref_type": "branch",
+            "ref_name": "main",
+            "version": f"{i:040x}",
+            "last_update": "2025-05-15 (07:51:28) [UTC]",
+        }
+        for i in range(repos)
+    ]
+
+
+def rotate(entries, rng, save):
+    """Rotate ROTATIONS random repos, saving after each one
+
+    Returns:
+        written (list): The bytes written by each save
+        timings (list): The time of each save (seconds)
+    """
+    written, timings = [], []
+    for _ in range(ROTATIONS):
+        entry = rng.choice(entries)
+        entry["version"] = f"{rng.getrandbits(160):040x}"
+        begin = time.perf_counter()
+        written.append(save(entry["repo"]))
+        timings.append(time.perf_counter() - begin)
+    return written, timings
+
+
+def main():
+    print(f"{'repos':>7} {'flat (KB / ms)':>20} {'sharded (KB / ms)':>20}")
+    for repos in REPO_COUNTS:
+        root = Path(tempfile.mkdtemp())
+        try:
+            entries = generate_entries(repos)
+            flat_file = root / "config-prod-manifest.json"
+
+            def save_flat(_repo, entries=entries, flat_file=flat_file):
+                content = json.dumps({"prod": entries}, indent=4).encode("utf-8")
+                write_if_changed(str(flat_file), content)
+                return len(content)
+
+            shards = ManifestShards(str(root / "shards"))
+            shards.save(entries, shard_by="hash")
+
+            def save_sharded(repo, entries=entries, shards=shards, root=root):
+                shards.save(entries, repos=[repo])
+                # Only the shard of the repo is rewritten - the index doesn't change
+                return (root / "shards" / f"{shard_name(repo, 'hash')}.json").stat().st_size
+
+            results = []
+            for save in (save_flat, save_sharded):
+                written, timings = rotate(entries, random.Random(1), save)
+                results.append(
+                    f"{statistics.mean(written) / 1e3:9.1f} / {statistics.mean(timings) * 1e3:6.2f}"
+                )
+        finally:
+            shutil.rmtree(root)
+        print(f"{repos:>7} {results[0]:>20} {results[1]:>20}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark: startup time of the CLI, per subcommand, against a checked-in regression budget
+
+Runs each subcommand against a small product repo (the test data), so the timings are dominated
+by interpreter startup, imports and argument parsing - what a shell step calling the CLI in a loop
+pays on every call. Timing is done the way hyperfine does it: warmup runs first, then the mean,
+standard deviation and minimum of the measured runs. The bare interpreter (`python -c pass`) is
+measured too, and the budget applies to the overhead on top of it.
+
+The imports of the entry point are listed with `-X importtime`, the slowest first.
+
+    python -m benchmarks.bench_startup [--runs 30] [--warmup 3]
+
+Exits non-zero if a subcommand is slower than its budget in benchmarks/startup_budget.json.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BUDGET_FILE = Path(__file__).resolve().parent / "startup_budget.json"
+TEST_DATA = REPO_ROOT / "gh_rotator" / "tests" / "data"
+IMPORTS_SHOWN = 10
+
+BACKEND = "config-rotator/backend-component"
+COMMANDS = {
+    "config": ["config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0"],
+    "manifest": ["manifest", "--configuration", "dev", "--repo", BACKEND],
+    "lock": [
+        *("lock", "--repo", BACKEND, "--event-type", "branch", "--event-name", "main"),
+        *("--sha", "f" * 40),
+    ],
+}
+
+
+def setup_product(root):
+    (root / ".git").mkdir()
+    shutil.copy(TEST_DATA / "config-rotator-valid.json", root / "config-rotator.json")
+    shutil.copytree(TEST_DATA / "manifests", root / "configurations")
+
+
+def time_command(argv, env, runs, warmup):
+    for _ in range(warmup):
+        subprocess.run(argv, env=env, check=True, capture_output=True)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, env=env, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def import_times(env):
+    """The cumulative import time (us) of each module the entry point imports, slowest first"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import gh_rotator.gh_rotator"],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, module = line.removeprefix("import time:").split("|")
+        times.append((int(cumulative), module.rstrip()))
+    return sorted(times, reverse=True)
+
+
+def report(name, timings, baseline=None):
+    mean = statistics.mean(timings) * 1e3
+    line = (
+        f"{name:<12} mean {mean:8.2f} ms ± {statistics.stdev(timings) * 1e3:6.2f}"
+        f"   min {min(timings) * 1e3:8.2f} ms"
+    )
+    if baseline is not None:
+        line += f"   overhead {mean - baseline:8.2f} ms"
+    print(line)
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+
+    budget = json.loads(BUDGET_FILE.read_text())
+    root = Path(tempfile.mkdtemp())
+    try:
+        setup_product(root)
+        env = {**os.environ, "PYTHONPATH": str(REPO_ROOT), "GH_ROTATOR_NO_DAEMON": "1"}
+
+        print(f"Imports of the entry point (cumulative, top {IMPORTS_SHOWN}):")
+        for cumulative, module in import_times(env)[:IMPORTS_SHOWN]:
+            print(f"  {cumulative / 1e3:8.2f} ms  {module}")
+        print()
+
+        baseline = report(
+            "python", time_command([sys.executable, "-c", "pass"], env, args.runs, args.warmup)
+        )
+        over_budget = []
+        for name, command in COMMANDS.items():
+            argv = [sys.executable, "-m", "gh_rotator", *command, "--git-root", str(root)]
+            overhead = (
+                report(name, time_command(argv, env, args.runs, args.warmup), baseline) - baseline
+            )
+            if overhead > budget[name]:
+                over_budget.append(f"{name}: {overhead:.2f} ms > {budget[name]} ms")
+    finally:
+        shutil.rmtree(root)
+
+    if over_budget:
+        print("\nOver the startup budget:\n  " + "\n  ".join(over_budget))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark: memory and latency of get_version on a 50k entry manifest, eager vs streaming
+
+Every lookup runs in a fresh process, as the CLI does: the eager path loads and indexes the whole
+manifest, the streaming path scans the memory mapped file for the repo (see manifestscan). The
+repos looked up are near the start, in the middle and at the end of the manifest, and one missing.
+Linux only - the peak memory is read from /proc.
+
+    python -m benchmarks.bench_streaming_lookup
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from gh_rotator.modules.manifestformat import dumps_manifest
+
+ENTRIES = 50_000
+ROUNDS = 3
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Run in the child process: one lookup - the time it took and the peak resident memory are printed
+# (VmHWM, as ru_maxrss of a child includes the memory of the parent it was forked from)
+LOOKUP = """
+import sys, time
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import RepoContext
+import gh_rotator.modules.manifestscan as manifestscan
+
+root, repo, mode = sys.argv[1:]
+if mode == "eager":
+    manifestscan.STREAM_THRESHOLD = float("inf")
+manifest = ProductManifest(ProductConfig(context=RepoContext(git_root=root)))
+begin = time.perf_counter()
+try:
+    manifest.get_version("prod", repo)
+except SystemExit:
+    pass
+latency = time.perf_counter() - begin
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+print(latency, rss / 1024)
+"""
+
+
+def setup(root, manifest_format):
+    (root / ".git").mkdir()
+    config = {"prod": [{"repo": ".*", "ref_type": "branch", "ref_name": "main"}]}
+    (root / "config-rotator.json").write_text(json.dumps(config))
+    (root / "configurations" / "prod").mkdir(parents=True)
+    entries = [
+        {
+            "repo": f"org-{i % 20}/component-{i}",
+            "ref_type": "branch",
+            "ref_name": "main",
+            "version": f"{i:040x}",
+            "last_update": "2025-05-15 (07:51:28) [UTC]",
+        }
+        for i in range(ENTRIES)
+    ]
+    content = dumps_manifest({"prod": entries}, manifest_format)
+    (root / "configurations" / "prod" / "config-prod-manifest.json").write_text(content)
+    return len(content)
+
+
+def lookup(root, repo, mode):
+    """Run one lookup in a fresh process
+
+    Returns:
+        latency (float): The time of get_version (seconds)
+        rss (float): The peak resident memory of the process (MB)
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", LOOKUP, str(root), repo, mode],
+        env={**os.environ, "PYTHONPATH": str(REPO_ROOT)},
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    latency, rss = output.split()
+    return float(latency), float(rss)
+
+
+def main():
+    repos = {
+        "first": "org-0/component-0",
+        "middle": f"org-0/component-{ENTRIES // 2}",
+        "last": f"org-19/component-{ENTRIES - 1}",
+        "missing": "org-0/missing",
+    }
+    for manifest_format in ("pretty", "compact"):
+        root = Path(tempfile.mkdtemp())
+        try:
+            size = setup(root, manifest_format)
+            print(f"{manifest_format} manifest - {ENTRIES} entries, {size / 1e6:.1f} MB")
+            print(f"  {'repo':<8} {'eager (ms / MB)':>18} {'streaming (ms / MB)':>22}")
+            for name, repo in repos.items():
+                results = []
+                for mode in ("eager", "streaming"):
+                    runs = [lookup(root, repo, mode) for _ in range(ROUNDS)]
+                    latency = min(run[0] for run in runs)
+                    rss = min(run[1] for run in runs)
+                    results.append(f"{latency * 1e3:8.1f} / {rss:6.1f}")
+                print(f"  {name:<8} {results[0]:>18} {results[1]:>22}")
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
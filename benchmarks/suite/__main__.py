@@ -0,0 +1,168 @@
+"""Benchmark suite: config matching and manifest operations at scale, with regression checks
+
+Generates product repos with 10 to 100k rules (of every regex complexity) and manifest entries,
+and times config loading, get_config_name, manifest loading, get_version, rotate, save and
+end-to-end CLI runs against them. Each result is the median, minimum and standard deviation of
+the runs, per operation. The results are saved as JSON, and can be compared with a baseline saved
+earlier - a case slower than the baseline by more than the threshold (and the noise of its runs)
+is a regression.
+
+    python -m benchmarks.suite --output results.json [--quick] [--sizes 10,1000] [--runs 5]
+    python -m benchmarks.suite --compare baseline.json [--threshold 0.25] [--output results.json]
+    python -m benchmarks.suite --compare baseline.json --results results.json   # no new runs
+
+Exits non-zero if any case regressed against the baseline.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.suite.cases import MANIFEST_CASES, MATCHING_CASES, REPO_ROOT, Product
+from benchmarks.suite.generate import COMPLEXITIES
+
+SIZES = [10, 100, 1000, 10_000, 100_000]
+QUICK_SIZES = [10, 1000]
+# Differences smaller than this are noise, whatever their ratio (ms) - timer resolution, cache and
+# scheduler effects alone move the fastest cases by tens of microseconds between runs
+NOISE_FLOOR_MS = 0.05
+# ... or smaller than this many standard deviations of the runs of a case (baseline or now)
+NOISE_STDEVS = 2
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            cwd=REPO_ROOT,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summary(timings):
+    return {
+        "median_ms": round(statistics.median(timings) * 1e3, 6),
+        "min_ms": round(min(timings) * 1e3, 6),
+        "stdev_ms": round(statistics.stdev(timings) * 1e3, 6) if len(timings) > 1 else 0.0,
+        "runs": len(timings),
+    }
+
+
+def run_cases(root, name, product_args, cases, runs, results):
+    """Time the cases against a product repo generated in root, adding them to results"""
+    directory = Path(tempfile.mkdtemp(dir=root))
+    try:
+        product = Product(directory, **product_args)
+        for case in cases:
+            key = f"{case.__name__}/{name}"
+            results[key] = summary(case(product, runs))
+            print(f"  {key:<45} {results[key]['median_ms']:>12.4f} ms", flush=True)
+    finally:
+        shutil.rmtree(directory)
+
+
+def run_suite(sizes, complexities, runs):
+    """Run every case at every size
+
+    Returns:
+        results (dict): The summary of each case, keyed by <case>/<complexity>/<size> for the
+            matching cases and <case>/<size> for the manifest cases
+    """
+    results = {}
+    root = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            for complexity in complexities:
+                product_args = {"rules": size, "entries": 10, "complexity": complexity}
+                run_cases(root, f"{complexity}/{size}", product_args, MATCHING_CASES, runs, results)
+            product_args = {"rules": 10, "entries": size, "complexity": "mixed"}
+            run_cases(root, str(size), product_args, MANIFEST_CASES, runs, results)
+    finally:
+        shutil.rmtree(root)
+    return results
+
+
+def noise(before, now):
+    """The smallest difference between the medians of two results that isn't noise (ms)"""
+    # Baselines saved before the standard deviation was recorded don't have it
+    stdev = max(before.get("stdev_ms", 0.0), now.get("stdev_ms", 0.0))
+    return max(NOISE_FLOOR_MS, NOISE_STDEVS * stdev)
+
+
+def compare(baseline, results, threshold):
+    """Compare results with a baseline - a case is only slower by a difference that isn't noise
+
+    Returns:
+        regressions (list): The cases slower than the baseline by more than the threshold
+    """
+    regressions = []
+    print(f"\n{'case':<45} {'baseline (ms)':>14} {'now (ms)':>12} {'change':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:<45} {'-':>14} {result['median_ms']:>12.4f}      new")
+            continue
+        before, now = baseline[key]["median_ms"], result["median_ms"]
+        change = now / before - 1 if before else 0.0
+        regressed = change > threshold and now - before > noise(baseline[key], result)
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:<45} {before:>14.4f} {now:>12.4f} {change:>+8.0%}{flag}")
+        if regressed:
+            regressions.append(key)
+    for key in baseline.keys() - results.keys():
+        print(f"{key:<45} {baseline[key]['median_ms']:>14.4f} {'-':>12}  dropped")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=str, help="Comma separated rule/entry counts")
+    parser.add_argument("--quick", action="store_true", help=f"Only sizes {QUICK_SIZES}")
+    parser.add_argument("--complexities", type=str, default=",".join(COMPLEXITIES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", type=str, help="Save the results to this JSON file")
+    parser.add_argument("--compare", type=str, help="A results file to compare with")
+    parser.add_argument("--results", type=str, help="Compare these results instead of running")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown that regresses")
+    args = parser.parse_args()
+
+    if args.results:
+        document = json.loads(Path(args.results).read_text())
+    else:
+        if args.sizes:
+            sizes = [int(size) for size in args.sizes.split(",")]
+        else:
+            sizes = QUICK_SIZES if args.quick else SIZES
+        document = {
+            "meta": {
+                "created": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+                "commit": commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "runs": args.runs,
+            },
+            "results": run_suite(sizes, args.complexities.split(","), args.runs),
+        }
+    if args.output:
+        Path(args.output).write_text(json.dumps(document, indent=4) + "\n")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(baseline["results"], document["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""The timed cases of the benchmark suite
+
+Every case times one operation against a product repo of a given size and returns the timings of
+its runs, in seconds per operation.
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.suite.generate import write_product
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import RepoContext
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+# The lookups and rotations timed per run of the in-process cases (averaged)
+BATCH = 200
+
+
+def timed(function, runs=int):
+    """Time function runs times
+
+    Returns:
+        timings (list): The time of each run (seconds)
+    """
+    timings = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - begin)
+    return timings
+
+
+class Product:
+    """A generated product repo (see write_product) and the events to time against it"""
+
+    def __init__(self, root=None, rules=int, entries=int, complexity="mixed"):
+        self.root = root
+        self.events = write_product(root, rules=rules, entries=entries, complexity=complexity)
+        self.entries = entries
+        # Branch events on main of literal repos - they rotate config-0, whose manifest exists
+        self.rotations = [event for event in self.events[::4] if event[0].startswith("org/")]
+
+    def config(self):
+        return ProductConfig(context=RepoContext(git_root=str(self.root)))
+
+    def clear_cache(self):
+        shutil.rmtree(self.root / ".git" / "gh-rotator" / "cache", ignore_errors=True)
+
+
+def config_load_cold(product, runs):
+    """Load the config without the compiled config cache - parse, validate and compile all rules"""
+
+    def run():
+        product.clear_cache()
+        product.config()
+
+    return timed(run, runs)
+
+
+def config_load_warm(product, runs):
+    """Load the config from the compiled config cache"""
+    product.config()
+    return timed(product.config, runs)
+
+
+def get_config_name(product, runs):
+    """Resolve the configuration of events hitting random rules, and of misses"""
+    config = product.config()
+    rng = random.Random(1)
+    events = [rng.choice(product.events) for _ in range(BATCH)]
+    events[::4] = [("nobody/nothing", "branch", "main")] * len(events[::4])
+    matcher = config.get("matcher")
+
+    def run():
+        for repo, event_type, event_name in events:
+            matcher.match(repo, event_name, event_type)
+
+    return [timing / BATCH for timing in timed(run, runs)]
+
+
+def manifest_load(product, runs):
+    """Load and index the manifest"""
+    config = product.config()
+
+    def run():
+        ProductManifest(config).get("config-0_index")
+
+    return timed(run, runs)
+
+
+def get_version(product, runs):
+    """Look up random repos in a loaded manifest"""
+    manifest = ProductManifest(product.config())
+    manifest.get("config-0_index")
+    rng = random.Random(2)
+    repos = [f"org/component-{rng.randrange(product.entries)}" for _ in range(BATCH)]
+
+    def run():
+        for repo in repos:
+            manifest.get_version("config-0", repo)
+
+    return [timing / BATCH for timing in timed(run, runs)]
+
+
+def get_version_cold(product, runs):
+    """Look up one repo in a manifest not loaded yet - what a CLI call does"""
+    config = product.config()
+    repo = f"org/component-{product.entries // 2}"
+    return timed(lambda: ProductManifest(config).get_version("config-0", repo), runs)
+
+
+def rotate(product, runs):
+    """Rotate random repos in a loaded manifest, in memory"""
+    manifest = ProductManifest(product.config())
+    manifest.get("config-0_index")
+    rng = random.Random(3)
+    rotations = [rng.choice(product.rotations) for _ in range(BATCH)]
+
+    def run():
+        for repo, event_type, event_name in rotations:
+            sha = f"{rng.getrandbits(160):040x}"
+            manifest.rotate(repo, event_name, event_type, sha, save=False)
+        manifest.get("config-0_pending").clear()
+
+    return [timing / BATCH for timing in timed(run, runs)]
+
+
+def save(product, runs):
+    """Save the manifest with one rotation: lock, re-read, re-apply, serialize, write, log it"""
+    config = product.config()
+    rng = random.Random(4)
+    timings = []
+    # The first save of a manifest also starts its history - a one-off, not timed
+    for _ in range(runs + 1):
+        manifest = ProductManifest(config)
+        repo, event_type, event_name = rng.choice(product.rotations)
+        manifest.rotate(repo, event_name, event_type, f"{rng.getrandbits(160):040x}", save=False)
+        begin = time.perf_counter()
+        manifest.save("config-0")
+        timings.append(time.perf_counter() - begin)
+    return timings[1:]
+
+
+def manifest_diff(product, runs):
+    """Diff the manifest against a copy listed in another order, with some repos rotated"""
+    from gh_rotator.modules.manifestdiff import diff
+
+    entries = ProductManifest(product.config()).get("config-0_manifest")["config-0"]
+    rng = random.Random(5)
+    other = [dict(entry) for entry in entries]
+    rng.shuffle(other)
+    for entry in other[: max(1, len(other) // 10)]:
+        entry["version"] = f"{rng.getrandbits(160):040x}"
+    return timed(lambda: diff(entries, other), runs)
+
+
+def _cli(product, runs, argv):
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT), "GH_ROTATOR_NO_DAEMON": "1"}
+    command = [sys.executable, "-m", "gh_rotator", *argv, "--git-root", str(product.root)]
+    subprocess.run(command, env=env, check=False, capture_output=True)
+    return timed(lambda: subprocess.run(command, env=env, check=False, capture_output=True), runs)
+
+
+def cli_config(product, runs):
+    """gh rotator config, end to end"""
+    repo, event_type, event_name = product.events[-1]
+    return _cli(
+        product,
+        runs,
+        ["config", "--repo", repo, "--event-type", event_type, "--event-name", event_name],
+    )
+
+
+def cli_manifest(product, runs):
+    """gh rotator manifest --repo, end to end"""
+    repo = f"org/component-{product.entries // 2}"
+    return _cli(product, runs, ["manifest", "--configuration", "config-0", "--repo", repo])
+
+
+def cli_lock(product, runs):
+    """gh rotator lock, end to end"""
+    repo, event_type, event_name = product.rotations[-1]
+    argv = ["lock", "--repo", repo, "--event-type", event_type, "--event-name", event_name]
+    return _cli(product, runs, [*argv, "--sha", "f" * 40])
+
+
+# The cases timed for every regex complexity - the others only depend on the size
+MATCHING_CASES = (config_load_cold, config_load_warm, get_config_name, cli_config)
+MANIFEST_CASES = (
+    manifest_load,
+    get_version,
+    get_version_cold,
+    rotate,
+    save,
+    manifest_diff,
+    cli_manifest,
+    cli_lock,
+)
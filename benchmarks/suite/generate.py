@@ -0,0 +1,94 @@
+"""Synthetic product repos for the benchmark suite: configs, manifests and the events matching them
+
+Everything is generated from a seed, so two runs of the suite time exactly the same data.
+"""
+
+import json
+import random
+
+from gh_rotator.modules.manifestformat import dumps_manifest
+
+CONFIGURATIONS = 4
+SEMVER = r"^\d+\.\d+\.\d+$"
+
+# How the repo of rule i is written, for each regex complexity, and a repo that it matches:
+# literal - every rule names a repo, mixed - every tenth rule is a repo prefix regex (a typical
+# config), regex - every rule is an alternation with character classes and an optional group
+COMPLEXITIES = ("literal", "mixed", "regex")
+
+
+def rule_repo(i=int, complexity=str):
+    """The repo pattern of rule i, and a repo it matches
+
+    Returns:
+        pattern (str): The repo pattern of the rule
+        repo (str): A repo matching the pattern (and no rule before it)
+    """
+    if complexity == "regex" or (complexity == "mixed" and i % 10 == 0):
+        if complexity == "mixed":
+            return f"team-{i}/.*", f"team-{i}/service"
+        return rf"(?:team|squad)-{i}/(?:api|web|worker)-[a-z0-9]+(?:-v\d+)?", f"squad-{i}/web-x1-v2"
+    return f"org/component-{i}", f"org/component-{i}"
+
+
+def generate_config(rules=int, complexity="mixed"):
+    """A config with the given number of rules, spread over CONFIGURATIONS configurations
+
+    The configurations alternate between branch rules (on main) and tag rules (on semver tags).
+
+    Returns:
+        config (dict): The config, as in config-rotator.json
+        events (list): For each rule, an event (repo, event_type, event_name) matching it
+    """
+    config = {f"config-{c}": [] for c in range(CONFIGURATIONS)}
+    events = []
+    for i in range(rules):
+        configuration = i % CONFIGURATIONS
+        pattern, repo = rule_repo(i, complexity)
+        if configuration % 2:
+            rule = {"repo": pattern, "ref_type": "tag", "ref_name": SEMVER}
+            events.append((repo, "tag", f"1.{i % 7}.{i % 13}"))
+        else:
+            rule = {"repo": pattern, "ref_type": "branch", "ref_name": "main"}
+            events.append((repo, "branch", "main"))
+        config[f"config-{configuration}"].append(rule)
+    return config, events
+
+
+def generate_entries(entries=int, seed=0):
+    """The entries of a manifest with the given number of repos"""
+    rng = random.Random(seed)
+    return [
+        {
+            "repo": f"org/component-{i}",
+            "ref_type": "branch",
+            "ref_name": "main",
+            "version": f"{rng.getrandbits(160):040x}",
+            "last_update": "2025-05-15 (07:51:28) [UTC]",
+        }
+        for i in range(entries)
+    ]
+
+
+def write_product(root=None, rules=int, entries=int, complexity="mixed", manifest_format="pretty"):
+    """Write a product repo: a config and the manifest of config-0 (the one branch events on main hit)
+
+    Args:
+        root (Path): The (empty) directory to write it to
+        rules (int): The number of rules in the config
+        entries (int): The number of entries in the manifest of config-0
+        complexity (str): The regex complexity of the rules (see COMPLEXITIES)
+        manifest_format (str): The format of the manifest (see manifestformat)
+    Returns:
+        events (list): For each rule, an event (repo, event_type, event_name) matching it
+    """
+    (root / ".git").mkdir()
+    config, events = generate_config(rules, complexity)
+    (root / "config-rotator.json").write_text(json.dumps(config, indent=4))
+    manifest_dir = root / "configurations" / "config-0"
+    manifest_dir.mkdir(parents=True)
+    manifest = {"config-0": generate_entries(entries)}
+    (manifest_dir / "config-config-0-manifest.json").write_text(
+        dumps_manifest(manifest, manifest_format)
+    )
+    return events
@@ -0,0 +1,2 @@
+# Keep in sync with the version in pyproject.toml
+__version__ = "0.0.1"
@@ -0,0 +1,286 @@
+import re
+from heapq import merge
+from operator import itemgetter
+
+# Characters that carry a special meaning in a regular expression
+_SPECIAL = frozenset(".^$*+?{}[]|()")
+# The regex rules tested at once by a single alternation of their repo patterns
+BLOCK_SIZE = 64
+# The layout of the data of to_cache - bump it whenever the buckets change, so the matchers cached
+# in that layout are rebuilt rather than restored wrongly (2: the prefix bucket and blocks)
+CACHE_FORMAT = 2
+# Group references and named groups - a pattern using them changes meaning in an alternation
+_GROUPS = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\\g<")
+
+
+def literal_pattern(pattern=str):
+    """Reduce a regular expression to the literal string it matches, if it is one
+
+    Args:
+        pattern (str): The regular expression (as written in the config file)
+    Returns:
+        literal (str): The literal string the pattern fullmatches (None if the pattern is a real regex)
+    """
+    body = pattern.removeprefix("^")
+    if body.endswith("$") and not body.endswith("\\$"):
+        body = body[:-1]
+
+    chars = []
+    i = 0
+    while i < len(body):
+        char = body[i]
+        if char == "\\":
+            # An escaped punctuation character is a literal, anything else (\d, \w, \Z...) is not
+            if i + 1 < len(body) and not body[i + 1].isalnum():
+                chars.append(body[i + 1])
+                i += 2
+                continue
+            return None
+        if char in _SPECIAL:
+            return None
+        chars.append(char)
+        i += 1
+    return "".join(chars)
+
+
+def prefix_pattern(pattern=str):
+    """Reduce a regular expression to the literal prefix of the strings it matches, if it is one
+
+    Args:
+        pattern (str): The regular expression (as written in the config file), like org/svc-.*
+    Returns:
+        prefix (str): The literal the pattern starts with, followed by .* or .+ only
+            (None if the pattern is anything else)
+    """
+    body = pattern.removeprefix("^")
+    if body.endswith("$") and not body.endswith("\\$"):
+        body = body[:-1]
+    if not body.endswith((".*", ".+")):
+        return None
+    # A trailing backslash escapes the dot (org\.*), literal_pattern rejects it
+    return literal_pattern(body[:-2])
+
+
+class ConfigMatcher:
+    """Compiled and indexed representation of the rules in a product config
+
+    The matcher is built once, when the config is loaded. All patterns are validated and the
+    rules are bucketed by `ref_type`. Within a bucket, the rules are indexed by their `repo`:
+
+    - a literal repo name is a key in a dict of exact names
+    - a literal prefix followed by .* or .+ (org/.*, org/svc-.*) is a key in a prefix index, keyed
+      by owner when the prefix names one - a repo only looks up its own prefixes
+    - any other regex is tested in blocks: the alternation of the patterns of a block rules out
+      all of them with a single match, only the rules of a block that matches are tested one by one
+
+    The candidates found are still checked with their own patterns. Every rule remembers its
+    position in the config file, and the candidates are checked in that order, so the resolution
+    is still first-match-wins in file order.
+
+    The buckets only hold plain data, so a matcher can be saved (to_cache) and restored
+    (from_cache) without building it again. A restored matcher compiles its patterns on first use.
+    """
+
+    def __init__(self, config=dict):
+        # ref_type -> {repo: [rule, ...]}
+        self.literal = {}
+        # ref_type -> {"owners": {owner: {prefix: [rule, ...]}}, "any": {prefix: [rule, ...]}}
+        self.prefix = {}
+        # ref_type -> [rule, ...]
+        self.regex = {}
+        self.__reset()
+
+        index = 0
+        for configuration, rules in config.items():
+            for rule in rules:
+                self.__compile(rule["ref_name"])
+                self.__add(index, configuration, rule)
+                index += 1
+
+    def __reset(self):
+        """Forget what is built on first use: the compiled patterns, blocks and prefix lengths"""
+        # pattern -> compiled pattern
+        self.patterns = {}
+        # ref_type -> [[rule, ...], ...]
+        self.blocks = {}
+        # (ref_type, number of the block) -> compiled alternation of the block
+        self.alternations = {}
+        # id of a prefix dict -> the distinct lengths of its prefixes, shortest first
+        self.lengths = {}
+
+    def __add(self, index=int, configuration=str, rule=dict):
+        ref_type = rule["ref_type"]
+        repo = literal_pattern(rule["repo"])
+        if repo is not None:
+            compiled = (index, configuration, None, rule["ref_name"])
+            self.literal.setdefault(ref_type, {}).setdefault(repo, []).append(compiled)
+            return
+
+        self.__compile(rule["repo"])
+        compiled = (index, configuration, rule["repo"], rule["ref_name"])
+        prefix = prefix_pattern(rule["repo"])
+        if prefix is None:
+            self.regex.setdefault(ref_type, []).append(compiled)
+            return
+        prefixes = self.prefix.setdefault(ref_type, {"owners": {}, "any": {}})
+        owner, slash, name = prefix.partition("/")
+        if slash:
+            prefixes["owners"].setdefault(owner, {}).setdefault(name, []).append(compiled)
+        else:
+            prefixes["any"].setdefault(prefix, []).append(compiled)
+
+    @classmethod
+    def from_cache(cls, data=dict):
+        """Restore a matcher saved with to_cache - without validating or compiling anything
+
+        Args:
+            data (dict): The saved matcher
+        Returns:
+            matcher (ConfigMatcher): The restored matcher
+        Raises:
+            KeyError, TypeError: If data isn't a saved matcher
+        """
+
+        def rules(bucket):
+            return {key: [tuple(rule) for rule in rules] for key, rules in bucket.items()}
+
+        matcher = cls.__new__(cls)
+        matcher.literal = {ref_type: rules(repos) for ref_type, repos in data["literal"].items()}
+        matcher.prefix = {
+            ref_type: {
+                "owners": {owner: rules(names) for owner, names in index["owners"].items()},
+                "any": rules(index["any"]),
+            }
+            for ref_type, index in data["prefix"].items()
+        }
+        matcher.regex = {
+            ref_type: [tuple(rule) for rule in rules] for ref_type, rules in data["regex"].items()
+        }
+        matcher.__reset()
+        return matcher
+
+    def to_cache(self):
+        """The matcher as plain (JSON serializable) data, to be restored with from_cache
+
+        Returns:
+            data (dict): The literal, prefix and regex buckets of the matcher
+        """
+        return {"literal": self.literal, "prefix": self.prefix, "regex": self.regex}
+
+    def __compile(self, pattern=str):
+        try:
+            return self.patterns[pattern]
+        except KeyError:
+            compiled = self.patterns[pattern] = re.compile(pattern)
+            return compiled
+
+    def __prefixed(self, prefixes=dict, name=str):
+        """The rules in a prefix dict with a prefix the name starts with"""
+        lengths = self.lengths.get(id(prefixes))
+        if lengths is None:
+            lengths = self.lengths[id(prefixes)] = sorted({len(prefix) for prefix in prefixes})
+        found = []
+        for length in lengths:
+            if length > len(name):
+                break
+            found += prefixes.get(name[:length], ())
+        return found
+
+    def __blocks(self, event_type=str):
+        """The regex rules of a bucket, in blocks of BLOCK_SIZE rules"""
+        blocks = self.blocks.get(event_type)
+        if blocks is None:
+            rules = self.regex.get(event_type, [])
+            blocks = self.blocks[event_type] = [
+                rules[start : start + BLOCK_SIZE] for start in range(0, len(rules), BLOCK_SIZE)
+            ]
+        return blocks
+
+    def __alternation(self, event_type=str, number=int, block=list):
+        """The alternation of the repo patterns of a block, compiled when the block is first reached
+
+        None if the patterns can't be combined (group references or named groups, inline flags) -
+        the rules of the block are always tested one by one.
+        """
+        key = (event_type, number)
+        if key in self.alternations:
+            return self.alternations[key]
+        alternation = None
+        if not any(_GROUPS.search(rule[2]) for rule in block):
+            try:
+                alternation = re.compile("|".join(f"(?:{rule[2]})" for rule in block))
+            except re.error:
+                alternation = None
+        self.alternations[key] = alternation
+        return alternation
+
+    def __blocked(self, repo=str, event_type=str):
+        """Yield the regex rules of the blocks whose alternation matches the repo, in file order"""
+        for number, block in enumerate(self.__blocks(event_type)):
+            alternation = self.__alternation(event_type, number, block)
+            if alternation is None or alternation.fullmatch(repo):
+                yield from block
+
+    def __candidates(self, repo=str, event_name=str, event_type=str):
+        """Yield the position (in the config file) and configuration of every rule matching the
+        event, in file order"""
+        candidates = list(self.literal.get(event_type, {}).get(repo, ()))
+
+        prefix = self.prefix.get(event_type)
+        if prefix is not None:
+            owner, slash, name = repo.partition("/")
+            if slash and owner in prefix["owners"]:
+                candidates += self.__prefixed(prefix["owners"][owner], name)
+            if prefix["any"]:
+                candidates += self.__prefixed(prefix["any"], repo)
+
+        candidates.sort(key=itemgetter(0))
+        if event_type in self.regex:
+            # Lazily, in file order - match stops at the first block with a matching rule
+            candidates = merge(candidates, self.__blocked(repo, event_type), key=itemgetter(0))
+
+        for index, configuration, repo_pattern, ref_name_pattern in candidates:
+            if repo_pattern is not None and not self.__compile(repo_pattern).fullmatch(repo):
+                continue
+            if self.__compile(ref_name_pattern).fullmatch(event_name):
+                yield index, configuration
+
+    def match(self, repo=str, event_name=str, event_type=str):
+        """Find the first configuration (in file order) with a rule matching the event
+
+        Args:
+            repo (str): The fully qualified name (owner/repo) of the repo to look up
+            event_name (str): The event name that triggered the run (branch or tag name)
+            event_type (str): The event type that triggered the run (branch|tag)
+        Returns:
+            configuration (str): The configuration name that was found (None if nothing matches)
+        """
+        for _index, configuration in self.__candidates(repo, event_name, event_type):
+            return configuration
+        return None
+
+    def match_all(self, repo=str, event_name=str, event_type=str):
+        """Find every configuration with a rule matching the event, in one pass over the rules
+
+        Args:
+            repo (str): The fully qualified name (owner/repo) of the repo to look up
+            event_name (str): The event name that triggered the run (branch or tag name)
+            event_type (str): The event type that triggered the run (branch|tag)
+        Returns:
+            configurations (list): The configuration names, in file order (empty if nothing matches)
+        """
+        return list(
+            dict.fromkeys(
+                configuration
+                for _index, configuration in self.__candidates(repo, event_name, event_type)
+            )
+        )
+
+    def match_rules(self, repo=str, event_name=str, event_type=str):
+        """Find every rule matching the event - used to tell which rules shadow each other
+
+        Returns:
+            rules (list): The positions of the rules in the config file (counting the rules of all
+                configurations, in file order)
+        """
+        return [index for index, _configuration in self.__candidates(repo, event_name, event_type)]
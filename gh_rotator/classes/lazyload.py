@@ -3,6 +3,7 @@ class Lazyload:
 
     def __init__(self):
         self.props = {}
+        self.loaders = {}
 
     def set(self, key, value):
         """Some syntactic sugar to set the class properties
@@ -14,14 +15,35 @@ class Lazyload:
         self.props[key] = value
         return self.props[key]
 
+    def set_loader(self, key, loader):
+        """Defer the computation of a class property until it is read for the first time
+
+        Args:
+            key (str): The key of the class property
+            loader (callable): Called without arguments to compute the value on the first get()
+        """
+        self.loaders[key] = loader
+
     def get(self, key):
         """Some syntactic sugar to get the class properties
 
         Args:
             key (str): The key to get from the class properties - The key must exist in the class properties
+                (or have a loader registered with set_loader)
 
         Returns:
             value: The value of the key in the class properties
         """
+        if key not in self.props and key in self.loaders:
+            self.set(key, self.loaders[key]())
         assert key in self.props, f"Property {key} not found on class"
         return self.props[key]
+
+    def reset(self, key):
+        """Forget a lazily loaded class property, so it is loaded again on the next get()
+
+        Args:
+            key (str): The key of the class property - it must have a loader registered with set_loader
+        """
+        assert key in self.loaders, f"Property {key} has no loader on class"
+        self.props.pop(key, None)
@@ -0,0 +1,188 @@
+import json
+import os
+
+from gh_rotator.classes.lazyload import Lazyload
+
+# A snapshot of the whole manifest is taken every SNAPSHOT_INTERVAL events
+SNAPSHOT_INTERVAL = 1000
+ENTRY_KEYS = ("repo", "version", "ref_type", "ref_name", "last_update")
+# How much of the end of the event log is read at a time to find its last event
+TAIL_CHUNK = 4096
+
+
+def parse_point(point=str):
+    """Parse a point in the history, as given to `manifest --at`
+
+    Args:
+        point (str): An event sequence number, or an ISO 8601 timestamp (local time if it has no offset)
+    Returns:
+        point (tuple): ("seq", int) or ("time", float - seconds since the epoch)
+    Raises:
+        ValueError: If point is neither
+    """
+    if point.isdigit():
+        return "seq", int(point)
+
+    import datetime
+
+    return "time", datetime.datetime.fromisoformat(point).timestamp()
+
+
+def upsert(entries=list, index=dict, event=dict):
+    """Apply a rotation event to the manifest entries (and their index by repo)"""
+    entry = index.get(event["repo"])
+    if entry is None:
+        entry = index[event["repo"]] = {key: event[key] for key in ENTRY_KEYS}
+        entries.append(entry)
+    else:
+        entry.update((key, event[key]) for key in ENTRY_KEYS if key != "repo")
+
+
+class ManifestHistory(Lazyload):
+    """Class used to keep the append-only log of the rotations of one configuration's manifest
+
+    The history lives next to the manifest, in a history directory:
+    events.jsonl holds one line per rotation that changed the manifest - its seq (1, 2, ...), its time
+    (seconds since the epoch) and the entry as it was written. Every SNAPSHOT_INTERVAL events the
+    manifest entries are saved to snapshot-<seq>.json, and listed in snapshots.jsonl by the seq of
+    the last event they hold. The manifest at any point of the history is the nearest snapshot
+    before it, plus the events after the seq of the snapshot up to the point.
+
+    The events are found by their seq, not by where they are in the file: the history is committed
+    with the manifest, and a merge, rebase or line ending conversion moves them around.
+    """
+
+    def __init__(self, directory=str, snapshot_interval=SNAPSHOT_INTERVAL):
+        super().__init__()
+
+        self.set("directory", directory)
+        self.set("events_file", os.path.join(directory, "events.jsonl"))
+        self.set("snapshots_file", os.path.join(directory, "snapshots.jsonl"))
+        self.set("snapshot_interval", snapshot_interval)
+
+    def exists(self):
+        """Whether the history has been started"""
+        return os.path.exists(self.get("snapshots_file"))
+
+    def start(self, entries=list, when=float):
+        """Start the history with a snapshot of the manifest as it is before its first event
+
+        Args:
+            entries (list): The entries of the manifest
+            when (float): The time of the snapshot (seconds since the epoch)
+        """
+        os.makedirs(self.get("directory"), exist_ok=True)
+        with open(self.get("events_file"), "ab"):
+            pass
+        self.__snapshot(entries, seq=0, when=when)
+
+    def append(self, events=list, entries=list, when=float):
+        """Append rotation events to the log - must be called while holding the manifest lock
+
+        Args:
+            events (list): The entries written by the rotations, in the order they were applied
+            entries (list): The entries of the manifest after the rotations (for the snapshot)
+            when (float): The time of the rotations (seconds since the epoch)
+        Returns:
+            seq (int): The sequence number of the last event in the log
+        """
+        last = self.__last_event()
+        seq = 0 if last is None else last["seq"]
+        if not events:
+            return seq
+
+        # Keep the log ordered by time as well, even if clocks of consecutive runs disagree
+        when = when if last is None else max(when, last["time"])
+        lines = []
+        for event in events:
+            seq += 1
+            record = {"seq": seq, "time": when, **{key: event[key] for key in ENTRY_KEYS}}
+            lines.append(json.dumps(record, separators=(",", ":")))
+
+        first = seq - len(events) + 1
+        with open(self.get("events_file"), "ab") as f:
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+        interval = self.get("snapshot_interval")
+        if (first - 1) // interval != seq // interval:
+            self.__snapshot(entries, seq=seq, when=when)
+        return seq
+
+    def __snapshot(self, entries=list, seq=int, when=float):
+        from gh_rotator.modules.fileio import write_if_changed
+
+        file = f"snapshot-{seq}.json"
+        content = json.dumps(entries, separators=(",", ":")).encode("utf-8")
+        write_if_changed(os.path.join(self.get("directory"), file), content)
+        record = {"seq": seq, "time": when, "file": file}
+        with open(self.get("snapshots_file"), "a") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def __last_event(self):
+        """Read the last event of the log - from the end of the file, without reading all of it"""
+        if not os.path.exists(self.get("events_file")):
+            return None
+        with open(self.get("events_file"), "rb") as f:
+            position = f.seek(0, os.SEEK_END)
+            tail = b""
+            while position > 0:
+                step = min(TAIL_CHUNK, position)
+                position -= step
+                f.seek(position)
+                tail = f.read(step) + tail
+                lines = tail.rstrip(b"\n").rsplit(b"\n", 1)
+                if lines[-1] and (len(lines) == 2 or position == 0):
+                    return json.loads(lines[-1])
+        return None
+
+    def at(self, key=str, value=float):
+        """Rebuild the manifest entries at a point in the history
+
+        Args:
+            key (str): "seq" or "time" (see parse_point)
+            value (float): The last event sequence number, or time, to include
+        Returns:
+            entries (list): The manifest entries at that point (None if the history starts later)
+        Raises:
+            ValueError: If the history is broken - a file is missing or isn't valid JSON lines
+        """
+        if not self.exists():
+            return None
+        try:
+            return self.__replay(key, value)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"The history in {self.get('directory')} is broken: {e!s}") from e
+
+    def __replay(self, key=str, value=float):
+        """Rebuild the manifest entries at a point in the history (see at)"""
+        with open(self.get("snapshots_file")) as f:
+            snapshots = [json.loads(line) for line in f if line.strip()]
+
+        # Snapshots are ordered by seq and by time alike - take the last one not after the point
+        snapshot = None
+        for candidate in snapshots:
+            if candidate[key] > value:
+                break
+            snapshot = candidate
+        if snapshot is None:
+            return None
+
+        with open(os.path.join(self.get("directory"), snapshot["file"])) as f:
+            entries = json.load(f)
+        index = {}
+        for entry in entries:
+            index.setdefault(entry["repo"], entry)
+
+        with open(self.get("events_file"), "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["seq"] <= snapshot["seq"]:
+                    continue
+                if event[key] > value:
+                    break
+                upsert(entries, index, event)
+        return entries
@@ -0,0 +1,177 @@
+import json
+import os
+import re
+
+from gh_rotator.classes.lazyload import Lazyload
+
+# How repos are distributed over the shards: by the first byte of the sha1 of the repo name
+# (256 shards at most, evenly filled) or by the owner of the repo (one shard per organization)
+SHARD_BY = ("hash", "owner")
+# The file name of every shard starts with this, so no shard (of an owner named "index") can take
+# the place of the index. Indexes written before say no prefix - their shards are renamed (and
+# the owner shards escaped, see shard_name) the next time all shards are written.
+SHARD_PREFIX = "shard-"
+
+
+def shard_name(repo=str, shard_by=str):
+    """The name of the shard holding the entry of a repo
+
+    Args:
+        repo (str): The fully qualified name (owner/repo) of the repo
+        shard_by (str): "hash" or "owner"
+    Returns:
+        shard (str): The name of the shard (see shard_file_name for its file)
+    """
+    if shard_by == "owner":
+        # Every byte of a character unsafe in a file name - "_" included - is escaped as _xx, so
+        # no two owners share a shard
+        return re.sub(
+            r"[^A-Za-z0-9.-]",
+            lambda match: "".join(f"_{byte:02x}" for byte in match.group().encode("utf-8")),
+            repo.split("/", 1)[0],
+        )
+
+    import hashlib
+
+    return hashlib.sha1(repo.encode("utf-8")).hexdigest()[:2]  # noqa: S324 - not for security
+
+
+def shard_file_name(shard=str, prefix=SHARD_PREFIX):
+    """The file name of a shard (named with the prefix its index says)"""
+    return f"{prefix}{shard}.json"
+
+
+class ManifestShards(Lazyload):
+    """Class used to keep the manifest of one configuration in many small files (shards)
+
+    The shards live in a shards directory next to where the manifest file would be. index.json
+    tells how the repos are sharded, in which format (see manifestformat) and with which file name
+    prefix, and lists the shards, each one a JSON list of manifest entries.
+    A rotation only rewrites the shard holding the rotated repo (and the index, if that shard is new).
+    The manifest is the entries of all shards, in the order of the index.
+    """
+
+    def __init__(self, directory=str):
+        super().__init__()
+
+        self.set("directory", directory)
+        self.set("index_file", os.path.join(directory, "index.json"))
+
+    def exists(self):
+        """Whether the manifest is stored in shards"""
+        return os.path.exists(self.get("index_file"))
+
+    def mtime(self):
+        """The last time a shard was written - replacing a file changes the mtime of its directory"""
+        return os.stat(self.get("directory")).st_mtime_ns
+
+    def index(self):
+        """Read the index: how the repos are sharded, the format of the shards and the shards
+
+        Returns:
+            index (dict): shard_by, format, prefix and shards
+        """
+        with open(self.get("index_file")) as f:
+            index = json.load(f)
+        # Indexes written before the compact format (or the shard prefix) existed don't say
+        index.setdefault("format", "pretty")
+        index.setdefault("prefix", "")
+        return index
+
+    def __shard_file(self, shard=str, prefix=SHARD_PREFIX):
+        return os.path.join(self.get("directory"), shard_file_name(shard, prefix))
+
+    def shard_file_of(self, repo=str):
+        """The file of the shard holding the entry of a repo (it may not exist)
+
+        Raises:
+            ValueError: If the shards are named as before SHARD_PREFIX - the shard of the repo
+                can't be told from its name then
+        """
+        index = self.index()
+        if index["prefix"] != SHARD_PREFIX:
+            raise ValueError(f"The shards in {self.get('directory')} are named the old way")
+        return self.__shard_file(shard_name(repo, index["shard_by"]))
+
+    def load(self, index=None):
+        """Read the entries of all shards
+
+        Args:
+            index (dict, optional): The index, if already read. Defaults to None (read it).
+        Returns:
+            entries (list): The manifest entries
+        Raises:
+            ValueError: If the index or a shard isn't valid JSON
+        """
+        if index is None:
+            index = self.index()
+        entries = []
+        for shard in index["shards"]:
+            with open(self.__shard_file(shard, index["prefix"])) as f:
+                entries.extend(json.load(f))
+        return entries
+
+    def save(self, entries=list, repos=None, shard_by=None, manifest_format=None):
+        """Write the shards holding the given repos - or all of them
+
+        When all shards are written, the shards no longer in the index (the *.json files other
+        than index.json) are removed afterwards. Shards named the old way (see SHARD_PREFIX) are
+        all written.
+
+        Args:
+            entries (list): All entries of the manifest
+            repos (iterable, optional): The repos that changed. Defaults to None (write all shards).
+            shard_by (str, optional): How to shard the manifest. Defaults to None (as the index
+                says, "hash" for new shards).
+            manifest_format (str, optional): The format of the shards (see manifestformat).
+                Defaults to None (as the index says, "pretty" for new shards).
+        Returns:
+            changed (bool): Whether any file was written
+        """
+        from gh_rotator.modules.fileio import write_if_changed
+        from gh_rotator.modules.manifestformat import dumps_entries
+
+        index = (
+            self.index()
+            if self.exists()
+            else {"shard_by": "hash", "format": "pretty", "prefix": SHARD_PREFIX}
+        )
+        shard_by = shard_by or index["shard_by"]
+        manifest_format = manifest_format or index["format"]
+        if index["prefix"] != SHARD_PREFIX:
+            repos = None
+
+        shards = {}
+        for entry in entries:
+            shards.setdefault(shard_name(entry["repo"], shard_by), []).append(entry)
+        dirty = shards if repos is None else {shard_name(repo, shard_by) for repo in repos}
+
+        changed = False
+        for shard in sorted(dirty):
+            content = dumps_entries(shards.get(shard, []), manifest_format)
+            changed |= write_if_changed(self.__shard_file(shard), content.encode("utf-8"))
+
+        # The index is written last, so a reader never finds it listing a shard that isn't there yet
+        index = {
+            "shard_by": shard_by,
+            "format": manifest_format,
+            "prefix": SHARD_PREFIX,
+            "shards": sorted(shards),
+        }
+        content = json.dumps(index, indent=4)
+        changed |= write_if_changed(self.get("index_file"), content.encode("utf-8"))
+
+        if repos is None:
+            # Only shards - not the index, nor the temp files of a concurrent write or other files
+            current = {os.path.basename(self.__shard_file(shard)) for shard in shards}
+            for file in os.listdir(self.get("directory")):
+                if file.endswith(".json") and file != "index.json" and file not in current:
+                    os.remove(os.path.join(self.get("directory"), file))
+        return changed
+
+    def remove(self):
+        """Remove the shards - the index first, so a reader never finds it listing a missing shard"""
+        import shutil
+
+        os.remove(self.get("index_file"))
+        shutil.rmtree(self.get("directory"))
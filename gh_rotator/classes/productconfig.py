@@ -1,33 +1,27 @@
 import json
 import os
 import re
-import subprocess
 import sys
 
+from gh_rotator import __version__
+from gh_rotator.classes.configmatcher import CACHE_FORMAT, ConfigMatcher
 from gh_rotator.classes.lazyload import Lazyload
+from gh_rotator.classes.repocontext import RepoContext
+from gh_rotator.modules.profiling import timed
 
 
 class ProductConfig(Lazyload):
     """Class used to load and represent the product config (defaults to config-rotator.json in the repo root)"""
 
-    def __init__(self, file=None):
+    def __init__(self, file=None, context=None, load=True):
         super().__init__()
 
-        # make sure we're in a git context, capture the git repo root
-        # and set the config_dir to the root of the git repo
-        try:
-            self.set(
-                "git_root",
-                subprocess.check_output(["git", "rev-parse", "--show-toplevel"])
-                .decode("utf-8")
-                .strip(),
-            )
-        except subprocess.CalledProcessError:
-            print(
-                "⛔️ Error: Not in a git repository. Please run this script from a git repository.",
-                file=sys.stderr,
-            )
-            sys.exit(1)
+        # make sure we're in a git context, capture the git repo root (or reuse the one
+        # resolved by the caller) and set the config_dir to the root of the git repo
+        if context is None:
+            context = RepoContext()
+        self.set("context", context)
+        self.set("git_root", context.get("git_root"))
 
         # Set the default config file
         if file is None:
@@ -59,16 +53,95 @@ class ProductConfig(Lazyload):
 
         self.set("config", None)
 
-        # Load the config file
-        self.__load_config()
+        # Load the config file - unless the caller only wants to find it (like gh rotator check)
+        if load:
+            self.__load_config()
 
+    @timed("config_load")
     def __load_config(self):
-        """Load the config file and set the config property"""
+        """Load the config file and set the config and matcher properties
+
+        In a repo with a git directory, the validated config and its matcher are cached in the
+        state directory, keyed by the content of the config file, the version of the rotator and
+        the cache format of the matcher. A run with an unchanged config loads them from the cache,
+        without validating and compiling the rules again. A cache that is stale, corrupt or unreadable is simply rebuilt.
+        """
+        cache_file = self.__cache_file()
+        if cache_file is None:
+            self.__parse_config()
+            return
+
+        import hashlib
+
         # Config file existence was already checked in __init__
+        with open(self.get("config_file"), "rb") as f:
+            content = f.read()
+        key = hashlib.sha256(f"{__version__}\0{CACHE_FORMAT}\0".encode("utf-8") + content).hexdigest()
+
+        if not self.__read_cache(cache_file, key):
+            self.__parse_config(content)
+            self.__write_cache(cache_file, key)
+
+    def __cache_file(self):
+        """The file caching the compiled config (None if the repo has no git directory to keep it in)"""
+        context = self.get("context")
+        if context.get("git_dir") is None:
+            return None
+
+        import hashlib
+
+        # One cache per config file, so alternating between config files doesn't thrash it
+        name = hashlib.sha256(self.get("config_file").encode("utf-8")).hexdigest()[:12]
+        return os.path.join(context.get("state_dir"), "cache", f"config-{name}.json")
+
+    def __read_cache(self, cache_file=str, key=str):
+        """Set the config and matcher properties from the cache, if it holds them for the key
+
+        Returns:
+            hit (bool): Whether the cache was valid for the key
+        """
+        try:
+            with open(cache_file, "rb") as f:
+                cached = json.load(f)
+            if cached["key"] != key or not isinstance(cached["config"], dict):
+                return False
+            matcher = ConfigMatcher.from_cache(cached["matcher"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # Missing, unreadable or corrupt - it is rebuilt from the config file
+            return False
+
+        self.set("config", cached["config"])
+        self.set("matcher", matcher)
+        return True
+
+    def __write_cache(self, cache_file=str, key=str):
+        """Save the config and matcher properties to the cache - on a best effort basis"""
+        from gh_rotator.modules.fileio import write_if_changed
+
+        cached = {
+            "key": key,
+            "config": self.get("config"),
+            "matcher": self.get("matcher").to_cache(),
+        }
+        try:
+            write_if_changed(cache_file, json.dumps(cached, separators=(",", ":")).encode("utf-8"))
+        except OSError:
+            # A read-only git directory only means the next run builds the matcher again
+            pass
+
+    def __parse_config(self, content=None):
+        """Parse and validate the config and set the config and matcher properties
+
+        Args:
+            content (bytes, optional): The content of the config file. Defaults to None (read the file).
+        """
         # Just load the file and handle JSON errors
         try:
-            with open(self.get("config_file")) as f:
-                self.set("config", json.load(f))
+            if content is None:
+                with open(self.get("config_file")) as f:
+                    self.set("config", json.load(f))
+            else:
+                self.set("config", json.loads(content))
         except json.JSONDecodeError:
             print(
                 f"Error: Config file {self.get('config_file')} is not a valid JSON file",
@@ -76,6 +149,94 @@ class ProductConfig(Lazyload):
             )
             sys.exit(1)
 
+        # Compile the rules once, so lookups don't have to walk and recompile the whole config
+        try:
+            self.set("matcher", ConfigMatcher(self.get("config")))
+        except (AttributeError, KeyError, TypeError, re.error) as e:
+            # Only needed when the config is broken, to tell exactly which rule is
+            from gh_rotator.modules.configcheck import describe, validate
+
+            errors = [found for found in validate(self.get("config")) if found["level"] == "error"]
+            print(
+                f"⛔️ Error: Config file {self.get('config_file')} contains an invalid rule: {
+                    describe(errors[0]) if errors else str(e)
+                } (run gh rotator check for all problems)",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    def find_config_name(self, repo=str, event_name=str, event_type=str):
+        """Look up the configuration name for the given repo, event_name and event_type
+
+        Unlike get_config_name, a miss is not an error, so this can be used to classify many events
+
+        Args:
+            repo (str): The fully qualified name (owner/repo) of the repo to look up
+            event_name (str): The event name that triggered the run (branch or tag name)
+            event_type (str): The event type that triggered the run (branch|tag)
+        Returns:
+            configuration (str): The configuration name that was found (None if nothing matches)
+        """
+        return self.get("matcher").match(repo, event_name, event_type)
+
+    def find_config_names(self, repo=str, event_name=str, event_type=str):
+        """Look up every configuration name with a rule matching the repo, event_name and event_type
+
+        Like find_config_name, a miss is not an error
+
+        Returns:
+            configurations (list): The configuration names that were found, in file order (empty if nothing matches)
+        """
+        return self.get("matcher").match_all(repo, event_name, event_type)
+
+    @timed("match")
+    def get_config_names(self, repo=str, event_name=str, event_type=str, verbose=False):
+        """Look up every configuration name with a rule matching the repo, event_name and event_type
+
+        Args:
+            repo (str): The fully qualified name (owner/repo) of the repo to look up
+            event_name (str): The event name that triggered the run (branch or tag name)
+            event_type (str): The event type that triggered the run (branch|tag)
+            verbose (bool, optional): Whether to print verbose output. Defaults to False.
+        Returns:
+            configurations (list): The configuration names that were found, in file order
+        """
+        found_configs = self.find_config_names(repo, event_name, event_type)
+
+        if found_configs and verbose:
+            print(
+                f"Found configurations {', '.join(repr(c) for c in found_configs)} for repo '{repo}', event_type '{event_type}', and event_name '{event_name}'."
+            )
+
+        if not found_configs:
+            print(
+                f"⛔️ Error: No matching configuration found for repo '{repo}', event_type '{event_type}', and event_name '{event_name}'.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        return found_configs
+
+    def resolve_many(self, events):
+        """Look up the configuration name for each event in a stream of events
+
+        Like find_config_name, a miss is not an error. The events are consumed and the results
+        yielded one at a time, so a stream of any length is classified in constant memory.
+
+        Args:
+            events (iterable): Dicts with the repo, event_name and event_type of each event
+                (None for an event that couldn't be read is passed through)
+        Yields:
+            result (tuple): The event and the configuration name it resolves to (None if nothing matches)
+        """
+        match = self.get("matcher").match
+        for event in events:
+            if event is None:
+                yield None, None
+                continue
+            yield event, match(event["repo"], event["event_name"], event["event_type"])
+
+    @timed("match")
     def get_config_name(self, repo=str, event_name=str, event_type=str, verbose=False):
         """Look up the configuration name for the given repo, event_name and event_type
 
@@ -87,23 +248,12 @@ class ProductConfig(Lazyload):
         Returns:
             configuration (str): The configuration name that was found
         """
-        found_config = None
-
-        for configuration, repos in self.get("config").items():
-            for repo_config in repos:
-                if (
-                    re.fullmatch(repo_config["repo"], repo)
-                    and repo_config["ref_type"] == event_type
-                    and re.fullmatch(repo_config["ref_name"], event_name)
-                ):
-                    found_config = configuration
-                    if verbose:
-                        print(
-                            f"Found configuration '{configuration}' for repo '{repo}', event_type '{event_type}', and event_name '{event_name}'."
-                        )
-                    break
-            if found_config:
-                break
+        found_config = self.find_config_name(repo, event_name, event_type)
+
+        if found_config and verbose:
+            print(
+                f"Found configuration '{found_config}' for repo '{repo}', event_type '{event_type}', and event_name '{event_name}'."
+            )
 
         if not found_config:
             print(
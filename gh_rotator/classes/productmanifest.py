@@ -1,43 +1,54 @@
-import datetime
+import contextlib
 import json
 import os
-import subprocess
 import sys
 import time
 
 from gh_rotator.classes.productconfig import ProductConfig
 from gh_rotator.classes.lazyload import Lazyload
+from gh_rotator.classes.manifesthistory import ManifestHistory, parse_point
+from gh_rotator.classes.manifestshards import SHARD_PREFIX, ManifestShards, shard_file_name
+from gh_rotator.modules.manifestformat import DETECT_BYTES, detect_format
+from gh_rotator.modules.profiling import phase, timed
+
+# Environment variable with the default number of seconds to wait for a manifest lock
+LOCK_TIMEOUT_ENV = "GH_ROTATOR_LOCK_TIMEOUT"
+DEFAULT_LOCK_TIMEOUT = 60.0
+# How often a commit (see commit) is rebuilt on top of a branch that moved on before giving up
+DEFAULT_COMMIT_RETRIES = 5
+# A manifest written this shortly before its stat was taken is "racy" (as in git): written again
+# within the resolution of its mtime (up to 2s on some file systems), its stat wouldn't change
+RACY_NS = 2_000_000_000
 
 
 class ProductManifest(Lazyload):
     """Class used to load and represent the product config (defaults to product-rotator.json in the repo root)"""
 
-    def __init__(self, config=ProductConfig, directory=None):
+    @timed("manifest_init")
+    def __init__(self, config=ProductConfig, directory=None, context=None, lock_timeout=None):
         super().__init__()
 
         self.set("config", config)
 
-        # make sure we're in a git context, capture the git repo root
-        # and set the config_dir to the root of the git repo
-        try:
-            self.set(
-                "git_root",
-                subprocess.check_output(["git", "rev-parse", "--show-toplevel"])
-                .decode("utf-8")
-                .strip(),
-            )
-        except subprocess.CalledProcessError:
-            print(
-                "⛔️ Error: Not in a git repository. Please run this script from a git repository.",
-                file=sys.stderr,
-            )
-            sys.exit(1)
+        # Share the git repo root resolved by the config, unless given another context
+        if context is None:
+            context = config.get("context")
+        self.set("context", context)
+        self.set("git_root", context.get("git_root"))
+
+        if lock_timeout is None:
+            lock_timeout = float(os.environ.get(LOCK_TIMEOUT_ENV, DEFAULT_LOCK_TIMEOUT))
+        self.set("lock_timeout", lock_timeout)
+        # Wraps the part of save done under the lock - a caller that interrupts a run (see
+        # multiproduct) sets one that holds the interruption off until the manifest is written
+        self.set("write_shield", contextlib.nullcontext)
 
         if directory is None:
             directory = "configurations"
         self.set("configuration_dir", os.path.join(self.get("git_root"), directory))
 
         # for each configuration, in the config, add the filepath to the corresponting manifest
+        # The manifest itself is only read and parsed the first time it is accessed
         for configuration in config.get("config").keys():
             file = os.path.join(
                 self.get("configuration_dir"),
@@ -45,47 +56,216 @@ class ProductManifest(Lazyload):
                 f"config-{configuration}-manifest.json",
             )
             self.set(f"{configuration}_file", file)
+            self.set(f"{configuration}_pending", [])
+            self.set(f"{configuration}_applied", [])
 
-            # Load the config file
-            self.__load_manifest(configuration)
-
-    def __save_manifest(self, configuration=str):
-        """Save the manifest of the corresponding configuration to disk"""
-
-        file_path = self.get(f"{configuration}_file")
-
-        try:
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(self.get(f"{configuration}_file"), "w") as f:
-                json.dump(self.get(f"{configuration}_manifest"), f, indent=4)
-        except Exception as e:
-            print(f"⛔️ Error: Failed to save manifest for {configuration}: {e!s}", file=sys.stderr)
-            sys.exit(1)
+            self.set_loader(
+                f"{configuration}_manifest",
+                lambda configuration=configuration: self.__load_manifest(configuration),
+            )
+            self.set_loader(
+                f"{configuration}_index",
+                lambda configuration=configuration: self.__index_manifest(configuration),
+            )
+            self.set(
+                f"{configuration}_history",
+                ManifestHistory(os.path.join(os.path.dirname(file), "history")),
+            )
+            self.set(
+                f"{configuration}_shards",
+                ManifestShards(os.path.join(os.path.dirname(file), "shards")),
+            )
 
+    @timed("manifest_load")
     def __load_manifest(self, configuration=str):
-        """Load the maifest from manifest files or configuration"""
+        """Load the maifest from manifest files or configuration
 
-        # If no manifest file exists, create an empty configuration
-        if not os.path.exists(self.get(f"{configuration}_file")):
-            # Create an empty manifest with just the configuration key and an empty array
-            manifest_data = {configuration: []}
-            self.set(f"{configuration}_manifest", manifest_data)
+        The manifest is read from its shards if it is sharded (see ManifestShards), from the
+        manifest file otherwise.
 
-        else:
-            # The manifest already exist - Load it file
+        Returns:
+            manifest (dict): The manifest data, keyed by the configuration name
+        """
+        # Nothing is applied to the manifest as read from disk yet
+        self.set(f"{configuration}_applied", [])
+        shards = self.get(f"{configuration}_shards")
+        if shards.exists():
             try:
-                with open(self.get(f"{configuration}_file")) as f:
-                    self.set(f"{configuration}_manifest", json.load(f))
-            except json.JSONDecodeError:
+                self.__track(configuration)
+                index = shards.index()
+                self.set(f"{configuration}_format", index["format"])
+                return {configuration: shards.load(index)}
+            except ValueError:
                 print(
-                    f"⛔️ Error: Manifest file {
-                        self.get(f'{configuration}_file')
-                    } is not a valid JSON file",
+                    f"⛔️ Error: Manifest shards in {shards.get('directory')} are not valid JSON files",
                     file=sys.stderr,
                 )
                 sys.exit(1)
 
-    def rotate(self, repo=str, event_name=str, event_type=str, sha=str, verbose=False):
+        # If no manifest file exists, create an empty configuration
+        if not os.path.exists(self.get(f"{configuration}_file")):
+            # Create an empty manifest with just the configuration key and an empty array
+            self.__track(configuration)
+            self.set(f"{configuration}_format", "pretty")
+            return {configuration: []}
+
+        # The manifest already exist - Load it file
+        try:
+            with open(self.get(f"{configuration}_file"), "rb") as f:
+                self.__track(configuration, f.fileno())
+                self.set(f"{configuration}_format", detect_format(f.read(DETECT_BYTES)))
+                f.seek(0)
+                return json.load(f)
+        except json.JSONDecodeError:
+            print(
+                f"⛔️ Error: Manifest file {
+                    self.get(f'{configuration}_file')
+                } is not a valid JSON file",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    def __stat(self, configuration=str, fd=None):
+        """The layout of the manifest on disk and its stat, which changes whenever it is written
+
+        Args:
+            configuration (str): The configuration of the manifest
+            fd (int, optional): The manifest file, if open. Defaults to None (stat the path).
+        Returns:
+            stat (tuple): ("sharded", mtime of the shards directory in ns) or ("flat", mtime in ns,
+                size, inode of the file) - None if there is no manifest yet
+        """
+        shards = self.get(f"{configuration}_shards")
+        if fd is None and shards.exists():
+            return "sharded", shards.mtime()
+        try:
+            st = os.stat(self.get(f"{configuration}_file") if fd is None else fd)
+        except FileNotFoundError:
+            return None
+        return "flat", st.st_mtime_ns, st.st_size, st.st_ino
+
+    def __track(self, configuration=str, fd=None):
+        """Remember the stat of the manifest as it is read or written (see __unchanged)"""
+        self.set(f"{configuration}_stat_time", time.time_ns())
+        self.set(f"{configuration}_stat", self.__stat(configuration, fd))
+
+    def __unchanged(self, configuration=str):
+        """Whether the manifest on disk is still the one last read or written by this instance
+
+        Returns:
+            unchanged (bool): Whether its stat is the same - and it wasn't racy when it was taken
+        """
+        stat = self.get(f"{configuration}_stat")
+        if stat is None or self.__stat(configuration) != stat:
+            return False
+        return self.get(f"{configuration}_stat_time") - stat[1] > RACY_NS
+
+    def __applied_to_disk(self, configuration=str):
+        """Whether the loaded manifest is the one on disk with just the pending updates applied"""
+        pending = self.get(f"{configuration}_pending")
+        applied = self.get(f"{configuration}_applied")
+        return (
+            len(applied) == len(pending)
+            and all(update is entry for (update, _result), entry in zip(applied, pending))
+            and self.__unchanged(configuration)
+        )
+
+    def __index_manifest(self, configuration=str):
+        """Index the entries of the manifest by repo, so lookups don't have to scan the list
+
+        The index holds the very same entry dicts as the manifest, so updating an entry in place
+        keeps both in sync - only appended entries must be added to the index explicitly.
+
+        Returns:
+            index (dict): The manifest entries keyed by repo (the first entry wins for duplicates)
+        """
+        index = {}
+        for entry in self.get(f"{configuration}_manifest").get(configuration, []):
+            index.setdefault(entry["repo"], entry)
+        return index
+
+    def __apply(self, configuration=str, update=dict):
+        """Apply (upsert) an entry to the loaded manifest of the given configuration
+
+        Args:
+            configuration (str): The configuration to update the manifest for
+            update (dict): The complete entry (repo, version, ref_type, ref_name, last_update)
+        Returns:
+            result (str): 'created', 'added', 'updated' or 'unchanged'
+        """
+        manifest = self.get(f"{configuration}_manifest")
+        repo = update["repo"]
+
+        # If the configuration key doesn't exist, create it
+        if configuration not in manifest:
+            manifest[configuration] = [dict(update)]
+            self.set(f"{configuration}_index", {repo: manifest[configuration][0]})
+            return "created"
+
+        # If repository not found, add it to the manifest
+        entry = self.get(f"{configuration}_index").get(repo)
+        if entry is None:
+            entry = dict(update)
+            manifest[configuration].append(entry)
+            self.get(f"{configuration}_index")[repo] = entry
+            return "added"
+
+        # Nothing to rotate - keep the entry (and its last_update) as it is
+        if all(entry.get(key) == update[key] for key in ("version", "ref_type", "ref_name")):
+            return "unchanged"
+
+        entry.update((key, value) for key, value in update.items() if key != "repo")
+        return "updated"
+
+    def __rotate_into(
+        self, configuration=str, repo=str, event_name=str, event_type=str, sha=str, verbose=False
+    ):
+        """Rotate the repo in the loaded manifest of the given configuration (see rotate)"""
+        # Only needed when rotating, so imported here to keep it off the startup of lookups
+        from gh_rotator.modules.manifestformat import timestamp
+
+        try:
+            # The timestamp is written in the format of the manifest, known once it is loaded
+            self.get(f"{configuration}_manifest")
+            update = {
+                "repo": repo,
+                "version": sha,
+                "ref_type": event_type,
+                "ref_name": event_name,
+                "last_update": timestamp(self.get(f"{configuration}_format")),
+            }
+            result = self.__stage(configuration, update)
+        except AssertionError:
+            print(f"⛔️ Error: The configuration '{configuration}' is not valid.", file=sys.stderr)
+            sys.exit(1)
+
+        if verbose and result == "updated":
+            print(
+                f"Rotating {repo} in {configuration} manifest with version {sha} triggered by event: {event_type}"
+            )
+        elif verbose and result == "added":
+            print(
+                f"Adding {repo} to {configuration} manifest with version {sha} triggered by event: {event_type}"
+            )
+        elif verbose and result == "created":
+            print(f"Created {configuration} configuration and added {repo} with version {sha}")
+
+    def __stage(self, configuration=str, update=dict):
+        """Apply an update to the loaded manifest and keep it pending until the manifest is saved
+
+        The update is remembered, so save() can re-apply it on top of the latest manifest on disk,
+        along with what it did to the manifest as loaded - so save() needn't, if that is unchanged.
+
+        Returns:
+            result (str): 'created', 'added', 'updated' or 'unchanged' (see __apply)
+        """
+        result = self.__apply(configuration, update)
+        self.get(f"{configuration}_pending").append(update)
+        self.get(f"{configuration}_applied").append((update, result))
+        return result
+
+    @timed("rotate")
+    def rotate(self, repo=str, event_name=str, event_type=str, sha=str, verbose=False, save=True):
         """Rotate the manifest for the given configuration
 
         Args:
@@ -94,102 +274,654 @@ class ProductManifest(Lazyload):
             event_type (str): The event type that triggered the run (branch|tag)
             sha (str): The sha to set for the repo in the manifest
             verbose (bool, optional): Whether to print verbose output. Defaults to False.
+            save (bool, optional): Whether to write the manifest to disk right away. Defaults to True.
+                Pass False to apply several rotations in memory and write them once with save()
         Returns:
             configuration (str): The configuration name that was rotated (None if failed)
         """
-        # The constructor already loaded the manifests, so were good to assume it's healthy
+        # The manifest is loaded (on first access) by get(), so were good to assume it's healthy
 
         configuration = self.get("config").get_config_name(repo, event_name, event_type, verbose)
+        self.__rotate_into(configuration, repo, event_name, event_type, sha, verbose)
 
-        # Create entry data function to avoid code duplication
-        def create_entry():
-            now = datetime.datetime.now().strftime(f"%Y-%m-%d (%H:%M:%S) [{time.strftime('%Z')}]")
-            return {
-                "repo": repo,
-                "version": sha,
-                "ref_type": event_type,
-                "ref_name": event_name,
-                "last_update": now,
-            }
+        if save:
+            self.save(configuration, verbose)
+
+        return configuration
+
+    @timed("rotate")
+    def rotate_all(
+        self, repo=str, event_name=str, event_type=str, sha=str, verbose=False, save=True
+    ):
+        """Rotate the manifests of every configuration matching the event - not just the first
+
+        Args:
+            repo (str): The fully qualified name (owner/repo) of the repo that fired the event
+            event_name (str): The event name that triggered the run (branch or tag name)
+            event_type (str): The event type that triggered the run (branch|tag)
+            sha (str): The sha to set for the repo in the manifests
+            verbose (bool, optional): Whether to print verbose output. Defaults to False.
+            save (bool, optional): Whether to write the manifests to disk right away. Defaults to True.
+        Returns:
+            changed (dict): For each configuration rotated, whether its manifest file was written
+                (always False when not saved)
+        """
+        configurations = self.get("config").get_config_names(repo, event_name, event_type, verbose)
+        for configuration in configurations:
+            self.__rotate_into(configuration, repo, event_name, event_type, sha, verbose)
+
+        return {
+            configuration: save and self.save(configuration, verbose)
+            for configuration in configurations
+        }
+
+    def __promotions(self, source=str, target=str, repos=None):
+        """The entries of the source manifest to promote, checked against the rules of the target
+
+        Returns:
+            updates (list): The entries to apply to the target manifest, without last_update
+            problems (list): Why repos can't be promoted - nothing is promoted if there are any
+        """
+        index = self.get(f"{source}_index")
+        config = self.get("config")
+        updates, problems = [], []
+        for repo in index if repos is None else repos:
+            entry = index.get(repo)
+            if entry is None:
+                problems.append(f"Repository {repo} not found in configuration {source}")
+                continue
+            if entry.get("version") is None:
+                problems.append(f"The repo '{repo}' is not yet manifested in the '{source}' configuration")
+                continue
+            ref = f"{entry['ref_type']}:{entry['ref_name']}"
+            if target not in config.find_config_names(repo, entry["ref_name"], entry["ref_type"]):
+                problems.append(f"{repo} at '{ref}' doesn't match any rule of configuration {target}")
+                continue
+            updates.append({key: entry[key] for key in ("repo", "version", "ref_type", "ref_name")})
+        return updates, problems
+
+    @timed("promote")
+    def promote(self, source=str, target=str, repos=None, verbose=False, save=True):
+        """Copy the versions of repos from the manifest of one configuration to another
+
+        Every entry is checked against the rules of the target configuration first - the version,
+        ref_type and ref_name are only copied if all of them can be promoted. The target manifest
+        is then written once (see save), with the same last_update for all entries that changed.
+
+        Args:
+            source (str): The configuration to promote the versions from
+            target (str): The configuration to promote them to
+            repos (list, optional): The repos to promote. Defaults to None (all repos in the source manifest).
+            verbose (bool, optional): Whether to print verbose output. Defaults to False.
+            save (bool, optional): Whether to write the target manifest. Defaults to True.
+                Pass False to see what would be promoted - the target manifest is then read again
+                from disk next time, as if nothing was promoted (or rotated before without saving).
+        Returns:
+            promoted (dict): For each repo, 'added', 'updated' or 'unchanged' in the target manifest
+                (Exit with error if any repo can't be promoted)
+        """
+        from gh_rotator.modules.manifestformat import timestamp
+
+        updates, problems = self.__promotions(source, target, repos)
+        if problems:
+            for problem in problems:
+                print(f"⛔️ Error: {problem}", file=sys.stderr)
+            print(f"⛔️ Error: Nothing promoted from {source} to {target}", file=sys.stderr)
+            sys.exit(1)
+
+        # The timestamp is written in the format of the target manifest, known once it is loaded
+        self.get(f"{target}_manifest")
+        now = timestamp(self.get(f"{target}_format"))
+        promoted = {}
+        for update in updates:
+            update["last_update"] = now
+            promoted[update["repo"]] = self.__stage(target, update)
+            if verbose and promoted[update["repo"]] != "unchanged":
+                print(f"Promoting {update['repo']} from {source} to {target} with version {update['version']}")
+
+        if save:
+            self.save(target, verbose)
+        else:
+            self.get(f"{target}_pending").clear()
+            self.get(f"{target}_applied").clear()
+            self.reset(f"{target}_manifest")
+            self.reset(f"{target}_index")
+        return promoted
+
+    @timed("save")
+    def save(self, configuration=str, verbose=False):
+        """Write the (rotated) manifest of the given configuration back to its file
+
+        The manifest file is locked while it is written. If there are rotations pending, the
+        manifest is re-read under the lock and they are re-applied on top of it, so concurrent
+        runs rotating the same manifest don't overwrite each other's updates. The manifest isn't
+        read again when its stat shows that it wasn't written since it was loaded.
+
+        The manifest is serialized once and the file is only replaced - atomically - when the
+        content differs from what is already on disk. The rotations that changed the manifest are
+        appended to its history. Once the lock is taken, this all runs within the write_shield.
+
+        Args:
+            configuration (str): The configuration to save the manifest for
+            verbose (bool, optional): Whether to print verbose output. Defaults to False.
+        Returns:
+            changed (bool): Whether the manifest file was written
+        """
+        # Only needed when saving, so imported here to keep them off the startup of lookups
+        from gh_rotator.modules.fileio import file_lock, write_if_changed
+        from gh_rotator.modules.manifestformat import dumps_manifest
+
+        manifest_file = self.get(f"{configuration}_file")
+        shards = self.get(f"{configuration}_shards")
 
-        # Check if the repo exists in the manifest
-        found = False
         try:
-            # First, try to find and update the repository if it exists
-            for entry in self.get(f"{configuration}_manifest")[configuration]:
-                if entry["repo"] == repo:
-                    # Update the entry
-                    now = datetime.datetime.now().strftime(
-                        f"%Y-%m-%d (%H:%M:%S) [{time.strftime('%Z')}]"
-                    )
-                    entry["version"] = sha
-                    entry["ref_type"] = event_type
-                    entry["ref_name"] = event_name
-                    entry["last_update"] = now
-                    if verbose:
-                        print(
-                            f"Rotating {repo} in {configuration} manifest with version {sha} triggered by event: {event_type}"
-                        )
-                    found = True
-                    break
+            with (
+                file_lock(self.__lock_file(configuration), timeout=self.get("lock_timeout")),
+                self.get("write_shield")(),
+            ):
+                history = self.get(f"{configuration}_history")
+                now = time.time()
+                pending = self.get(f"{configuration}_pending")
+                applied = self.get(f"{configuration}_applied")
+                events = []
+                if pending and self.__applied_to_disk(configuration) and history.exists():
+                    # The rotations are applied to the manifest as it still is on disk
+                    events = [update for update, result in applied if result != "unchanged"]
+                elif pending:
+                    self.reset(f"{configuration}_manifest")
+                    self.reset(f"{configuration}_index")
+                    entries = self.get(f"{configuration}_manifest").get(configuration, [])
+                    # The history starts from the manifest as it is before its first rotation
+                    before = None if history.exists() else [dict(entry) for entry in entries]
+                    for update in pending:
+                        if self.__apply(configuration, update) != "unchanged":
+                            events.append(update)
+                    if events and before is not None:
+                        history.start(before, now)
+
+                # The layout is checked under the lock, as a migration may have changed it
+                sharded = shards.exists()
+                if sharded:
+                    entries = self.get(f"{configuration}_manifest").get(configuration, [])
+                    with phase("write"):
+                        changed = shards.save(entries, repos=[update["repo"] for update in events])
+                else:
+                    with phase("serialize"):
+                        content = dumps_manifest(
+                            self.get(f"{configuration}_manifest"),
+                            self.get(f"{configuration}_format"),
+                        ).encode("utf-8")
+                    with phase("write"):
+                        changed = write_if_changed(manifest_file, content)
+                self.__track(configuration)
+                pending.clear()
+                applied.clear()
 
-            # If repository not found, add it to the manifest
-            if not found:
-                new_entry = create_entry()
-                self.get(f"{configuration}_manifest")[configuration].append(new_entry)
-                if verbose:
-                    print(
-                        f"Adding {repo} to {configuration} manifest with version {sha} triggered by event: {event_type}"
+                if events:
+                    history.append(
+                        events, self.get(f"{configuration}_manifest").get(configuration, []), now
                     )
+        except TimeoutError:
+            print(
+                f"⛔️ Error: Timed out after {self.get('lock_timeout')}s waiting for the lock on the {configuration} manifest",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        except OSError as e:
+            print(f"⛔️ Error: Failed to save manifest for {configuration}: {e!s}", file=sys.stderr)
+            sys.exit(1)
 
-        except AssertionError:
-            print(f"⛔️ Error: The configuration '{configuration}' is not valid.", file=sys.stderr)
+        if changed and verbose:
+            if sharded:
+                print(
+                    f"The shards in '{shards.get('directory')}' are updated, but they are not checked in yet."
+                )
+            else:
+                print(
+                    f"The file '{manifest_file}' is updated with content show below, but it is not checked in yet."
+                )
+                print(content.decode("utf-8"))
+
+        return changed
+
+    def __lock_file(self, configuration=str):
+        """The file locked while the manifest of the given configuration is written"""
+        import hashlib
+
+        manifest_file = self.get(f"{configuration}_file")
+        return os.path.join(
+            self.get("context").get("state_dir"),
+            "locks",
+            f"{configuration}-{hashlib.sha1(manifest_file.encode('utf-8')).hexdigest()[:12]}.lock",
+        )
+
+    def __rebase(self, configuration=str, content=None):
+        """Re-apply the pending rotations of the given configuration on top of a manifest file
+
+        Args:
+            configuration (str): The configuration to rebase the rotations of
+            content (bytes): The manifest file to apply them to (None if there is none)
+        Returns:
+            content (bytes): The manifest file with the rotations applied (None if they change nothing)
+        """
+        from gh_rotator.modules.manifestformat import dumps_manifest
+
+        try:
+            manifest = {configuration: []} if content is None else json.loads(content)
+        except ValueError:
+            print(
+                f"⛔️ Error: The {configuration} manifest on the branch is not a valid JSON file",
+                file=sys.stderr,
+            )
             sys.exit(1)
-        except KeyError:
-            # If the configuration key doesn't exist, create it
-            new_entry = create_entry()
-            self.get(f"{configuration}_manifest")[configuration] = [new_entry]
-            if verbose:
-                print(f"Created {configuration} configuration and added {repo} with version {sha}")
+        manifest_format = "pretty" if content is None else detect_format(content[:DETECT_BYTES])
+        self.set(f"{configuration}_manifest", manifest)
+        self.set(f"{configuration}_format", manifest_format)
+        self.reset(f"{configuration}_index")
 
-        # Write the updated manifest back to the file
-        # Check if the file exists and run __save_manifest if it doesn't
-        if not os.path.exists(self.get(f"{configuration}_file")):
-            self.__save_manifest(configuration)
+        results = [self.__apply(configuration, update) for update in self.get(f"{configuration}_pending")]
+        if all(result == "unchanged" for result in results):
+            return None
+        return dumps_manifest(manifest, manifest_format).encode("utf-8")
 
-        with open(self.get(f"{configuration}_file"), "w") as f:
-            json.dump(self.get(f"{configuration}_manifest"), f, indent=4)
-            if verbose:
-                manifest_file = self.get(f"{configuration}_file")
+    def __commit_once(self, configurations=list, branch=str, remote=None, message=str):
+        """Commit the rotations on top of the tip of the branch (see commit)
+
+        Returns:
+            commit (str): The sha of the commit (None if the rotations change nothing)
+        Raises:
+            BranchMovedError: If the branch moved on while the commit was written
+        """
+        from gh_rotator.modules import gitcommit
+
+        git_root = self.get("git_root")
+        ref = gitcommit.fetch(git_root, remote, branch) if remote else f"refs/heads/{branch}"
+        parent = gitcommit.resolve(git_root, ref)
+        if parent is None:
+            raise gitcommit.GitError(f"There is no branch '{branch}'")
+
+        files = {}
+        for configuration in configurations:
+            path = os.path.relpath(self.get(f"{configuration}_file"), git_root).replace(os.sep, "/")
+            content = self.__rebase(configuration, gitcommit.read_file(git_root, parent, path))
+            if content is not None:
+                files[path] = content
+        if not files:
+            return None
+
+        tree = gitcommit.write_tree(git_root, parent, files)
+        commit = gitcommit.commit_tree(git_root, tree, parent, message)
+        if remote:
+            gitcommit.push(git_root, remote, commit, branch)
+        else:
+            gitcommit.update_branch(git_root, branch, commit, parent)
+        return commit
+
+    def __commit_message(self, configurations=list):
+        """The message of the commit of the pending rotations of the given configurations"""
+        updates = [
+            (configuration, update)
+            for configuration in configurations
+            for update in self.get(f"{configuration}_pending")
+        ]
+        if len(updates) == 1:
+            configuration, update = updates[0]
+            return f"Update {configuration} manifest ('{update['ref_type']}:{update['ref_name']}') for {update['repo']}\n"
+        lines = [f"Update {', '.join(configurations)} manifests with {len(updates)} rotations", ""]
+        lines += [
+            f"- {configuration}: {update['repo']} ('{update['ref_type']}:{update['ref_name']}') at {update['version']}"
+            for configuration, update in updates
+        ]
+        return "\n".join(lines) + "\n"
+
+    @timed("commit")
+    def commit(
+        self,
+        configurations=list,
+        branch=None,
+        remote=None,
+        retries=DEFAULT_COMMIT_RETRIES,
+        verbose=False,
+    ):
+        """Commit the pending rotations of the given configurations straight to a branch
+
+        Instead of writing the manifest files in the work tree (see save), the manifests are read
+        from the tip of the branch, the rotations are re-applied on top of them, and the result is
+        committed with git plumbing (see gitcommit) - the index and work tree are left alone.
+        With a remote, the branch is fetched from it and the commit pushed to it. When the branch
+        moved on in the meantime, the commit is rebuilt on top of its new tip and tried again.
+
+        The history of the manifests is not kept in this mode, and sharded manifests can't be committed.
+
+        Args:
+            configurations (list): The configurations to commit the rotations of
+            branch (str, optional): The branch to commit to. Defaults to None (the branch checked out).
+            remote (str, optional): The remote to fetch the branch from and push the commit to.
+                Defaults to None (move the local branch - which can't be the one checked out,
+                unless the repo is bare).
+            retries (int, optional): How often to rebuild the commit on a branch that moved on.
+                Defaults to DEFAULT_COMMIT_RETRIES.
+            verbose (bool, optional): Whether to print verbose output. Defaults to False.
+        Returns:
+            commit (str): The sha of the commit (None if the rotations change nothing on the branch)
+        """
+        from gh_rotator.modules import gitcommit
+
+        for configuration in configurations:
+            if self.get(f"{configuration}_shards").exists():
                 print(
-                    f"The file '{manifest_file}' is updated with content show below, but it is not checked in yet."
+                    f"⛔️ Error: The {configuration} manifest is sharded - only flat manifests can be committed",
+                    file=sys.stderr,
                 )
-                print(json.dumps(self.get(f"{configuration}_manifest"), indent=4))
+                sys.exit(1)
 
-        return configuration
+        message = self.__commit_message(configurations)
+        target = branch or "the branch"
+        try:
+            checked_out = gitcommit.current_branch(self.get("git_root"))
+            branch = branch or checked_out
+            if branch is None:
+                raise gitcommit.GitError("HEAD is detached - name the branch to commit to")
+            target = f"{remote}/{branch}" if remote else branch
+            # Moving the checked out branch leaves its index and work tree behind, and the next
+            # 'git add -A && git commit' would commit the rotations undone
+            if not remote and branch == checked_out and not gitcommit.is_bare(self.get("git_root")):
+                raise gitcommit.GitError(
+                    f"'{branch}' is checked out - name another --branch, or a --remote to push to"
+                )
+            for attempt in range(retries + 1):
+                try:
+                    commit = self.__commit_once(configurations, branch, remote, message)
+                    break
+                except gitcommit.BranchMovedError:
+                    if attempt == retries:
+                        raise gitcommit.GitError(
+                            f"{target} moved on {retries + 1} times while committing - giving up"
+                        ) from None
+        except gitcommit.GitError as e:
+            print(f"⛔️ Error: Failed to commit the manifests to {target}: {e!s}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            # The manifests rebased on the branch are not the ones in the work tree
+            for configuration in configurations:
+                self.reset(f"{configuration}_manifest")
+                self.reset(f"{configuration}_index")
+
+        for configuration in configurations:
+            self.get(f"{configuration}_pending").clear()
+            self.get(f"{configuration}_applied").clear()
+
+        if verbose and commit is None:
+            print(f"The manifests on {target} are up to date, nothing to commit.")
+        elif verbose:
+            print(f"The manifests are committed to {target} as {commit}.")
+        return commit
+
+    @timed("migrate")
+    def migrate(
+        self, configuration=str, layout=None, shard_by=None, manifest_format=None, verbose=False
+    ):
+        """Move the manifest of the given configuration to another layout or format on disk
+
+        The manifest is re-read under its lock, written in the new layout and format, and only
+        then is the old layout removed.
+
+        Args:
+            configuration (str): The configuration to migrate the manifest of
+            layout (str, optional): "sharded" or "flat". Defaults to None (keep the layout).
+            shard_by (str, optional): How to shard the manifest - "hash" or "owner".
+                Defaults to None (keep the sharding, or "hash" for a manifest not sharded yet).
+            manifest_format (str, optional): "pretty" or "compact" (see manifestformat).
+                Defaults to None (keep the format).
+            verbose (bool, optional): Whether to print verbose output. Defaults to False.
+        Returns:
+            migrated (bool): Whether the manifest was migrated (False if it already was as asked)
+        """
+        from gh_rotator.modules.fileio import file_lock, write_if_changed
+        from gh_rotator.modules.manifestformat import dumps_manifest
+
+        manifest_file = self.get(f"{configuration}_file")
+        shards = self.get(f"{configuration}_shards")
+
+        try:
+            with file_lock(self.__lock_file(configuration), timeout=self.get("lock_timeout")):
+                self.reset(f"{configuration}_manifest")
+                self.reset(f"{configuration}_index")
+                manifest = self.get(f"{configuration}_manifest")
+
+                sharded = shards.exists()
+                index = shards.index() if sharded else {"shard_by": None, "prefix": SHARD_PREFIX}
+                current = (
+                    "sharded" if sharded else "flat",
+                    index["shard_by"],
+                    self.get(f"{configuration}_format"),
+                )
+                layout = layout or current[0]
+                target = (
+                    layout,
+                    (shard_by or current[1] or "hash") if layout == "sharded" else None,
+                    manifest_format or current[2],
+                )
+                # Shards named the old way (see SHARD_PREFIX) are renamed, even to the same layout
+                if target == current and index["prefix"] == SHARD_PREFIX:
+                    return False
+
+                if layout == "sharded":
+                    shards.save(
+                        manifest.get(configuration, []), shard_by=target[1], manifest_format=target[2]
+                    )
+                    if os.path.exists(manifest_file):
+                        os.remove(manifest_file)
+                else:
+                    content = dumps_manifest(manifest, target[2])
+                    write_if_changed(manifest_file, content.encode("utf-8"))
+                    if sharded:
+                        shards.remove()
+                self.set(f"{configuration}_format", target[2])
+                self.__track(configuration)
+        except TimeoutError:
+            print(
+                f"⛔️ Error: Timed out after {self.get('lock_timeout')}s waiting for the lock on the {configuration} manifest",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        except OSError as e:
+            print(f"⛔️ Error: Failed to migrate manifest for {configuration}: {e!s}", file=sys.stderr)
+            sys.exit(1)
 
-    def get_version(self, configuration=str, repo=str):
+        if verbose:
+            print(
+                f"The {configuration} manifest is migrated to the {layout} layout in the {target[2]} format."
+            )
+        return True
+
+    def refresh(self):
+        """Forget the loaded manifests whose file changed on disk since they were loaded
+
+        Used by long-running processes (gh rotator serve) to pick up manifests updated by others.
+        Manifests with rotations not yet saved are kept.
+        """
+        for configuration in self.get("config").get("config"):
+            if f"{configuration}_manifest" not in self.props:
+                continue
+            if self.get(f"{configuration}_pending"):
+                continue
+            if self.__stat(configuration) != self.get(f"{configuration}_stat"):
+                self.reset(f"{configuration}_manifest")
+                self.reset(f"{configuration}_index")
+
+    @timed("history")
+    def get_manifest_at(self, configuration=str, point=str):
+        """Rebuild the manifest of the given configuration at a point in its history
+
+        Args:
+            configuration (str): The configuration to rebuild the manifest for
+            point (str): The last event sequence number, or an ISO 8601 timestamp, to include
+        Returns:
+            manifest (dict): The manifest data, keyed by the configuration name (Exit with error if the history doesn't cover the point)
+        """
+        try:
+            key, value = parse_point(point)
+        except ValueError:
+            print(
+                f"⛔️ Error: '{point}' is neither an event number nor an ISO 8601 timestamp",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        try:
+            entries = self.get(f"{configuration}_history").at(key, value)
+        except ValueError as e:
+            print(f"⛔️ Error: {e!s}", file=sys.stderr)
+            sys.exit(1)
+        if entries is None:
+            print(
+                f"⛔️ Error: The history of the {configuration} manifest doesn't go back to {point}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        return {configuration: entries}
+
+    @timed("revision")
+    def get_manifest_in(self, configuration=str, revision=str):
+        """Read the manifest of the given configuration as it is in a git revision
+
+        The manifest (or its shards) is read from the git objects, nothing is checked out.
+
+        Args:
+            configuration (str): The configuration to read the manifest of
+            revision (str): The git revision (commit, branch, tag, HEAD~2...) to read it from
+        Returns:
+            manifest (dict): The manifest data, keyed by the configuration name - no entries if the
+                revision has no manifest (Exit with error if there is no such revision)
+        """
+        from gh_rotator.modules import gitcommit
+
+        git_root = self.get("git_root")
+        commit = gitcommit.resolve(git_root, revision)
+        if commit is None:
+            print(f"⛔️ Error: '{revision}' is not a revision of the product repo", file=sys.stderr)
+            sys.exit(1)
+
+        def path(file):
+            return os.path.relpath(file, git_root).replace(os.sep, "/")
+
+        shards = self.get(f"{configuration}_shards")
+        index_path = path(shards.get("index_file"))
+        flat_path = path(self.get(f"{configuration}_file"))
+        try:
+            found = gitcommit.read_files(git_root, commit, [flat_path, index_path])
+            if found[index_path] is not None:
+                index = json.loads(found[index_path])
+                directory = path(shards.get("directory"))
+                prefix = index.get("prefix", "")
+                shard_paths = [f"{directory}/{shard_file_name(shard, prefix)}" for shard in index["shards"]]
+                contents = gitcommit.read_files(git_root, commit, shard_paths)
+                entries = []
+                for shard_path in shard_paths:
+                    entries.extend(json.loads(contents[shard_path] or b"[]"))
+                return {configuration: entries}
+            if found[flat_path] is None:
+                return {configuration: []}
+            return json.loads(found[flat_path])
+        except ValueError:
+            print(
+                f"⛔️ Error: The {configuration} manifest in {revision} is not a valid JSON file",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        except gitcommit.GitError as e:
+            print(f"⛔️ Error: Failed to read the {configuration} manifest in {revision}: {e!s}", file=sys.stderr)
+            sys.exit(1)
+
+    @timed("lookup")
+    def find_versions(self, configuration=str, repos=None, at=None):
+        """Look up the versions of many repos in the given configuration
+
+        Unlike get_version, a miss is not an error, so a single load of the manifest can answer
+        for all of them
+
+        Args:
+            configuration (str): The configuration to query the manifest for
+            repos (list, optional): The repos to look up. Defaults to None (all repos in the manifest).
+            at (str, optional): Look them up in the manifest at this point in its history. Defaults to None (now).
+        Returns:
+            versions (dict): The version of each repo, in order (None for a repo not in the manifest)
+        """
+        if at is None:
+            index = self.get(f"{configuration}_index")
+        else:
+            index = {}
+            for entry in self.get_manifest_at(configuration, at)[configuration]:
+                index.setdefault(entry["repo"], entry)
+
+        if repos is None:
+            repos = list(index)
+        return {repo: index[repo].get("version") if repo in index else None for repo in repos}
+
+    def __lookup(self, configuration=str, repo=str):
+        """Find the entry of a repo in the manifest of the given configuration
+
+        A manifest not loaded yet isn't loaded for it if it is sharded (only the shard of the repo
+        is read) or at least STREAM_THRESHOLD big (the file is scanned for the repo instead).
+
+        Returns:
+            entry (dict): The manifest entry of the repo (None if it isn't in the manifest)
+        """
+        if (
+            f"{configuration}_file" in self.props
+            and f"{configuration}_manifest" not in self.props
+            and not self.get(f"{configuration}_pending")
+        ):
+            from gh_rotator.modules.manifestscan import STREAM_THRESHOLD, find_entry
+
+            shards = self.get(f"{configuration}_shards")
+            try:
+                if shards.exists():
+                    shard_file = shards.shard_file_of(repo)
+                    return find_entry(shard_file, repo) if os.path.exists(shard_file) else None
+                if os.path.getsize(self.get(f"{configuration}_file")) >= STREAM_THRESHOLD:
+                    entry = find_entry(self.get(f"{configuration}_file"), repo)
+                    # Hand written manifests may hold non-ASCII characters unescaped
+                    if entry is not None or repo.isascii():
+                        return entry
+            except (OSError, ValueError):
+                # Missing, changing or broken files are left to the loader (and its errors)
+                pass
+
+        return self.get(f"{configuration}_index").get(repo)
+
+    @timed("lookup")
+    def get_version(self, configuration=str, repo=str, verbose=False):
         """Get the version of a repo in the given configuration
 
         Args:
             configuration (str): The configuration to query the manifest for
             repo (str): The fully qualified name (owner/repo) of the repo to look up
+            verbose (bool, optional): Whether to print verbose output. Defaults to False.
         Returns:
             version (str): The version of the repo in the manifest (Exit with error if not found)
         """
-        # The constructor already loaded the manifests, for were good to assume it's healthy
+        # The manifest is loaded (on first access) by get(), so were good to assume it's healthy
 
         # Check if the repo exists in the manifest
-        for entry in self.get(f"{configuration}_manifest")[configuration]:
-            if entry["repo"] == repo:
-                try:
-                    return entry["version"]
-                except KeyError:
-                    print(
-                        f"⛔️ Error: The repo '{repo}' is not yet manifested in  the '{configuration}' configuation.",
-                        file=sys.stderr,
-                    )
-                    sys.exit(1)
+        entry = self.__lookup(configuration, repo)
+        if entry is not None:
+            try:
+                version = entry["version"]
+            except KeyError:
+                print(
+                    f"⛔️ Error: The repo '{repo}' is not yet manifested in  the '{configuration}' configuation.",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+            if verbose:
+                print(
+                    f"Found {repo} in {configuration} manifest with version {version}",
+                    file=sys.stderr,
+                )
+            return version
 
         print(
             f"⛔️ Error: Repository {repo} not found in configuration {configuration}",
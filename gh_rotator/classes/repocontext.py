@@ -0,0 +1,127 @@
+import os
+import sys
+
+from gh_rotator.classes.lazyload import Lazyload
+from gh_rotator.modules.profiling import phase
+
+# Environment variable that lets CI point directly at the repo root and skip discovery
+GIT_ROOT_ENV = "GH_ROTATOR_GIT_ROOT"
+
+
+def find_git_root(start=str):
+    """Walk up from start to the nearest directory containing a .git entry
+
+    Args:
+        start (str): The directory to start the walk from
+    Returns:
+        git_root (str): The root of the git repo (None if no .git was found)
+    """
+    directory = os.path.abspath(start)
+    while True:
+        # .git is a directory in a regular clone and a file in worktrees and submodules
+        if os.path.exists(os.path.join(directory, ".git")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def find_git_dir(git_root=str):
+    """Find the git directory of the repo (or worktree) at git_root without forking git
+
+    Args:
+        git_root (str): The root of the git repo
+    Returns:
+        git_dir (str): The git directory (None if git_root has no .git)
+    """
+    dot_git = os.path.join(git_root, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
+    if os.path.isfile(dot_git):
+        # Worktrees and submodules point to their git directory with a 'gitdir: <path>' line
+        with open(dot_git) as f:
+            content = f.read().strip()
+        if content.startswith("gitdir:"):
+            return os.path.realpath(os.path.join(git_root, content.removeprefix("gitdir:").strip()))
+    return None
+
+
+def git_toplevel():
+    """Ask git for the root of the repo the current directory belongs to
+
+    Returns:
+        git_root (str): The root of the git repo (None if git doesn't know or isn't available)
+    """
+    # Only needed when the walk didn't find the repo, so imported here
+    import subprocess
+
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "--show-toplevel"])  # noqa: S607
+            .decode("utf-8")
+            .strip()
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def repo_context(args):
+    """The RepoContext of a command - resolved once and kept on its args (as args.context), so
+    the daemon client, the config and the manifests of the command all share it
+
+    Args:
+        args (Namespace): The parsed command line arguments (args.git_root is --git-root)
+    Returns:
+        context (RepoContext): The context of the command
+    """
+    context = getattr(args, "context", None)
+    if context is None:
+        context = RepoContext(git_root=args.git_root)
+        args.context = context
+    return context
+
+
+class RepoContext(Lazyload):
+    """Class used to resolve - once - the root of the git repo the rotator is working in
+
+    The root is taken from the first of these that yields one:
+    the git_root argument (--git-root), the GH_ROTATOR_GIT_ROOT environment variable,
+    a walk up to the nearest .git and finally `git rev-parse --show-toplevel`.
+    """
+
+    def __init__(self, git_root=None):
+        super().__init__()
+
+        with phase("git_root"):
+            root = git_root or os.environ.get(GIT_ROOT_ENV) or find_git_root(os.getcwd())
+            if root is None:
+                root = git_toplevel()
+
+        if root is None:
+            print(
+                "⛔️ Error: Not in a git repository. Please run this script from a git repository.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        self.set("git_root", str(root))
+        self.set_loader("git_dir", lambda: find_git_dir(self.get("git_root")))
+        self.set_loader("state_dir", self.__state_dir)
+
+    def __state_dir(self):
+        """The private directory where the rotator keeps its own (uncommitted) files, like locks
+
+        Returns:
+            state_dir (str): <git_dir>/gh-rotator - or a directory in the system temp dir,
+                unique to the repo, if the git directory can't be found
+        """
+        git_dir = self.get("git_dir")
+        if git_dir is not None:
+            return os.path.join(git_dir, "gh-rotator")
+
+        import hashlib
+        import tempfile
+
+        digest = hashlib.sha1(self.get("git_root").encode("utf-8")).hexdigest()[:12]  # noqa: S324
+        return os.path.join(tempfile.gettempdir(), f"gh-rotator-{digest}")
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
 import sys
-from pathlib import Path
 
+from gh_rotator.modules import profiling
+from gh_rotator.modules.rotator_client import forward
 from gh_rotator.modules.rotator_handlers import COMMAND_HANDLERS
 from gh_rotator.modules.rotator_parser import rotator_parse
 
@@ -11,6 +12,28 @@ def main():
     """Main entry point for the rotator CLI tool."""
     args = rotator_parse(sys.argv[1:])
 
+    target, cprofile = profiling.settings(args)
+    if target is None and cprofile is None:
+        run(args)
+
+    # A profiled command always runs in this process, not on a daemon
+    profiling.start(args.command, target, cprofile)
+    try:
+        run(args, daemon=False)
+    except SystemExit as e:
+        profiling.stop(e.code)
+        raise
+
+
+def run(args, daemon=True):
+    """Run the parsed command - exits with its exit code"""
+    # Let a running daemon answer, if there is one
+    result = forward(args) if daemon else None
+    if result is not None:
+        sys.stdout.write(result["stdout"])
+        sys.stderr.write(result["stderr"])
+        sys.exit(result["exit_code"])
+
     # Execute the appropriate command handler
     if args.command in COMMAND_HANDLERS:
         COMMAND_HANDLERS[args.command](args)
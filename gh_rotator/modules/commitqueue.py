@@ -0,0 +1,82 @@
+"""A queue of rotations waiting to be committed together (lock --commit --coalesce)
+
+Every run queues its rotations as a file in the queue directory, waits for the window, then takes
+the lock of the queue. The run that finds its rotations still queued leads: it takes all rotations
+queued by then and commits them at once, leaving the commit for the others to pick up when they
+get the lock in turn. A run that finds its rotations taken just reports that commit. The window
+is waited out before taking the lock, so it holds up no one for longer than itself. The results
+left for runs that failed or timed out before picking them up are removed by a later leader.
+"""
+
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from gh_rotator.modules.fileio import write_if_changed
+
+QUEUED = ".json"
+DONE = ".done"
+
+
+def enqueue(directory=str, rotations=dict):
+    """Queue rotations to be committed
+
+    Args:
+        directory (str): The queue directory
+        rotations (dict): The manifest updates to commit, by configuration
+    Returns:
+        name (str): The name of the queued rotations (see result)
+    """
+    # Named by the time they are queued, so they are taken in order
+    name = f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    write_if_changed(Path(directory) / f"{name}{QUEUED}", json.dumps(rotations).encode("utf-8"))
+    return name
+
+
+def take(directory=str, max_age=None):
+    """All rotations in the queue, oldest first
+
+    Args:
+        directory (str): The queue directory
+        max_age (float, optional): Remove the results left longer ago than this many seconds -
+            their runs would have picked them up by then. Defaults to None (keep them all).
+    Returns:
+        queued (list): The name and rotations (by configuration) of each entry in the queue
+    """
+    if max_age is not None:
+        expired = time.time() - max_age
+        for path in Path(directory).glob(f"*{DONE}"):
+            if path.stat().st_mtime < expired:
+                path.unlink()
+    return [
+        (path.name.removesuffix(QUEUED), json.loads(path.read_bytes()))
+        for path in sorted(Path(directory).glob(f"*{QUEUED}"))
+    ]
+
+
+def resolve(directory=str, names=list, result=dict):
+    """Take rotations off the queue, leaving the result for the runs that queued them"""
+    for name in names:
+        write_if_changed(Path(directory) / f"{name}{DONE}", json.dumps(result).encode("utf-8"))
+        (Path(directory) / f"{name}{QUEUED}").unlink(missing_ok=True)
+
+
+def discard(directory=str, name=str):
+    """Take rotations off the queue without a result"""
+    (Path(directory) / f"{name}{QUEUED}").unlink(missing_ok=True)
+
+
+def result(directory=str, name=str):
+    """The result of queued rotations, once another run committed them
+
+    Returns:
+        result (dict): What the run that took them left (None while they are still queued)
+    """
+    done = Path(directory) / f"{name}{DONE}"
+    if (Path(directory) / f"{name}{QUEUED}").exists() or not done.exists():
+        return None
+    content = json.loads(done.read_bytes())
+    done.unlink()
+    return content
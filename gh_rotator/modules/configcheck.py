@@ -0,0 +1,576 @@
+"""Validation and rule-overlap analysis of a product config (gh rotator check)
+
+The rules of a config are checked for:
+
+- schema: every configuration is a list of rules with a string repo, ref_type (branch|tag) and
+  ref_name - and every pattern compiles
+- shadowed: a rule every sampled event of which is taken by rules before it (first match wins),
+  so it never rotates anything
+- overlap: a rule some sampled events of which are taken by a rule of another configuration before it
+- backtracking: a pattern that takes longer than the budget to fail on a pumped input - it would
+  stall every rotation tested against it
+
+Overlaps are found by sampling: strings matching the patterns of each rule are generated from the
+parsed regex, and run through the compiled config like real events.
+
+Sampling and pumping parse the patterns with the regex parser of CPython (re._parser), which
+isn't a public API - without it, only literal patterns are sampled and none is pumped.
+"""
+
+import functools
+import itertools
+import random
+import re
+import signal
+import string
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from gh_rotator.classes.configmatcher import ConfigMatcher, literal_pattern
+
+RULE_KEYS = ("repo", "ref_type", "ref_name")
+REF_TYPES = ("branch", "tag")
+
+# The events sampled per rule, and the most times a repeat is taken when sampling
+DEFAULT_SAMPLES = 16
+SAMPLE_REPEAT = 3
+# How long a pattern may take to fail on a pumped input (seconds)
+DEFAULT_BUDGET = 0.01
+# The lengths a repeat is pumped to, and what ends the pumped input so the match fails
+PUMPS = (4, 8, 12, 16, 20, 24, 32, 48, 64)
+PUMP_ENDS = ("\x00", "\n")
+
+# The characters sampled for ., negated sets and categories
+_PRINTABLE = string.ascii_letters + string.digits + "-_./+"
+
+
+@functools.cache
+def _parser():
+    """The regex parser of the re module and its opcodes - None if this Python has none
+
+    re._parser and re._constants are internals of CPython (3.11 and later), not a public API:
+    they may change or go in any release, or not exist in another Python. They are only imported
+    here, once patterns are sampled or pumped - without them those checks find nothing, while
+    the rest of the rotator doesn't depend on them at all.
+
+    Returns:
+        parser (SimpleNamespace): parse, the opcodes (sre), the characters sampled for each
+            category and the repeat opcodes
+    """
+    try:
+        from re import _constants as sre
+        from re import _parser as sre_parse
+
+        categories = {
+            sre.CATEGORY_DIGIT: string.digits,
+            sre.CATEGORY_NOT_DIGIT: string.ascii_letters + "-_./",
+            sre.CATEGORY_WORD: string.ascii_letters + string.digits + "_",
+            sre.CATEGORY_NOT_WORD: "-./+ ",
+            sre.CATEGORY_SPACE: " ",
+            sre.CATEGORY_NOT_SPACE: _PRINTABLE,
+        }
+        repeats = (sre.MAX_REPEAT, sre.MIN_REPEAT, sre.POSSESSIVE_REPEAT)
+    except (ImportError, AttributeError):
+        return None
+    return SimpleNamespace(parse=sre_parse.parse, sre=sre, categories=categories, repeats=repeats)
+
+
+def finding(level=str, check=str, configuration=None, rule=None, message=str):
+    """A problem found in the config
+
+    Args:
+        level (str): "error" (the config can't be used as it is) or "warning"
+        check (str): "schema", "shadowed", "overlap" or "backtracking"
+        configuration (str): The configuration of the rule (None for the config as a whole)
+        rule (int): The position of the rule in its configuration (None for the configuration)
+        message (str): What is wrong
+    Returns:
+        finding (dict): The finding
+    """
+    return {
+        "level": level,
+        "check": check,
+        "configuration": configuration,
+        "rule": rule,
+        "message": message,
+    }
+
+
+def _rule_name(configuration, position):
+    return f"{configuration}[{position}]"
+
+
+def describe(found=dict):
+    """A finding as a sentence, like "dev[2] has no ref_type" """
+    if found["configuration"] is None:
+        return found["message"]
+    if found["rule"] is None:
+        return f"{found['configuration']} {found['message']}"
+    return f"{_rule_name(found['configuration'], found['rule'])} {found['message']}"
+
+
+def _rule_errors(rule):
+    """What is wrong with a rule (empty if it is valid)"""
+    if not isinstance(rule, dict):
+        return [f"is a {type(rule).__name__}, not an object"]
+    errors = [f"has no {key}" for key in RULE_KEYS if key not in rule]
+    errors += [
+        f"has a {key} that is not a string"
+        for key in RULE_KEYS
+        if key in rule and not isinstance(rule[key], str)
+    ]
+    if isinstance(rule.get("ref_type"), str) and rule["ref_type"] not in REF_TYPES:
+        errors.append(f"has ref_type '{rule['ref_type']}', not one of {', '.join(REF_TYPES)}")
+    for key in ("repo", "ref_name"):
+        if isinstance(rule.get(key), str):
+            try:
+                re.compile(rule[key])
+            except re.error as e:
+                errors.append(f"has a {key} that is not a valid regex: {e!s}")
+    return errors
+
+
+def validate(config=None):
+    """Validate the schema of a config and compile every pattern
+
+    Returns:
+        findings (list): The schema errors (and warnings), in file order
+    """
+    if not isinstance(config, dict):
+        return [finding("error", "schema", message="The config is not an object of configurations")]
+
+    findings = []
+    for configuration, rules in config.items():
+        if not isinstance(rules, list):
+            findings.append(
+                finding("error", "schema", configuration, message="is not a list of rules")
+            )
+            continue
+        if not rules:
+            findings.append(finding("warning", "schema", configuration, message="has no rules"))
+        for position, rule in enumerate(rules):
+            findings += [
+                finding("error", "schema", configuration, position, message=error)
+                for error in _rule_errors(rule)
+            ]
+            extra = sorted(set(rule) - set(RULE_KEYS)) if isinstance(rule, dict) else []
+            if extra:
+                findings.append(
+                    finding(
+                        "warning",
+                        "schema",
+                        configuration,
+                        position,
+                        message=f"has unknown keys (ignored): {', '.join(extra)}",
+                    )
+                )
+    return findings
+
+
+class _Pumped(Exception):  # noqa: N818 - not an error, ends the sample at the repeat to pump
+    """Raised by the sampler at the repeat it pumps, with the sample before it and of its body"""
+
+
+class _Sampler:
+    """Generates strings from a parsed regex
+
+    Every repeat is taken a random number of times (up to SAMPLE_REPEAT more than its minimum) -
+    except the repeat to pump, where the sample ends (see attack).
+    Assertions and anchors are not generated, so a sample may not match: check it before use.
+    """
+
+    def __init__(self, parser=SimpleNamespace, rng=None, pump=None):
+        self.parser = parser
+        self.rng = rng
+        self.pump = pump
+        self.out = []
+        self.groups = {}
+        sre = parser.sre
+        self.nodes = {
+            sre.LITERAL: self.literal,
+            sre.NOT_LITERAL: self.not_literal,
+            sre.ANY: self.any,
+            sre.IN: self.any_of,
+            sre.BRANCH: self.branch,
+            sre.SUBPATTERN: self.group,
+            sre.ATOMIC_GROUP: self.sequence,
+            sre.GROUPREF: self.group_ref,
+            sre.GROUPREF_EXISTS: self.group_exists,
+            sre.AT: self.skip,
+            sre.ASSERT: self.skip,
+            sre.ASSERT_NOT: self.skip,
+        }
+
+    def sequence(self, items):
+        for op, av in items:
+            if op in self.parser.repeats:
+                self.repeat(av)
+            else:
+                self.nodes[op](av)
+
+    def literal(self, av):
+        self.out.append(chr(av))
+
+    def not_literal(self, av):
+        self.out.append(self.rng.choice(_PRINTABLE.replace(chr(av), "")))
+
+    def any(self, _av):
+        self.out.append(self.rng.choice(_PRINTABLE))
+
+    def any_of(self, av):
+        sre = self.parser.sre
+        if av and av[0][0] is sre.NEGATE:
+            chars = [char for char in _PRINTABLE if not _in_set(self.parser, av[1:], char)]
+            self.out.append(self.rng.choice(chars or ["\x01"]))
+            return
+        op, value = self.rng.choice(av)
+        if op is sre.LITERAL:
+            self.out.append(chr(value))
+        elif op is sre.RANGE:
+            self.out.append(chr(self.rng.randint(*value)))
+        else:
+            self.out.append(self.rng.choice(self.parser.categories.get(value, _PRINTABLE)))
+
+    def branch(self, av):
+        self.sequence(self.rng.choice(av[1]))
+
+    def group(self, av):
+        group, _add_flags, _del_flags, items = av
+        start = len(self.out)
+        self.sequence(items)
+        if group is not None:
+            self.groups[group] = "".join(self.out[start:])
+
+    def group_ref(self, av):
+        self.out.append(self.groups.get(av, ""))
+
+    def group_exists(self, av):
+        group, yes, no = av
+        if group in self.groups:
+            self.sequence(yes)
+        elif no is not None:
+            self.sequence(no)
+
+    def skip(self, _av):
+        pass
+
+    def repeat(self, av):
+        low, high, items = av
+        if av is self.pump:
+            start = len(self.out)
+            self.sequence(items)
+            raise _Pumped("".join(self.out[:start]), "".join(self.out[start:]))
+        for _ in range(self.rng.randint(low, min(high, low + SAMPLE_REPEAT))):
+            self.sequence(items)
+
+    def generate(self, parsed):
+        self.sequence(parsed)
+        return "".join(self.out)
+
+    def attack(self, parsed):
+        """The sample of the pattern up to the repeat to pump, and a sample of the repeated body"""
+        try:
+            self.sequence(parsed)
+        except _Pumped as pumped:
+            return pumped.args
+        return "".join(self.out), ""
+
+
+def _in_set(parser, items, char):
+    """Whether a character is in the (not negated) items of a character set"""
+    sre = parser.sre
+    code = ord(char)
+    for op, value in items:
+        if (op is sre.LITERAL and value == code) or (
+            op is sre.RANGE and value[0] <= code <= value[1]
+        ):
+            return True
+        if op is sre.CATEGORY and char in parser.categories.get(value, ""):
+            return True
+    return False
+
+
+def samples(pattern=str, count=DEFAULT_SAMPLES, rng=None):
+    """Strings fully matching a pattern
+
+    Args:
+        pattern (str): The regular expression
+        count (int, optional): How many to generate. Defaults to DEFAULT_SAMPLES.
+        rng (Random, optional): The random generator. Defaults to None (seeded with the pattern).
+    Returns:
+        samples (list): Distinct strings matching the pattern - fewer than count if it matches
+            fewer, or the sampler can't satisfy its assertions (none but a literal pattern
+            itself without the regex parser, see _parser)
+    """
+    literal = literal_pattern(pattern)
+    if literal is not None:
+        return [literal]
+    parser = _parser()
+    if parser is None:
+        return []
+    rng = rng or random.Random(pattern)
+    compiled = re.compile(pattern)
+    parsed = parser.parse(pattern)
+    found = {}
+    for _ in range(count * 4):
+        sample = _Sampler(parser, rng).generate(parsed)
+        if compiled.fullmatch(sample):
+            found[sample] = True
+            if len(found) == count:
+                break
+    return list(found)
+
+
+def _repeats(parser, items, found):
+    """Collect the unbounded (or long) repeats of a parsed regex - the ones worth pumping"""
+    sre = parser.sre
+    for op, av in items:
+        if op in parser.repeats:
+            if av[1] > PUMPS[0]:
+                found.append(av)
+            _repeats(parser, av[2], found)
+        elif op is sre.BRANCH:
+            for branch in av[1]:
+                _repeats(parser, branch, found)
+        elif op is sre.SUBPATTERN:
+            _repeats(parser, av[3], found)
+        elif op is sre.ATOMIC_GROUP:
+            _repeats(parser, av, found)
+    return found
+
+
+class _Timeout(Exception):  # noqa: N818 - the budget ran out, handled right where it is raised
+    pass
+
+
+def _alarm(_signum, _frame):
+    raise _Timeout
+
+
+@contextmanager
+def _alarms():
+    """Let match_time interrupt slow matches with a timer signal - where it can (POSIX, main thread)
+
+    Yields:
+        alarm (bool): Whether matches can be interrupted
+    """
+    if (
+        not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield False
+        return
+    previous = signal.signal(signal.SIGALRM, _alarm)
+    try:
+        yield True
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def match_time(compiled=None, text=str, budget=DEFAULT_BUDGET, *, alarm=False):
+    """How long a compiled pattern takes to fullmatch the text
+
+    Args:
+        compiled (Pattern): The compiled pattern
+        text (str): The text to match
+        budget (float, optional): The time the match may take (seconds). Defaults to DEFAULT_BUDGET.
+        alarm (bool, optional): Interrupt the match at twice the budget (inside _alarms only).
+            Defaults to False.
+    Returns:
+        seconds (float): The time of the match
+    """
+    start = time.perf_counter()
+    try:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, budget * 2)
+        compiled.fullmatch(text)
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Timeout:
+        pass
+    return time.perf_counter() - start
+
+
+def backtracking(pattern=str, budget=DEFAULT_BUDGET):
+    """Time a pattern failing to match inputs with each of its repeats pumped
+
+    The input is a sample of the pattern up to a repeat, a sample of the body of the repeat taken
+    more and more times and a character that doesn't match - the input nested or adjacent repeats
+    backtrack on exponentially.
+
+    Args:
+        pattern (str): The regular expression
+        budget (float, optional): The time a match may take (seconds). Defaults to DEFAULT_BUDGET.
+    Returns:
+        seconds (float): The slowest match (stops at the first one over the budget)
+        length (int): The length of its input (0 if the pattern has nothing to pump - or without
+            the regex parser to find its repeats, see _parser)
+    """
+    parser = _parser()
+    if parser is None:
+        return 0.0, 0
+    compiled = re.compile(pattern)
+    parsed = parser.parse(pattern)
+    worst = (0.0, 0)
+    with _alarms() as alarm:
+        for repeat in _repeats(parser, parsed, []):
+            prefix, body = _Sampler(parser, random.Random(pattern), repeat).attack(parsed)
+            if not body:
+                continue
+            for end, times in itertools.product(PUMP_ENDS, PUMPS):
+                text = prefix + body * times + end
+                seconds = match_time(compiled, text, budget, alarm=alarm)
+                if seconds > budget:
+                    # Once more, so a hiccup of the machine isn't taken for a slow pattern
+                    seconds = min(seconds, match_time(compiled, text, budget, alarm=alarm))
+                worst = max(worst, (seconds, len(text)))
+                if seconds > budget:
+                    return worst
+    return worst
+
+
+def _events(rule, count, sampled):
+    """Sample events matching a rule: (repo, event_name) pairs
+
+    The samples of each pattern are kept in sampled, as many rules share their patterns.
+    """
+    for key in ("repo", "ref_name"):
+        if rule[key] not in sampled:
+            sampled[rule[key]] = samples(rule[key], count)
+    repos, names = sampled[rule["repo"]], sampled[rule["ref_name"]]
+    if not repos or not names:
+        return []
+    return [
+        (repos[i % len(repos)], names[i % len(names)]) for i in range(max(len(repos), len(names)))
+    ]
+
+
+def _shadowed(index, rules, taken):
+    """The finding for a rule all sampled events of which are taken by the rules before it"""
+    configuration, position, _rule = rules[index]
+    others = ", ".join(_rule_name(*rules[i][:2]) for i in sorted(taken))
+    return finding(
+        "warning",
+        "shadowed",
+        configuration,
+        position,
+        f"never matches: every sampled event is taken by {others} first",
+    )
+
+
+def _overlap(index, rules, overlapped):
+    """The finding for a rule some events of which are taken by rules of other configurations"""
+    configuration, position, rule = rules[index]
+    others = ", ".join(_rule_name(*rules[i][:2]) for i in sorted(overlapped))
+    first = min(overlapped)
+    repo, event_name = overlapped[first]
+    return finding(
+        "warning",
+        "overlap",
+        configuration,
+        position,
+        f"overlaps {others}: events like {repo} on {rule['ref_type']} {event_name} match both "
+        f"and rotate {rules[first][0]}",
+    )
+
+
+def overlaps(config=dict, count=DEFAULT_SAMPLES):
+    """Find the rules shadowed by, or overlapping with, the rules before them
+
+    Events are sampled from every rule and run through all rules, in file order like a rotation.
+    A rule all events sampled from which are taken by the rules before it is shadowed. A rule
+    matching an event taken by a rule of another configuration overlaps that rule.
+
+    Args:
+        config (dict): A valid config (see validate)
+        count (int, optional): The events sampled per rule. Defaults to DEFAULT_SAMPLES.
+    Returns:
+        findings (list): The shadowed and overlapping rules, in file order
+    """
+    rules = [
+        (configuration, position, rule)
+        for configuration, configuration_rules in config.items()
+        for position, rule in enumerate(configuration_rules)
+    ]
+    matcher = ConfigMatcher(config)
+    sampled = {}
+    # For each rule: the rules before it taking its own events, or None once one of them isn't
+    taken = {}
+    # For each rule: the rules of other configurations taking events it matches, with an example
+    overlapped = {}
+    for index, (_configuration, _position, rule) in enumerate(rules):
+        taken[index] = set()
+        for repo, event_name in _events(rule, count, sampled):
+            matching = matcher.match_rules(repo, event_name, rule["ref_type"])
+            first = matching[0]
+            if taken[index] is not None:
+                taken[index] = taken[index] | {first} if first != index else None
+            for other in matching[1:]:
+                if rules[other][0] != rules[first][0]:
+                    overlapped.setdefault(other, {}).setdefault(first, (repo, event_name))
+
+    findings = []
+    for index in range(len(rules)):
+        if taken[index]:
+            findings.append(_shadowed(index, rules, taken[index]))
+        elif index in overlapped:
+            findings.append(_overlap(index, rules, overlapped[index]))
+    return findings
+
+
+def slow_patterns(config=dict, budget=DEFAULT_BUDGET):
+    """Find the patterns that take longer than the budget to fail on a pumped input
+
+    Args:
+        config (dict): A valid config (see validate)
+        budget (float, optional): The time a match may take (seconds). Defaults to DEFAULT_BUDGET.
+    Returns:
+        findings (list): The rules with a slow pattern, in file order
+    """
+    timed = {}
+    findings = []
+    for configuration, rules in config.items():
+        for position, rule in enumerate(rules):
+            for key in ("repo", "ref_name"):
+                pattern = rule[key]
+                if pattern not in timed:
+                    timed[pattern] = backtracking(pattern, budget)
+                seconds, length = timed[pattern]
+                if seconds > budget:
+                    findings.append(
+                        finding(
+                            "error",
+                            "backtracking",
+                            configuration,
+                            position,
+                            f"has a {key} that backtracks catastrophically: failing to match a "
+                            f"{length} character input took over {seconds * 1e3:.0f} ms "
+                            f"(budget {budget * 1e3:g} ms)",
+                        )
+                    )
+    return findings
+
+
+def check(config=None, count=DEFAULT_SAMPLES, budget=DEFAULT_BUDGET):
+    """Run all checks on a config
+
+    The patterns are only timed once the schema is valid, and the rules only sampled for
+    overlaps when no pattern is too slow to run them through.
+
+    Args:
+        config (dict): The parsed config file
+        count (int, optional): The events sampled per rule. Defaults to DEFAULT_SAMPLES.
+        budget (float, optional): The time a match may take (seconds). Defaults to DEFAULT_BUDGET.
+    Returns:
+        findings (list): Everything found (see finding)
+    """
+    findings = validate(config)
+    if any(found["level"] == "error" for found in findings):
+        return findings
+    findings += slow_patterns(config, budget)
+    if any(found["level"] == "error" for found in findings):
+        return findings
+    return findings + overlaps(config, count)
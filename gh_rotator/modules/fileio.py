@@ -0,0 +1,100 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# How long to sleep between attempts to take a lock that is held by someone else
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def write_if_changed(path, content):
+    """Atomically replace the file at path with content - unless it already holds exactly that
+
+    The content is written and fsync'ed to a temp file in the same directory, which is then
+    os.replace'd into place. Readers see either the old or the new file, never a truncated one,
+    and an unchanged file is not touched at all (so its mtime doesn't move either).
+
+    Args:
+        path (str): The file to write
+        content (bytes): The complete new content of the file
+    Returns:
+        changed (bool): Whether the file was written
+    """
+    path = Path(path)
+    try:
+        if path.read_bytes() == content:
+            return False
+        mode = path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o666 & ~_current_umask()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        Path(temp).chmod(mode)
+        Path(temp).replace(path)
+    except BaseException:
+        Path(temp).unlink(missing_ok=True)
+        raise
+
+    # Make the rename itself durable
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    return True
+
+
+@contextmanager
+def file_lock(path, timeout=None):
+    """Hold an exclusive advisory lock (fcntl.flock) on the lock file at path
+
+    The lock is released when the context exits - or when the process dies - so a crashed
+    run never leaves a stale lock behind. On platforms without fcntl this is a no-op.
+
+    Args:
+        path (str): The lock file (created if it doesn't exist)
+        timeout (float, optional): Seconds to wait for the lock. Defaults to None (wait forever).
+    Raises:
+        TimeoutError: If the lock couldn't be taken within the timeout
+    """
+    if fcntl is None:
+        yield
+        return
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out after {timeout}s waiting for {path}") from None
+                time.sleep(LOCK_POLL_INTERVAL)
+        yield
+    finally:
+        # Closing the file descriptor releases the lock
+        os.close(fd)
@@ -0,0 +1,233 @@
+"""Commit files straight into a branch with git plumbing - the index and work tree are never touched
+
+The new content is written as blobs (hash-object), the trees on the way to them are rebuilt from
+the trees of the parent commit (mktree) and the commit (commit-tree) is pushed to the remote branch,
+or the local branch is moved to it (update-ref) - both only if the branch is still at the parent.
+"""
+
+import subprocess
+
+
+class GitError(Exception):
+    """A git command failed"""
+
+
+class BranchMovedError(GitError):
+    """The branch moved on since it was read - rebuild the commit on top of it and try again"""
+
+
+def git(git_root=str, *args, stdin=None):
+    """Run a git command in the repo
+
+    Args:
+        git_root (str): The root of the git repo
+        *args (str): The git command and its arguments
+        stdin (bytes, optional): The input of the command. Defaults to None.
+    Returns:
+        stdout (bytes): The output of the command
+    Raises:
+        GitError: If git failed (or isn't available), with what it said on stderr
+    """
+    try:
+        result = subprocess.run(
+            ["git", *args],  # noqa: S607
+            cwd=git_root,
+            input=stdin,
+            capture_output=True,
+            check=False,
+        )
+    except FileNotFoundError as e:
+        raise GitError(f"git is not available: {e!s}") from None
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip()
+        raise GitError(f"git {args[0]} failed: {message}")
+    return result.stdout
+
+
+def current_branch(git_root=str):
+    """The branch checked out in the repo
+
+    Returns:
+        branch (str): The name of the branch (None if HEAD is detached)
+    """
+    try:
+        return git(git_root, "symbolic-ref", "--quiet", "--short", "HEAD").decode().strip()
+    except GitError:
+        return None
+
+
+def is_bare(git_root=str):
+    """Whether the repo is bare - it has no index and work tree to keep in step with its branches"""
+    return git(git_root, "rev-parse", "--is-bare-repository").decode().strip() == "true"
+
+
+def fetch(git_root=str, remote=str, branch=str):
+    """Fetch the branch from the remote
+
+    Returns:
+        ref (str): The remote-tracking ref the branch was fetched into
+    """
+    ref = f"refs/remotes/{remote}/{branch}"
+    git(git_root, "fetch", "--quiet", "--no-tags", remote, f"+refs/heads/{branch}:{ref}")
+    return ref
+
+
+def resolve(git_root=str, ref=str):
+    """The commit a ref points to
+
+    Returns:
+        commit (str): The sha of the commit (None if there is no such ref)
+    """
+    try:
+        return (
+            git(git_root, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}").decode().strip()
+        )
+    except GitError:
+        return None
+
+
+def read_file(git_root=str, commit=str, path=str):
+    """The content of a file in a commit
+
+    Args:
+        git_root (str): The root of the git repo
+        commit (str): The sha of the commit
+        path (str): The path of the file, relative to the root of the repo
+    Returns:
+        content (bytes): The content of the file (None if the commit has no such file)
+    """
+    try:
+        return git(git_root, "cat-file", "blob", f"{commit}:{path}")
+    except GitError:
+        return None
+
+
+def read_files(git_root=str, commit=str, paths=list):
+    """The content of many files in a commit - read by a single git process
+
+    Args:
+        git_root (str): The root of the git repo
+        commit (str): The sha of the commit
+        paths (list): The paths of the files, relative to the root of the repo
+    Returns:
+        contents (dict): The content (bytes) of each file, by path (None if the commit has no such file)
+    """
+    if not paths:
+        return {}
+    # cat-file --batch reads one object name per line, so a path can't hold a line break
+    names = b"".join(f"{commit}:{path}\n".encode() for path in paths)
+    output = git(git_root, "cat-file", "--batch", stdin=names)
+    contents = {}
+    position = 0
+    for path in paths:
+        end = output.index(b"\n", position)
+        header = output[position:end].rsplit(b" ", 2)
+        position = end + 1
+        # "<name> missing" (or ambiguous) for a path not in the commit, with no content following
+        if not header[-1].isdigit():
+            contents[path] = None
+            continue
+        size = int(header[2])
+        contents[path] = output[position : position + size] if header[1] == b"blob" else None
+        position += size + 1
+    return contents
+
+
+def _ls_tree(git_root, tree):
+    """The entries of a tree, keyed by name: (mode, type, sha)"""
+    if tree is None:
+        return {}
+    entries = {}
+    for line in git(git_root, "ls-tree", "-z", tree).split(b"\0"):
+        if line:
+            info, name = line.split(b"\t", 1)
+            mode, kind, sha = info.decode().split(" ")
+            entries[name] = (mode, kind, sha)
+    return entries
+
+
+def _mktree(git_root, tree, changes):
+    """Write a tree: the given tree with the changes - blob shas and nested changes by name"""
+    entries = _ls_tree(git_root, tree)
+    for name, change in changes.items():
+        mode, kind, sha = entries.get(name, ("100644", "blob", None))
+        if isinstance(change, dict):
+            entries[name] = (
+                "040000",
+                "tree",
+                _mktree(git_root, sha if kind == "tree" else None, change),
+            )
+        else:
+            # Keep the mode of a file that is replaced (it may be executable)
+            entries[name] = (mode if kind == "blob" else "100644", "blob", change)
+    listing = b"".join(
+        f"{mode} {kind} {sha}\t".encode() + name + b"\0"
+        for name, (mode, kind, sha) in sorted(entries.items())
+    )
+    return git(git_root, "mktree", "-z", stdin=listing).decode().strip()
+
+
+def write_tree(git_root=str, commit=str, files=dict):
+    """Write the tree of a commit with some of its files replaced (or added)
+
+    Only the trees on the way to the files are rewritten, every other tree and blob is shared
+    with the commit.
+
+    Args:
+        git_root (str): The root of the git repo
+        commit (str): The sha of the commit whose tree is changed (None to start an empty tree)
+        files (dict): The new content (bytes) of each file, by path relative to the root of the repo
+    Returns:
+        tree (str): The sha of the new tree
+    """
+    changes = {}
+    for path, content in files.items():
+        *directories, name = path.encode("utf-8").split(b"/")
+        level = changes
+        for directory in directories:
+            level = level.setdefault(directory, {})
+        level[name] = git(git_root, "hash-object", "-w", "--stdin", stdin=content).decode().strip()
+    return _mktree(git_root, None if commit is None else f"{commit}^{{tree}}", changes)
+
+
+def commit_tree(git_root=str, tree=str, parent=str, message=str):
+    """Write a commit of the tree on top of the parent (the author is taken from the git config)
+
+    Returns:
+        commit (str): The sha of the new commit
+    """
+    parents = [] if parent is None else ["-p", parent]
+    return (
+        git(git_root, "commit-tree", tree, *parents, stdin=message.encode("utf-8")).decode().strip()
+    )
+
+
+def update_branch(git_root=str, branch=str, commit=str, parent=str):
+    """Move the local branch to the commit - if it is still at the parent
+
+    Only the ref is moved: the branch must not be checked out in a work tree, whose index would
+    then undo the commit (see ProductManifest.commit).
+
+    Raises:
+        BranchMovedError: If the branch moved on since the parent was read
+    """
+    try:
+        git(git_root, "update-ref", f"refs/heads/{branch}", commit, parent or "")
+    except GitError as e:
+        if "but expected" in str(e) or "reference already exists" in str(e):
+            raise BranchMovedError(str(e)) from None
+        raise
+
+
+def push(git_root=str, remote=str, commit=str, branch=str):
+    """Push the commit to the branch on the remote - a fast-forward only
+
+    Raises:
+        BranchMovedError: If the remote branch moved on since it was fetched
+    """
+    try:
+        git(git_root, "push", "--quiet", remote, f"{commit}:refs/heads/{branch}")
+    except GitError as e:
+        if "[rejected]" in str(e) or "non-fast-forward" in str(e) or "fetch first" in str(e):
+            raise BranchMovedError(str(e)) from None
+        raise
@@ -0,0 +1,75 @@
+"""Compare two manifests by repo (gh rotator diff)
+
+The entries are matched by repo through a dict, not by their position in the list, so the order
+they are listed in doesn't matter and a diff takes a single pass over each manifest.
+"""
+
+# The columns of the table format
+COLUMNS = ("change", "repo", "from", "to")
+# Shown in the table for the version of a repo a manifest doesn't have
+NO_VERSION = "-"
+
+
+def diff(before=list, after=list):
+    """The repos added, removed and rotated to another version from one manifest to the other
+
+    Args:
+        before (list): The entries of the manifest compared from
+        after (list): The entries of the manifest compared to
+    Returns:
+        changes (dict): added and removed - the repo and its version, changed - the repo and its
+            version before (from) and after (to), and the number of repos unchanged. Added and
+            changed repos are listed in the order of after, removed repos in the order of before
+    """
+    versions = {}
+    for entry in before:
+        versions.setdefault(entry["repo"], entry.get("version"))
+
+    added, changed = [], []
+    unchanged = 0
+    seen = set()
+    for entry in after:
+        repo = entry["repo"]
+        if repo in seen:
+            continue
+        seen.add(repo)
+        version = entry.get("version")
+        if repo not in versions:
+            added.append({"repo": repo, "version": version})
+        elif versions[repo] != version:
+            changed.append({"repo": repo, "from": versions[repo], "to": version})
+        else:
+            unchanged += 1
+
+    removed = [
+        {"repo": repo, "version": version} for repo, version in versions.items() if repo not in seen
+    ]
+    return {"added": added, "removed": removed, "changed": changed, "unchanged": unchanged}
+
+
+def table(changes=dict):
+    """The changes as the lines of a table - one row per added, removed or changed repo
+
+    Returns:
+        lines (list): The header and rows, with the columns aligned (just the header if the
+            manifests don't differ)
+    """
+    rows = [
+        *(
+            ("changed", change["repo"], change["from"], change["to"])
+            for change in changes["changed"]
+        ),
+        *(("added", change["repo"], NO_VERSION, change["version"]) for change in changes["added"]),
+        *(
+            ("removed", change["repo"], change["version"], NO_VERSION)
+            for change in changes["removed"]
+        ),
+    ]
+    rows = [tuple(column.upper() for column in COLUMNS)] + [
+        tuple(NO_VERSION if cell is None else cell for cell in row) for row in rows
+    ]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(COLUMNS) - 1)]
+    return [
+        "  ".join([*(cell.ljust(width) for cell, width in zip(row, widths, strict=False)), row[-1]])
+        for row in rows
+    ]
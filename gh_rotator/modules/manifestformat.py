@@ -0,0 +1,86 @@
+import json
+
+# How manifests are serialized: pretty - indented by 4, in the order the entries were added, with
+# human readable local timestamps (the default), or compact - one minified entry per line with
+# sorted keys, entries sorted by repo and ISO 8601 UTC timestamps. Both are plain JSON, so any
+# reader reads both - the writer keeps the format a manifest already has.
+FORMATS = ("pretty", "compact")
+
+
+# The bytes of a manifest read to detect its format - the first entry line of a compact manifest
+DETECT_BYTES = 4096
+
+
+def detect_format(content=bytes):
+    """The format of a serialized manifest (or shard)
+
+    Only what has the shape of the compact format - {"<name>":[ (or just [ for a shard) followed
+    by one minified entry per line - is compact. Anything else (indented by 2, by a tab, by jq...)
+    is pretty, so a manifest is never turned compact without asking for it (gh rotator migrate).
+
+    Args:
+        content (bytes): The content of the file - its first DETECT_BYTES suffice
+    Returns:
+        format (str): "pretty" or "compact"
+    """
+    body = content
+    if body.startswith(b'{"'):
+        # The name of the configuration, right followed by its list - no whitespace in between
+        end = body.find(b'":[')
+        if end < 0:
+            return "pretty"
+        body = body[end + 2 :]
+        if body.startswith(b"[]"):
+            return "compact"
+    if not body.startswith(b'[\n{"'):
+        return "pretty"
+    # The first entry is on a line of its own, a single minified object
+    line_end = body.find(b"\n", 2)
+    if line_end < 0:
+        return "compact"
+    line = body[2:line_end]
+    return "compact" if line.endswith((b"}", b"},")) else "pretty"
+
+
+def timestamp(manifest_format=str):
+    """The last_update of an entry rotated now, in the given format"""
+    import datetime
+
+    if manifest_format == "compact":
+        return datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds")
+
+    import time
+
+    return datetime.datetime.now().strftime(f"%Y-%m-%d (%H:%M:%S) [{time.strftime('%Z')}]")  # noqa: DTZ005 - local time, as always written
+
+
+def dumps_entries(entries=list, manifest_format=str):
+    """Serialize a list of manifest entries
+
+    Returns:
+        content (str): The JSON text of the list
+    """
+    if manifest_format != "compact":
+        return json.dumps(entries, indent=4)
+    if not entries:
+        return "[]\n"
+    # One entry per line, in a stable order: rotating a repo changes exactly one line
+    # One encoder for all entries - json.dumps with options builds a new one per call
+    encode = json.JSONEncoder(sort_keys=True, separators=(",", ":")).encode
+    lines = [encode(entry) for entry in sorted(entries, key=lambda entry: entry["repo"])]
+    return "[\n" + ",\n".join(lines) + "\n]\n"
+
+
+def dumps_manifest(manifest=dict, manifest_format=str):
+    """Serialize a manifest - the entries keyed by the configuration name
+
+    Returns:
+        content (str): The JSON text of the manifest
+    """
+    if manifest_format != "compact":
+        return json.dumps(manifest, indent=4)
+    items = [
+        f"{json.dumps(key)}:{dumps_entries(entries, manifest_format).rstrip()}"
+        for key, entries in sorted(manifest.items())
+    ]
+    return "{" + ",".join(items) + "}\n"
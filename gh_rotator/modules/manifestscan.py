@@ -0,0 +1,56 @@
+import json
+import mmap
+import re
+
+# Manifests at least this big are scanned for a single repo instead of being loaded (bytes)
+STREAM_THRESHOLD = 1 << 20
+# No entry is longer than this (bytes) - the bytes read to parse the entry around a hit
+ENTRY_LIMIT = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+
+def find_entry(path=str, repo=str):
+    """Find the entry of a repo in a manifest (or shard) file, without parsing all of it
+
+    The file is memory mapped and searched for the "repo" key with the repo as its value - in either
+    format (see manifestformat). Only the entry around the first hit is parsed, like the index of a
+    loaded manifest keeps the first entry of a repo.
+
+    Args:
+        path (str): The manifest or shard file
+        repo (str): The fully qualified name (owner/repo) of the repo to find
+    Returns:
+        entry (dict): The manifest entry of the repo (None if it isn't in the file)
+    Raises:
+        OSError: If the file can't be read
+        ValueError: If the file is empty
+    """
+    # Manifests are written with non-ASCII characters escaped, so the repo is searched for that way
+    pattern = re.compile(rb'"repo"\s*:\s*' + re.escape(json.dumps(repo).encode("ascii")))
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for match in pattern.finditer(data):
+            entry = _entry_around(data, match.start(), repo)
+            if entry is not None:
+                return entry
+    return None
+
+
+def _entry_around(data, start, repo):
+    """Parse the entry of the repo around the byte at start
+
+    Tries the opening braces before start, nearest first - a brace inside a string value of the
+    entry doesn't parse as the entry of the repo.
+    """
+    brace = data.rfind(b"{", 0, start)
+    while brace >= 0 and start - brace < ENTRY_LIMIT:
+        text = data[brace : brace + ENTRY_LIMIT].decode("utf-8", errors="replace")
+        try:
+            entry, _end = _decoder.raw_decode(text)
+        except ValueError:
+            entry = None
+        if isinstance(entry, dict) and entry.get("repo") == repo:
+            return entry
+        brace = data.rfind(b"{", 0, brace)
+    return None
@@ -0,0 +1,181 @@
+"""Apply one rotation event to many product repos at once (lock --products)
+
+Every product root gets its own ProductConfig and ProductManifest, built in a worker of a process
+pool, so a slow or broken product only holds up its own worker. A product whose config has no
+rule matching the event is left alone - its manifests aren't even loaded.
+"""
+
+import contextlib
+import io
+import os
+import signal
+import sys
+from argparse import Namespace
+from pathlib import Path
+
+# The statuses of a product after the event was applied to it
+ROTATED = "rotated"
+UNCHANGED = "unchanged"
+NO_MATCH = "no-match"
+ERROR = "error"
+TIMEOUT = "timeout"
+# The statuses that make lock --products exit non-zero
+FAILED = (ERROR, TIMEOUT)
+
+
+class ProductTimeoutError(Exception):
+    """A product took longer than --product-timeout"""
+
+
+def read_products(products_file=str):
+    """Read the product roots to rotate from a file with one path per line ('-' reads from stdin)
+
+    Blank lines and lines starting with # are skipped, relative paths are taken from the current
+    directory.
+
+    Returns:
+        roots (list): The absolute product roots, in order and without duplicates
+    """
+    if products_file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(products_file).read_text(encoding="utf-8").splitlines()
+    roots = [line.strip() for line in lines if not line.lstrip().startswith("#")]
+    return list(dict.fromkeys(str(Path(root).resolve()) for root in roots if root))
+
+
+def default_workers(products=int):
+    """The worker count when --workers isn't given: one per CPU, and no more than products"""
+    return max(1, min(products, os.cpu_count() or 1))
+
+
+class _Deadline:
+    """Interrupt a product with ProductTimeoutError once its seconds are up (None to never)
+
+    Within shield() the product isn't interrupted: a manifest interrupted half way through its
+    write (or between its shards and their index, or before its history) would be left broken.
+    A deadline that passed meanwhile is raised once the shielded block is done. Only the writes
+    are shielded - waiting for a lock, the window of --coalesce and the fetch and push of --commit
+    (whose commit only lands on the branch at once) are all interrupted.
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.shielded = False
+        self.expired = False
+        self.previous = None
+
+    def __enter__(self):
+        if self.seconds is not None:
+            self.previous = signal.signal(signal.SIGALRM, self.__alarm)
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        return self
+
+    def __exit__(self, *_exc):
+        if self.seconds is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous)
+
+    def __alarm(self, _signum, _frame):
+        self.expired = True
+        if not self.shielded:
+            raise ProductTimeoutError
+
+    @contextlib.contextmanager
+    def shield(self):
+        """Run the block to its end, even if the deadline passes meanwhile"""
+        self.shielded = True
+        try:
+            yield
+        finally:
+            self.shielded = False
+        if self.expired:
+            raise ProductTimeoutError("the manifests were written by then")
+
+
+def _rotate(args=Namespace, deadline=_Deadline):
+    """Apply the event to the product at args.git_root - writing each manifest (once its lock is
+    taken) within the shield of the deadline
+
+    Returns:
+        status (str): ROTATED, UNCHANGED or NO_MATCH
+        configurations (list): The configurations matching the event
+    """
+    # Imported in the worker: they are only needed here, not by the process handing out products
+    from gh_rotator.modules.rotator_handlers import load_config, load_manifest, write_rotations
+
+    config = load_config(args)
+    if args.all_matches:
+        configurations = config.find_config_names(args.repo, args.event_name, args.event_type)
+    else:
+        configuration = config.find_config_name(args.repo, args.event_name, args.event_type)
+        configurations = [] if configuration is None else [configuration]
+    if not configurations:
+        return NO_MATCH, []
+
+    manifest = load_manifest(args, config)
+    manifest.set("write_shield", deadline.shield)
+    event = {key: getattr(args, key) for key in ("repo", "event_name", "event_type", "sha")}
+    if args.all_matches:
+        manifest.rotate_all(**event, verbose=args.verbose, save=False)
+    else:
+        manifest.rotate(**event, verbose=args.verbose, save=False)
+    changed = write_rotations(args, manifest, configurations)
+    return (ROTATED if any(changed.values()) else UNCHANGED), configurations
+
+
+def rotate_product(args=Namespace, root=str):
+    """Apply the event of lock --products to one product - run in a worker of the pool
+
+    What the product prints is captured, and a product that exits (on an error) or raises is
+    reported instead of taking the others down.
+
+    Args:
+        args (Namespace): The parsed command line arguments of lock --products
+        root (str): The root of the product repo
+    Returns:
+        result (dict): The product, its status, the configurations matching the event and
+            (for a product that failed) the error
+    """
+    # Every product resolves a context of its own
+    product_args = Namespace(**{**vars(args), "git_root": root, "context": None})
+    stdout, stderr = io.StringIO(), io.StringIO()
+    result = {"product": root, "status": ERROR, "configurations": []}
+    try:
+        with (
+            contextlib.redirect_stdout(stdout),
+            contextlib.redirect_stderr(stderr),
+            _Deadline(args.product_timeout) as deadline,
+        ):
+            result["status"], result["configurations"] = _rotate(product_args, deadline)
+    except ProductTimeoutError as e:
+        result["status"] = TIMEOUT
+        result["error"] = f"Timed out after {args.product_timeout}s"
+        if str(e):
+            result["error"] += f" - {e!s}"
+    except SystemExit:
+        result["error"] = stderr.getvalue().strip() or "Failed"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e!s}"
+    if args.verbose and stdout.getvalue():
+        result["output"] = stdout.getvalue()
+    return result
+
+
+def rotate_products(args=Namespace, roots=list, workers=int):
+    """Apply the event of lock --products to every product with a pool of worker processes
+
+    Args:
+        args (Namespace): The parsed command line arguments of lock --products
+        roots (list): The roots of the product repos
+        workers (int): The number of worker processes
+    Yields:
+        result (dict): The result of each product (see rotate_product), in the order of roots
+    """
+    import multiprocessing
+    from functools import partial
+
+    if not roots:
+        return
+    with multiprocessing.Pool(processes=min(workers, len(roots))) as pool:
+        yield from pool.imap(partial(rotate_product, args), roots)
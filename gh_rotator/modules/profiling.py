@@ -0,0 +1,169 @@
+import functools
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+# Set to 1 to print the timings of every run as a JSON line on stderr, or to a file to append it to
+PROFILE_ENV = "GH_ROTATOR_PROFILE"
+# Set to a file to dump the cProfile stats of every run to (read them with python -m pstats)
+CPROFILE_ENV = "GH_ROTATOR_CPROFILE"
+
+# Shared by all phases while profiling is off, so timing a phase costs next to nothing
+_OFF = nullcontext()
+
+# The profile of the running command - None while profiling is off
+_profile = None
+
+
+class _Phase:
+    """Times one phase of a command, adding its wall and CPU time to the profile"""
+
+    __slots__ = ("cpu", "name", "wall")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def __exit__(self, *_exc):
+        phase = _profile["phases"].setdefault(
+            self.name, {"calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0}
+        )
+        phase["calls"] += 1
+        phase["wall_ms"] += (time.perf_counter() - self.wall) * 1e3
+        phase["cpu_ms"] += (time.process_time() - self.cpu) * 1e3
+
+
+def phase(name=str):
+    """Time a phase of the running command, if it is profiled
+
+    Phases nest: the time of a phase includes the phases run inside it. A phase run more than
+    once adds up, its calls counted.
+
+    Args:
+        name (str): The name of the phase, like "config_load" or "save"
+    Returns:
+        context (context manager): Times what runs inside it
+    """
+    return _OFF if _profile is None else _Phase(name)
+
+
+def timed(name=str):
+    """Decorate a function to time each of its calls as a phase (see phase)"""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return function(*args, **kwargs)
+            with _Phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def settings(args):
+    """Where the profile of a command goes, from its arguments and the environment
+
+    Args:
+        args (Namespace): The parsed command line arguments (--profile, --profile-file, --cprofile)
+    Returns:
+        target (str): "-" for stderr, or the file to append the timings to (None if not profiled)
+        cprofile (str): The file to dump the cProfile stats to (None if not profiled)
+    """
+    target = getattr(args, "profile_file", None)
+    if target is None and getattr(args, "profile", False):
+        target = "-"
+    if target is None:
+        value = os.environ.get(PROFILE_ENV, "")
+        if value.lower() in ("1", "true", "yes"):
+            target = "-"
+        elif value and value.lower() not in ("0", "false", "no"):
+            target = value
+    cprofile = getattr(args, "cprofile", None) or os.environ.get(CPROFILE_ENV) or None
+    return target, cprofile
+
+
+def start(command=str, target=str, cprofile=None):
+    """Start profiling the command
+
+    Args:
+        command (str): The subcommand run
+        target (str): "-" for stderr, or the file to append the timings to (None for none)
+        cprofile (str, optional): The file to dump the cProfile stats to. Defaults to None.
+    """
+    global _profile
+
+    _profile = {
+        "command": command,
+        "target": target,
+        "cprofile": cprofile,
+        "started": time.time(),
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "phases": {},
+        "profiler": None,
+    }
+    if cprofile is not None:
+        import cProfile
+
+        _profile["profiler"] = cProfile.Profile()
+        _profile["profiler"].enable()
+
+
+def stop(exit_code=0):
+    """Stop profiling and write the profile of the command (nothing if it isn't profiled)
+
+    The timings are a single JSON line: the command, its exit code, when it started, its total
+    wall and CPU time and those of each of its phases (in ms).
+
+    Args:
+        exit_code (int, optional): The exit code of the command. Defaults to 0.
+    """
+    global _profile
+
+    profile, _profile = _profile, None
+    if profile is None:
+        return
+    wall_ms = (time.perf_counter() - profile["wall"]) * 1e3
+    cpu_ms = (time.process_time() - profile["cpu"]) * 1e3
+
+    if profile["profiler"] is not None:
+        profile["profiler"].disable()
+        profile["profiler"].dump_stats(profile["cprofile"])
+    if profile["target"] is None:
+        return
+
+    import json
+
+    from gh_rotator import __version__
+
+    record = {
+        "command": profile["command"],
+        "exit_code": exit_code,
+        "version": __version__,
+        "started": profile["started"],
+        "wall_ms": round(wall_ms, 3),
+        "cpu_ms": round(cpu_ms, 3),
+        "phases": {
+            name: {key: round(value, 3) for key, value in timings.items()}
+            for name, timings in profile["phases"].items()
+        },
+    }
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    if profile["target"] == "-":
+        sys.stderr.write(line)
+        return
+    try:
+        # One short append per run - lines of concurrent runs don't interleave
+        with open(profile["target"], "a") as f:
+            f.write(line)
+    except OSError as e:
+        print(
+            f"⛔️ Error: Failed to write the profile to {profile['target']}: {e!s}", file=sys.stderr
+        )
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+
+from gh_rotator.classes.repocontext import repo_context
+
+# Where the CLI finds a running daemon: a Unix socket path or http://127.0.0.1:<port>
+# (defaults to the socket in the repo's state directory)
+DAEMON_ENV = "GH_ROTATOR_DAEMON"
+# Set to make the CLI always run commands itself
+NO_DAEMON_ENV = "GH_ROTATOR_NO_DAEMON"
+SOCKET_NAME = "daemon.sock"
+# The token a daemon listening on a port requires - written to the state directory when it starts
+# (set GH_ROTATOR_DAEMON_TOKEN to talk to a daemon of another repo)
+TOKEN_ENV = "GH_ROTATOR_DAEMON_TOKEN"  # noqa: S105 - the name of the variable
+TOKEN_NAME = "daemon.token"  # noqa: S105 - the name of the file
+
+# The commands a daemon answers - all of them read the product config and manifests
+FORWARDED_COMMANDS = ("config", "manifest", "lock")
+# The arguments naming a file the daemon reads ('-' is our stdin, which the daemon can't read)
+FILE_ARGUMENTS = ("events_file", "repos_file")
+
+
+def default_socket(context):
+    """The Unix socket the daemon for the repo listens on, unless told otherwise"""
+    return os.path.join(context.get("state_dir"), SOCKET_NAME)
+
+
+def default_token_file(context):
+    """The file a daemon of the repo listening on a port keeps its token in"""
+    return os.path.join(context.get("state_dir"), TOKEN_NAME)
+
+
+def read_token(context):
+    """The token to send to a daemon listening on a port (None if there is none)"""
+    if os.environ.get(TOKEN_ENV):
+        return os.environ[TOKEN_ENV]
+    try:
+        with open(default_token_file(context), encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def forward(args):
+    """Run the command on a running daemon, if there is one
+
+    Args:
+        args (Namespace): The parsed command line arguments
+    Returns:
+        result (dict): The exit_code, stdout and stderr of the command (None if no daemon answered)
+    """
+    if os.environ.get(NO_DAEMON_ENV) or args.command not in FORWARDED_COMMANDS:
+        return None
+    # Committing runs git in the product repo of the caller - and may wait for concurrent runs.
+    # A daemon serves a single product repo, not the many of --products
+    if getattr(args, "commit", False) or getattr(args, "products", None) is not None:
+        return None
+    files = {name: getattr(args, name, None) for name in FILE_ARGUMENTS}
+    if "-" in files.values():
+        return None
+
+    # Kept on args, for the command to reuse if no daemon answers
+    context = repo_context(args)
+    address = os.environ.get(DAEMON_ENV) or default_socket(context)
+    if not address.startswith("http://") and not os.path.exists(address):
+        return None
+
+    # The HTTP client is only imported once there is a daemon to talk to, most runs have none
+    from gh_rotator.modules.rotator_transport import request
+
+    payload = {**vars(args), "git_root": context.get("git_root")}
+    del payload["context"]
+    for name, file in files.items():
+        if file is not None:
+            payload[name] = os.path.realpath(file)
+
+    token = read_token(context) if address.startswith("http://") else None
+    try:
+        return request(address, "POST", "/run", payload, token=token)
+    except (OSError, ValueError):
+        # No daemon (or a stale socket) - the CLI runs the command itself
+        return None
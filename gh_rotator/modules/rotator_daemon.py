@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import contextlib
+import hmac
+import io
+import json
+import os
+import secrets
+import signal
+import socketserver
+import sys
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import repo_context
+from gh_rotator.modules.rotator_client import (
+    FORWARDED_COMMANDS,
+    default_socket,
+    default_token_file,
+)
+from gh_rotator.modules.rotator_handlers import COMMAND_HANDLERS
+from gh_rotator.modules.rotator_transport import request
+
+
+def _mtime(path):
+    try:
+        return Path(path).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class ProductCache:
+    """The product configs and manifests loaded by the daemon, kept until their files change"""
+
+    def __init__(self):
+        # (git_root, config_file) -> (config, mtime of the config file)
+        self.configs = {}
+        # (git_root, config_file, manifest_dir) -> (manifest, the config it was loaded with)
+        self.manifests = {}
+
+    def load_config(self, args):
+        """Get the product config for the args - reloaded if the config file changed"""
+        key = (args.git_root, args.config_file)
+        if key in self.configs:
+            config, mtime = self.configs[key]
+            if _mtime(config.get("config_file")) == mtime:
+                return config
+
+        config = ProductConfig(file=args.config_file, context=repo_context(args))
+        # A change while loading makes the mtimes differ, and the config is loaded again next time
+        self.configs[key] = (config, _mtime(config.get("config_file")))
+        return config
+
+    def load_manifest(self, args, config):
+        """Get the product manifests for the args - reloading the files that changed on disk"""
+        key = (args.git_root, args.config_file, args.manifest_dir)
+        if key in self.manifests and self.manifests[key][1] is config:
+            manifest = self.manifests[key][0]
+            manifest.refresh()
+        else:
+            manifest = ProductManifest(config, directory=args.manifest_dir)
+            self.manifests[key] = (manifest, config)
+
+        if getattr(args, "lock_timeout", None) is not None:
+            manifest.set("lock_timeout", args.lock_timeout)
+        return manifest
+
+    def forget(self, args):
+        """Drop whatever was loaded for the args, so the next request starts from the files"""
+        self.configs.pop((args.git_root, args.config_file), None)
+        self.manifests.pop((args.git_root, args.config_file, args.manifest_dir), None)
+
+    def run(self, payload):
+        """Run a command the same way the CLI would, but with the cached config and manifests
+
+        Args:
+            payload (dict): The parsed command line arguments of the command
+        Returns:
+            result (dict): The exit_code, stdout and stderr of the command
+        """
+        args = Namespace(**payload)
+        if args.command not in FORWARDED_COMMANDS:
+            return {"exit_code": 2, "stdout": "", "stderr": f"Cannot run '{args.command}'\n"}
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exit_code = 0
+        # What was loaded stays valid when a lookup finds nothing - only a lock that failed half
+        # way or an unexpected error may have left it out of step with the files
+        stale = False
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                COMMAND_HANDLERS[args.command](
+                    args, load_config=self.load_config, load_manifest=self.load_manifest
+                )
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+                stale = exit_code != 0 and args.command == "lock"
+            except Exception as e:  # a failing command must not take the daemon down
+                print(f"⛔️ Error: {e!s}", file=sys.stderr)
+                exit_code = 1
+                stale = True
+
+        if stale:
+            self.forget(args)
+        return {"exit_code": exit_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """POST /run runs a command (JSON arguments in, JSON result out), GET /health is a ping
+
+    A command is only run for the repo the daemon serves (server.root), and on a port only with
+    the token of the daemon (server.token) - anything else is refused with 403.
+    """
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        self.__respond({"status": "ok", "pid": os.getpid()})
+
+    def do_POST(self):
+        if self.path != "/run":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+        except (ValueError, json.JSONDecodeError):
+            self.send_error(400)
+            return
+        if not self.__authorized() or not isinstance(payload, dict):
+            self.send_error(403)
+            return
+        if os.path.realpath(str(payload.get("git_root"))) != self.server.root:
+            self.send_error(403)
+            return
+        self.__respond(self.server.cache.run(payload))
+
+    def __authorized(self):
+        token = getattr(self.server, "token", None)
+        if token is None:
+            return True
+        return hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}")
+
+    def __respond(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        # Keep the daemon quiet
+        pass
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """HTTP over a Unix domain socket"""
+
+    def get_request(self):
+        connection, _address = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return connection, ("unix", 0)
+
+
+def serve(args):
+    """Run the daemon until it is interrupted or terminated
+
+    The product config and all manifests of the repo are loaded up front. Requests for other
+    config files or manifest directories of the repo are loaded (and cached) on first use,
+    requests for other repos are refused. On a port, where any local user could connect, a
+    request must also carry the token written (owner only) to the state directory.
+    """
+    context = repo_context(args)
+    args.git_root = context.get("git_root")
+    cache = ProductCache()
+
+    # Load everything once, up front
+    config = cache.load_config(args)
+    manifest = cache.load_manifest(args, config)
+    for configuration in config.get("config"):
+        manifest.get(f"{configuration}_index")
+
+    socket_path = None
+    token_file = None
+    if args.port is not None:
+        server = HTTPServer(("127.0.0.1", args.port), RequestHandler)
+        address = f"http://127.0.0.1:{server.server_port}"
+        server.token = secrets.token_urlsafe(32)
+        token_file = Path(default_token_file(context))
+        token_file.parent.mkdir(parents=True, exist_ok=True)
+        token_file.unlink(missing_ok=True)
+        # Only the owner may read the token
+        with os.fdopen(os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+            f.write(server.token)
+    else:
+        socket_path = args.socket or default_socket(context)
+        address = socket_path
+        with contextlib.suppress(OSError):
+            if request(socket_path, "GET", "/health") is not None:
+                print(f"⛔️ Error: A daemon is already listening on {socket_path}", file=sys.stderr)
+                sys.exit(1)
+        Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+        Path(socket_path).unlink(missing_ok=True)
+        # Only the owner may talk to the daemon
+        umask = os.umask(0o177)
+        try:
+            server = UnixHTTPServer(socket_path, RequestHandler)
+        finally:
+            os.umask(umask)
+
+    server.cache = cache
+    server.root = os.path.realpath(args.git_root)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if args.verbose:
+        print(f"Serving {context.get('git_root')} on {address}", file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None:
+            Path(socket_path).unlink(missing_ok=True)
+        if token_file is not None:
+            token_file.unlink(missing_ok=True)
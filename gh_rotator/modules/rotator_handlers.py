@@ -1,24 +1,376 @@
 #!/usr/bin/env python3
 
 import json
+import os
 import sys
+from contextlib import nullcontext
 
-from gh_rotator.classes.productconfig import ProductConfig
-from gh_rotator.classes.productmanifest import ProductManifest
+# The modules a command needs are imported by the handler (or loader) of that command only,
+# the CLI is called in tight loops and every import adds to the startup time of every call
 
+EVENT_KEYS = ("repo", "event_type", "event_name", "sha")
+CONFIG_EVENT_KEYS = ("repo", "event_type", "event_name")
 
-def handle_lock(args):
+
+def load_config(args):
+    """Load the product config, resolving the git repo root once for the whole command"""
+    from gh_rotator.classes.productconfig import ProductConfig
+    from gh_rotator.classes.repocontext import repo_context
+
+    return ProductConfig(file=args.config_file, context=repo_context(args))
+
+
+def load_manifest(args, config):
+    """Load the product manifests, sharing the git repo root already resolved by the config"""
+    from gh_rotator.classes.productmanifest import ProductManifest
+
+    return ProductManifest(
+        config, directory=args.manifest_dir, lock_timeout=getattr(args, "lock_timeout", None)
+    )
+
+
+def read_events(events_file, keys=EVENT_KEYS):
+    """Read rotation events from a JSON Lines file ('-' reads from stdin)
+
+    Args:
+        events_file (str): The path to the file with one JSON object per line
+        keys (tuple, optional): The keys every event must have. Defaults to EVENT_KEYS.
+    Yields:
+        event (dict): The parsed event (None for a line that isn't a valid event)
+    """
+    with open(events_file) if events_file != "-" else nullcontext(sys.stdin) as stream:
+        for raw in stream:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+                continue
+            if not isinstance(event, dict) or not all(
+                isinstance(event.get(key), str) for key in keys
+            ):
+                yield None
+                continue
+            yield {key: event[key] for key in keys}
+
+
+def check_events_file(events_file):
+    """Exit with an error if the events file doesn't exist"""
+    if events_file != "-" and not os.path.isfile(events_file):
+        print(f"⛔️ Error: Events file '{events_file}' not found", file=sys.stderr)
+        sys.exit(1)
+
+
+def commit_rotations(args, manifest, configurations):
+    """Commit the rotations of the given configurations straight to the branch (lock --commit)
+
+    Returns:
+        commit (str): The sha of the commit (None if the rotations change nothing on the branch)
+    """
+    from gh_rotator.classes.productmanifest import DEFAULT_COMMIT_RETRIES
+
+    return manifest.commit(
+        configurations,
+        branch=args.branch,
+        remote=args.remote,
+        retries=DEFAULT_COMMIT_RETRIES if args.commit_retries is None else args.commit_retries,
+        verbose=args.verbose,
+    )
+
+
+def commit_coalesced(args, manifest, configurations):
+    """Commit the rotations together with those of the runs queued within the --coalesce window
+
+    See commitqueue: every run waits for the window after queueing its rotations, the first to get
+    the queue then commits all rotations queued by then, the runs queued meanwhile pick up its
+    commit. Rotations of a configuration this run's config doesn't have (queued by a run with
+    another config) are left queued for their own run to commit.
+
+    Returns:
+        commit (str): The sha of the commit holding the rotations (None if they change nothing)
+    """
+    import time
+
+    from gh_rotator.modules import commitqueue
+    from gh_rotator.modules.fileio import file_lock
+
+    queue = os.path.join(manifest.get("context").get("state_dir"), "commit-queue")
+    name = commitqueue.enqueue(
+        queue,
+        {
+            configuration: manifest.get(f"{configuration}_pending")
+            for configuration in configurations
+        },
+    )
+    try:
+        # The window is waited out before taking the lock, not while holding it: the runs queued
+        # meanwhile would otherwise wait for the lock as long as the window, and time out on it
+        time.sleep(args.coalesce)
+        with file_lock(os.path.join(queue, "queue.lock"), timeout=manifest.get("lock_timeout")):
+            result = commitqueue.result(queue, name)
+            if result is not None:
+                return result["commit"]
+
+            # A run picks up its result within the window and the lock timeout - or never will
+            known = manifest.get("config").get("config")
+            queued = [
+                (queued_name, rotations)
+                for queued_name, rotations in commitqueue.take(
+                    queue, max_age=args.coalesce + manifest.get("lock_timeout")
+                )
+                if all(configuration in known for configuration in rotations)
+            ]
+            for configuration in configurations:
+                manifest.get(f"{configuration}_pending").clear()
+            for _name, rotations in queued:
+                for configuration, updates in rotations.items():
+                    manifest.get(f"{configuration}_pending").extend(updates)
+            commit = commit_rotations(
+                args,
+                manifest,
+                list(dict.fromkeys(c for _name, rotations in queued for c in rotations)),
+            )
+            # This run needs no result of its own - its rotations are discarded below
+            others = [queued_name for queued_name, _rotations in queued if queued_name != name]
+            commitqueue.resolve(queue, others, {"commit": commit})
+            return commit
+    except TimeoutError:
+        print(
+            f"⛔️ Error: Timed out after {manifest.get('lock_timeout')}s waiting for the commit queue",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    finally:
+        # A run that failed leaves the rotations of the others queued, for the next run to commit
+        commitqueue.discard(queue, name)
+
+
+def write_rotations(args, manifest, configurations):
+    """Write the rotated manifests of the given configurations - to their files, or with --commit
+    straight into a commit on the branch
+
+    Returns:
+        changed (dict): For each configuration, whether its manifest was written (or committed)
+    """
+    if not getattr(args, "commit", False):
+        return {
+            configuration: manifest.save(configuration, args.verbose)
+            for configuration in configurations
+        }
+    if args.coalesce:
+        commit = commit_coalesced(args, manifest, configurations)
+    else:
+        commit = commit_rotations(args, manifest, configurations)
+    return dict.fromkeys(configurations, commit is not None)
+
+
+def lock_events(args, config, manifest):
+    """Apply many rotation events in one process, writing each touched manifest once
+
+    Prints one JSON line per event with the result and exits non-zero if any event failed
+    """
+    check_events_file(args.events_file)
+
+    all_matches = getattr(args, "all_matches", False)
+    results = []
+    touched = {}
+    for event in read_events(args.events_file):
+        if event is None:
+            results.append({"status": "invalid"})
+            continue
+
+        if all_matches:
+            configurations = config.find_config_names(
+                event["repo"], event["event_name"], event["event_type"]
+            )
+            found = {"configurations": configurations}
+        else:
+            configuration = config.find_config_name(
+                event["repo"], event["event_name"], event["event_type"]
+            )
+            configurations = [] if configuration is None else [configuration]
+            found = {"configuration": configuration}
+        if not configurations:
+            results.append({**event, **found, "status": "no-match"})
+            continue
+
+        if all_matches:
+            manifest.rotate_all(**event, verbose=args.verbose, save=False)
+        else:
+            manifest.rotate(**event, verbose=args.verbose, save=False)
+        touched.update(dict.fromkeys(configurations, True))
+        results.append({**event, **found, "status": "rotated"})
+
+    write_rotations(args, manifest, list(touched))
+
+    for result in results:
+        print(json.dumps(result))
+
+    sys.exit(0 if all(result["status"] == "rotated" for result in results) else 1)
+
+
+def read_repos(args):
+    """Collect the repos given with --repos and --repos-file, in order and without duplicates
+
+    Returns:
+        repos (list): The repos to look up (None if neither was given)
+    """
+    if args.repos is None and args.repos_file is None:
+        return None
+
+    repos = [repo.strip() for repo in (args.repos or "").split(",")]
+    if args.repos_file is not None:
+        if args.repos_file != "-" and not os.path.isfile(args.repos_file):
+            print(f"⛔️ Error: Repos file '{args.repos_file}' not found", file=sys.stderr)
+            sys.exit(1)
+        with open(args.repos_file) if args.repos_file != "-" else nullcontext(sys.stdin) as stream:
+            repos += [line.strip() for line in stream if not line.lstrip().startswith("#")]
+    return list(dict.fromkeys(repo for repo in repos if repo))
+
+
+def env_key(configuration, repo):
+    """The shell variable name for the version of a repo in a configuration"""
+    import re
+
+    return re.sub(r"[^A-Za-z0-9]", "_", f"{configuration}_{repo}").upper()
+
+
+def manifest_versions(args, config, manifest):
+    """Print the versions of many repos, in one or all configurations, from a single load
+
+    A repo that isn't in a manifest is reported on stderr, and the command exits non-zero after
+    printing all the versions that were found
+    """
+    configurations = list(config.get("config")) if args.all_configurations else [args.configuration]
+    repos = [args.repo] if args.repo else read_repos(args)
+    output_format = args.output_format or "json"
+
+    versions = {}
+    for configuration in configurations:
+        try:
+            versions[configuration] = manifest.find_versions(configuration, repos, at=args.at)
+        except AssertionError:
+            print(
+                f"⛔️ Error: No manifest exists for configuration '{configuration}'.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    missing = 0
+    for configuration, found in versions.items():
+        for repo, version in found.items():
+            if version is None:
+                missing += 1
+                print(
+                    f"⛔️ Error: Repository {repo} not found in configuration {configuration}",
+                    file=sys.stderr,
+                )
+            elif output_format == "tsv":
+                print(f"{configuration}\t{repo}\t{version}")
+            elif output_format == "env":
+                print(f"{env_key(configuration, repo)}={version}")
+
+    if output_format == "json":
+        print(json.dumps(versions, indent=4))
+    sys.exit(1 if missing else 0)
+
+
+def manifest_at(args, manifest):
+    """Print the manifest, or the version of a repo in it, at a point in the manifest history"""
+    try:
+        manifest_data = manifest.get_manifest_at(args.configuration, args.at)
+    except AssertionError:
+        print(
+            f"⛔️ Error: No manifest exists for configuration '{args.configuration}'.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    if not args.repo:
+        print(json.dumps(manifest_data, indent=4))
+        sys.exit(0)
+
+    for entry in manifest_data[args.configuration]:
+        if entry["repo"] == args.repo:
+            print(f"{entry['version']}")
+            sys.exit(0)
+
+    print(
+        f"⛔️ Error: Repository {args.repo} not found in configuration {args.configuration} at {args.at}",
+        file=sys.stderr,
+    )
+    sys.exit(1)
+
+
+def lock_products(args):
+    """Apply the event to every product listed in the --products file, in a pool of processes
+
+    Prints one JSON line per product with the result, in the order of the file, and a summary on
+    stderr. Exits non-zero if any product failed or timed out - not for products without a
+    matching rule, whose manifests are left alone
+    """
+    from gh_rotator.modules import multiproduct
+
+    if args.products != "-" and not os.path.isfile(args.products):
+        print(f"⛔️ Error: Products file '{args.products}' not found", file=sys.stderr)
+        sys.exit(1)
+    roots = multiproduct.read_products(args.products)
+    workers = args.workers or multiproduct.default_workers(len(roots))
+
+    statuses = {}
+    for result in multiproduct.rotate_products(args, roots, workers):
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        print(json.dumps(result), flush=True)
+
+    summary = ", ".join(f"{count} {status}" for status, count in statuses.items())
+    print(f"{len(roots)} product(s){': ' if summary else ''}{summary}", file=sys.stderr)
+    sys.exit(1 if any(status in multiproduct.FAILED for status in statuses) else 0)
+
+
+def handle_lock(args, load_config=load_config, load_manifest=load_manifest):
     """Handle the lock command to generate a manifest"""
+    if getattr(args, "products", None) is not None:
+        lock_products(args)
+
     # Generate the manifest
-    config = ProductConfig(file=args.config_file)
-    manifest = ProductManifest(config, directory=args.manifest_dir)
+    config = load_config(args)
+    manifest = load_manifest(args, config)
+
+    if args.events_file is not None:
+        lock_events(args, config, manifest)
+
+    # With --commit the manifests are not saved, but committed once rotated
+    commit = getattr(args, "commit", False)
+
+    if getattr(args, "all_matches", False):
+        changed = manifest.rotate_all(
+            repo=args.repo,
+            sha=args.sha,
+            event_type=args.event_type,
+            event_name=args.event_name,
+            verbose=args.verbose,
+            save=not commit,
+        )
+        if commit:
+            changed = write_rotations(args, manifest, list(changed))
+        # Report the configurations whose manifest changed, one per line
+        for configuration, written in changed.items():
+            if written:
+                print(configuration)
+        sys.exit(0)
+
     result = manifest.rotate(
         repo=args.repo,
         sha=args.sha,
         event_type=args.event_type,
         event_name=args.event_name,
         verbose=args.verbose,
+        save=not commit,
     )
+    if result and commit:
+        write_rotations(args, manifest, [result])
 
     if result:
         sys.exit(0)
@@ -27,10 +379,16 @@ def handle_lock(args):
         sys.exit(1)
 
 
-def handle_manifest(args):
+def handle_manifest(args, load_config=load_config, load_manifest=load_manifest):
     """Handle the manifest command to get configuration manifest"""
-    config = ProductConfig(file=args.config_file)
-    manifest = ProductManifest(config, directory=args.manifest_dir)
+    config = load_config(args)
+    manifest = load_manifest(args, config)
+
+    if args.all_configurations or args.output_format or args.repos or args.repos_file:
+        manifest_versions(args, config, manifest)
+
+    if args.at is not None:
+        manifest_at(args, manifest)
 
     if args.repo is None or args.repo == "":
         try:
@@ -52,10 +410,36 @@ def handle_manifest(args):
         sys.exit(0)
 
 
-def handle_config(args):
+def config_events(args, config):
+    """Classify many events in one process, streaming one JSON line out for every event read
+
+    Exits non-zero if any event didn't match a configuration
+    """
+    check_events_file(args.events_file)
+
+    matched = True
+    for event, configuration in config.resolve_many(
+        read_events(args.events_file, CONFIG_EVENT_KEYS)
+    ):
+        if event is None:
+            result = {"status": "invalid"}
+        else:
+            status = "no-match" if configuration is None else "matched"
+            result = {**event, "configuration": configuration, "status": status}
+        matched = matched and result["status"] == "matched"
+        print(json.dumps(result))
+
+    sys.exit(0 if matched else 1)
+
+
+def handle_config(args, load_config=load_config, **_loaders):
     """Handle the config command to get configuration name"""
     # Get the configuration name
-    config = ProductConfig(file=args.config_file)
+    config = load_config(args)
+
+    if args.events_file is not None:
+        config_events(args, config)
+
     configuration = config.get_config_name(
         repo=args.repo, event_name=args.event_name, event_type=args.event_type, verbose=args.verbose
     )
@@ -63,9 +447,153 @@ def handle_config(args):
     sys.exit(0)
 
 
+def handle_check(args):
+    """Handle the check command to validate the config and analyse its rules"""
+    from gh_rotator.classes.productconfig import ProductConfig
+    from gh_rotator.classes.repocontext import repo_context
+    from gh_rotator.modules import configcheck
+
+    # The config is found like for every other command, but not loaded - it may well be broken
+    config_file = ProductConfig(file=args.config_file, context=repo_context(args), load=False).get(
+        "config_file"
+    )
+    try:
+        with open(config_file, "rb") as f:
+            config = json.load(f)
+    except ValueError as e:
+        findings = [
+            configcheck.finding("error", "schema", message=f"The config is not valid JSON: {e!s}")
+        ]
+    else:
+        findings = configcheck.check(config, count=args.samples, budget=args.budget_ms / 1e3)
+
+    for found in findings:
+        if args.output_format == "json":
+            print(json.dumps(found))
+        else:
+            icon = "⛔️" if found["level"] == "error" else "⚠️"
+            print(f"{icon} {found['level'].capitalize()}: {configcheck.describe(found)}")
+
+    errors = sum(found["level"] == "error" for found in findings)
+    warnings = len(findings) - errors
+    if args.output_format != "json":
+        print(f"{config_file}: {errors} error(s), {warnings} warning(s)")
+    sys.exit(1 if errors or (args.strict and warnings) else 0)
+
+
+def check_configuration(manifest, configuration):
+    """Exit with an error if the configuration isn't in the config"""
+    if f"{configuration}_file" not in manifest.props:
+        print(
+            f"⛔️ Error: There is no configuration '{configuration}' in the config", file=sys.stderr
+        )
+        sys.exit(1)
+
+
+def diff_source(manifest, source):
+    """The entries of the manifest a diff source names: configuration[@revision]
+
+    Without a revision, the manifest in the work tree is read - with one, the manifest in that
+    git revision (see ProductManifest.get_manifest_in)
+    """
+    configuration, _at, revision = source.partition("@")
+    check_configuration(manifest, configuration)
+    if revision:
+        return manifest.get_manifest_in(configuration, revision)[configuration]
+    return manifest.get(f"{configuration}_manifest").get(configuration, [])
+
+
+def handle_diff(args, load_config=load_config, load_manifest=load_manifest):
+    """Handle the diff command to compare the manifests of two configurations or revisions"""
+    from gh_rotator.modules import manifestdiff
+
+    config = load_config(args)
+    manifest = load_manifest(args, config)
+
+    changes = manifestdiff.diff(
+        diff_source(manifest, args.from_source), diff_source(manifest, args.to_source)
+    )
+    if args.output_format == "table":
+        for line in manifestdiff.table(changes):
+            print(line)
+    else:
+        print(json.dumps({"from": args.from_source, "to": args.to_source, **changes}, indent=4))
+
+    different = changes["added"] or changes["removed"] or changes["changed"]
+    sys.exit(1 if args.exit_code and different else 0)
+
+
+def handle_promote(args, load_config=load_config, load_manifest=load_manifest):
+    """Handle the promote command to copy versions from one configuration to another
+
+    Prints one JSON line per promoted repo with its version and whether the target changed
+    """
+    config = load_config(args)
+    manifest = load_manifest(args, config)
+    for configuration in (args.from_configuration, args.to_configuration):
+        check_configuration(manifest, configuration)
+
+    promoted = manifest.promote(
+        args.from_configuration,
+        args.to_configuration,
+        repos=read_repos(args),
+        verbose=args.verbose,
+        save=not args.dry_run,
+    )
+    # A promoted repo has the version it has in the source (a dry run leaves the target as it was)
+    versions = manifest.get(f"{args.from_configuration}_index")
+    for repo, result in promoted.items():
+        print(json.dumps({"repo": repo, "version": versions[repo]["version"], "status": result}))
+    sys.exit(0)
+
+
+def handle_migrate(args, load_config=load_config, load_manifest=load_manifest):
+    """Handle the migrate command to move manifests to another layout or format"""
+    config = load_config(args)
+    manifest = load_manifest(args, config)
+
+    if args.all_configurations:
+        configurations = list(config.get("config"))
+    elif args.configuration in config.get("config"):
+        configurations = [args.configuration]
+    else:
+        print(
+            f"⛔️ Error: No manifest exists for configuration '{args.configuration}'.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    for configuration in configurations:
+        migrated = manifest.migrate(
+            configuration,
+            layout=args.layout,
+            shard_by=args.shard_by,
+            manifest_format=args.manifest_format,
+            verbose=args.verbose,
+        )
+        if not migrated and args.verbose:
+            print(f"The {configuration} manifest is already stored as asked.")
+    sys.exit(0)
+
+
+def handle_serve(args):
+    """Handle the serve command to run the rotator as a long-running daemon"""
+    # Imported here, so the other commands never pay for the server machinery
+    from gh_rotator.modules.rotator_daemon import serve
+
+    serve(args)
+
+
 # Command handler mapping - exported for use by main
+# The handlers of the commands that read the product config and manifests accept the functions
+# that load them as keyword arguments, so the daemon can serve them from its cache
 COMMAND_HANDLERS = {
     "lock": handle_lock,
     "manifest": handle_manifest,
     "config": handle_config,
+    "check": handle_check,
+    "diff": handle_diff,
+    "promote": handle_promote,
+    "migrate": handle_migrate,
+    "serve": handle_serve,
 }
@@ -1,130 +1,622 @@
 #!/usr/bin/env python3
 
 import argparse
+import sys
 
+# Options of the top level parser that take a value - the word after them is never the command
+VALUE_OPTIONS = ("--config-file", "--git-root", "--manifest-dir", "--profile-file", "--cprofile")
 
-def rotator_parse(args=None):
-    """Parse command line arguments for the rotator tool."""
-    # Define the parent parser with the --verbose argument
-    parent_parser = argparse.ArgumentParser(add_help=False)
-    parent_parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose output")
-    parent_parser.add_argument(
-        "--config-file",
-        type=str,
-        dest="config_file",
-        help="The path to the config file",
-        default=None,
-    )
-
-    mainfestdir_parser = argparse.ArgumentParser(add_help=False)
-    mainfestdir_parser.add_argument(
-        "--manifest-dir",
-        type=str,
-        dest="manifest_dir",
-        help="The directory to save the manifest file",
-        default="configurations",
-    )
-
-    # Define command-line arguments
-    parser = argparse.ArgumentParser(
-        prog="rotator",
-        parents=[parent_parser, mainfestdir_parser],
-        description="""   
-            A command-line tool designed as a helper utility to the rotator.yml workflow.  
-            """,
-    )
 
-    subparsers = parser.add_subparsers(dest="command")
-
-    # Manifest subcommand
-    lock_parser = subparsers.add_parser(
-        "lock",
-        parents=[parent_parser, mainfestdir_parser],
-        help="Lock a manifest file for the derived configuration",
-        description="""
-            Designed to take the same parameters as the rotator.yml accepts in the dispatch. (see the templates directory in this repo)
-            Simply pass the parameters recived forward to manifest subcommand and it will generate a manifest file.
-            """,
-    )
-    lock_parser.add_argument(
+def _add_lock_arguments(parser):
+    parser.add_argument(
         "--repo",
         type=str,
         help="The fully qualified name (owner/repo) of the repo that fired the event",
-        required=True,
     )
-    lock_parser.add_argument(
+    parser.add_argument(
         "--event-type",
         type=str,
         choices=["branch", "tag"],
         dest="event_type",
         help="Event type that triggered the run (branch|tag)",
-        required=True,
     )
-    lock_parser.add_argument(
+    parser.add_argument(
         "--event-name",
         type=str,
         dest="event_name",
         help="Event name that triggered the run (branch or tag name)",
-        required=True,
     )
-    lock_parser.add_argument(
+    parser.add_argument(
         "--sha",
         type=str,
         help="The SHA1 of the commit that triggered the run",
-        required=True,
     )
-
-    # manifest subcommand
-    manifest_parser = subparsers.add_parser(
-        "manifest",
-        parents=[parent_parser, mainfestdir_parser],
-        help="Get the manifest of a given configuration",
-        description="""
-            Designed to easily return the manifest of a repo from a specific manifest
-            """,
+    parser.add_argument(
+        "--lock-timeout",
+        type=float,
+        dest="lock_timeout",
+        help="Seconds to wait for the lock on a manifest held by a concurrent run (default: $GH_ROTATOR_LOCK_TIMEOUT or 60)",
+        default=None,
+    )
+    parser.add_argument(
+        "--events-file",
+        type=str,
+        dest="events_file",
+        help="Apply many events in one run: a JSON Lines file with one {repo, event_type, event_name, sha} object per line ('-' reads from stdin)",
+        default=None,
+    )
+    parser.add_argument(
+        "--all-matches",
+        action="store_true",
+        dest="all_matches",
+        help="Rotate every configuration with a rule matching the event, not just the first, and print the configurations whose manifest changed",
+    )
+    parser.add_argument(
+        "--commit",
+        action="store_true",
+        help="Commit the rotated manifests straight to the branch with git plumbing, leaving the index and work tree alone",
+    )
+    parser.add_argument(
+        "--branch",
+        type=str,
+        help="With --commit: the branch to commit to (default: the branch checked out - which needs --remote, as moving it would leave the index and work tree behind)",
+        default=None,
+    )
+    parser.add_argument(
+        "--remote",
+        type=str,
+        help="With --commit: fetch the branch from this remote and push the commit to it, rebuilding the commit when the branch moved on",
+        default=None,
+    )
+    parser.add_argument(
+        "--commit-retries",
+        type=int,
+        dest="commit_retries",
+        help="With --commit: how often to rebuild the commit on a branch that moved on (default: 5)",
+        default=None,
     )
-    manifest_parser.add_argument(
+    parser.add_argument(
+        "--coalesce",
+        type=float,
+        help="With --commit: wait this many seconds for concurrent runs in the repo, and commit their rotations together",
+        default=None,
+    )
+    parser.add_argument(
+        "--products",
+        type=str,
+        help="Apply the event to many product repos: a file with the root of one product repo per line ('-' reads from stdin), each with its own config and manifests",
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="With --products: the number of products rotated in parallel, each in its own process (default: the number of CPUs)",
+        default=None,
+    )
+    parser.add_argument(
+        "--product-timeout",
+        type=float,
+        dest="product_timeout",
+        help="With --products: the seconds a product may take before it is given up and reported as timed out (default: no limit)",
+        default=None,
+    )
+
+
+def _add_manifest_arguments(parser):
+    parser.add_argument(
         "--repo",
         type=str,
         help="The fully qualified name (owner/repo) of the repo to look up",
         default=None,
     )
-    manifest_parser.add_argument(
+    configurations = parser.add_mutually_exclusive_group(required=True)
+    configurations.add_argument(
         "--configuration",
         type=str,
         help="The configuration to query the manifest for",
-        required=True,
     )
-
-    # config subcommand
-    config_parser = subparsers.add_parser(
-        "config",
-        parents=[parent_parser],
-        help="Get the configuration",
-        description="""
-            Designed to easily return the configuration name from context
-            """,
+    configurations.add_argument(
+        "--all-configurations",
+        action="store_true",
+        dest="all_configurations",
+        help="Query the manifests of all configurations",
     )
-    config_parser.add_argument(
+    parser.add_argument(
+        "--repos",
+        type=str,
+        help="Look up many repos in one run: a comma separated list of repos",
+        default=None,
+    )
+    parser.add_argument(
+        "--repos-file",
+        type=str,
+        dest="repos_file",
+        help="Look up many repos in one run: a file with one repo per line ('-' reads from stdin)",
+        default=None,
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["json", "tsv", "env"],
+        dest="output_format",
+        help="The output of a lookup of many repos or configurations: JSON, tab separated configuration, repo and version, or KEY=version lines for $GITHUB_ENV (default: json)",
+        default=None,
+    )
+    parser.add_argument(
+        "--at",
+        type=str,
+        help="Rebuild the manifest from its history as it was at an event number (as in history/events.jsonl) or an ISO 8601 timestamp",
+        default=None,
+    )
+
+
+def _add_config_arguments(parser):
+    parser.add_argument(
         "--repo",
         type=str,
         help="The fully qualified name (owner/repo) of the repo to look up",
         default=None,
     )
-    config_parser.add_argument(
+    parser.add_argument(
         "--event-type",
         type=str,
         choices=["branch", "tag"],
         dest="event_type",
         help="Event type that triggered the run (branch|tag)",
-        required=True,
     )
-    config_parser.add_argument(
+    parser.add_argument(
         "--event-name",
         type=str,
         dest="event_name",
         help="Event name that triggered the run (branch or tag name)",
+    )
+    parser.add_argument(
+        "--events-file",
+        type=str,
+        dest="events_file",
+        help="Classify many events in one run: a JSON Lines file with one {repo, event_type, event_name} object per line ('-' reads from stdin), one JSON line is printed per event",
+        default=None,
+    )
+
+
+def _add_check_arguments(parser):
+    parser.add_argument(
+        "--samples",
+        type=int,
+        help="The events sampled per rule to find shadowed and overlapping rules (default: 16)",
+        default=16,
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        dest="budget_ms",
+        help="The time a pattern may take to fail on a pumped input before it is reported as backtracking catastrophically (default: 10)",
+        default=10.0,
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["text", "json"],
+        dest="output_format",
+        help="Print the findings as text, or as one JSON object per line (default: text)",
+        default="text",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Exit non-zero on warnings (shadowed and overlapping rules) too, not just on errors",
+    )
+
+
+def _add_diff_arguments(parser):
+    parser.add_argument(
+        "--from",
+        type=str,
+        dest="from_source",
+        required=True,
+        help="The manifest to compare from: a configuration, or configuration@revision for its manifest in a git revision (prod@HEAD~1, prod@v1.2)",
+    )
+    parser.add_argument(
+        "--to",
+        type=str,
+        dest="to_source",
+        required=True,
+        help="The manifest to compare to: a configuration, or configuration@revision",
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["json", "table"],
+        dest="output_format",
+        help="Print the added, removed and changed repos as JSON, or as a table (default: json)",
+        default="json",
+    )
+    parser.add_argument(
+        "--exit-code",
+        action="store_true",
+        dest="exit_code",
+        help="Exit non-zero if the manifests differ",
+    )
+
+
+def _add_promote_arguments(parser):
+    parser.add_argument(
+        "--from",
+        type=str,
+        dest="from_configuration",
+        required=True,
+        help="The configuration to promote the versions from",
+    )
+    parser.add_argument(
+        "--to",
+        type=str,
+        dest="to_configuration",
         required=True,
+        help="The configuration to promote the versions to",
+    )
+    parser.add_argument(
+        "--repos",
+        type=str,
+        help="The repos to promote: a comma separated list of repos (default: all repos in the --from manifest)",
+        default=None,
+    )
+    parser.add_argument(
+        "--repos-file",
+        type=str,
+        dest="repos_file",
+        help="The repos to promote: a file with one repo per line ('-' reads from stdin)",
+        default=None,
+    )
+    parser.add_argument(
+        "--lock-timeout",
+        type=float,
+        dest="lock_timeout",
+        help="Seconds to wait for the lock on a manifest held by a concurrent run (default: $GH_ROTATOR_LOCK_TIMEOUT or 60)",
+        default=None,
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        dest="dry_run",
+        help="Check and report what would be promoted without writing the manifest",
+    )
+
+
+def _add_migrate_arguments(parser):
+    configurations = parser.add_mutually_exclusive_group(required=True)
+    configurations.add_argument(
+        "--configuration",
+        type=str,
+        help="The configuration to migrate the manifest of",
+    )
+    configurations.add_argument(
+        "--all-configurations",
+        action="store_true",
+        dest="all_configurations",
+        help="Migrate the manifests of all configurations",
+    )
+    parser.add_argument(
+        "--layout",
+        type=str,
+        choices=["flat", "sharded"],
+        help="One manifest file per configuration (flat), or one small file per shard of repos and an index (sharded)",
+        default=None,
+    )
+    parser.add_argument(
+        "--shard-by",
+        type=str,
+        choices=["hash", "owner"],
+        dest="shard_by",
+        help="How repos are sharded: by a hash of their name (up to 256 shards) or one shard per owner (default: hash)",
+        default=None,
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["pretty", "compact"],
+        dest="manifest_format",
+        help="Indented JSON in the order the repos were added (pretty), or one minified entry per line sorted by repo, with ISO 8601 UTC timestamps (compact)",
+        default=None,
+    )
+    parser.add_argument(
+        "--lock-timeout",
+        type=float,
+        dest="lock_timeout",
+        help="Seconds to wait for the lock on a manifest held by a concurrent run (default: $GH_ROTATOR_LOCK_TIMEOUT or 60)",
+        default=None,
+    )
+
+
+def _add_serve_arguments(parser):
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="The Unix socket to listen on",
+        default=None,
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="Listen on http://127.0.0.1:<port> instead of a Unix socket (0 picks a free port)",
+        default=None,
     )
 
-    return parser.parse_args(args)
+
+# The commands that take --events-file: the arguments of a single event, and which of them it needs
+EVENT_ARGUMENTS = {
+    "lock": (
+        ["repo", "event_type", "event_name", "sha"],
+        ["repo", "event_type", "event_name", "sha"],
+    ),
+    "config": (["repo", "event_type", "event_name"], ["event_type", "event_name"]),
+}
+
+# The arguments of lock that only apply to --commit
+COMMIT_ARGUMENTS = ("branch", "remote", "commit_retries", "coalesce")
+
+# The arguments of lock that only apply to --products
+PRODUCTS_ARGUMENTS = ("workers", "product_timeout")
+
+# The subcommands: their help, description, whether they take --manifest-dir and their arguments
+SUBCOMMANDS = {
+    "lock": {
+        "help": "Lock a manifest file for the derived configuration",
+        "description": """
+            Designed to take the same parameters as the rotator.yml accepts in the dispatch. (see the templates directory in this repo)
+            Simply pass the parameters recived forward to manifest subcommand and it will generate a manifest file.
+            """,
+        "manifest_dir": True,
+        "arguments": _add_lock_arguments,
+    },
+    "manifest": {
+        "help": "Get the manifest of a given configuration",
+        "description": """
+            Designed to easily return the manifest of a repo from a specific manifest
+            """,
+        "manifest_dir": True,
+        "arguments": _add_manifest_arguments,
+    },
+    "config": {
+        "help": "Get the configuration",
+        "description": """
+            Designed to easily return the configuration name from context
+            """,
+        "manifest_dir": False,
+        "arguments": _add_config_arguments,
+    },
+    "check": {
+        "help": "Validate the config and find shadowed, overlapping and slow rules",
+        "description": """
+            Validates the schema of the config and compiles every pattern. Events sampled from
+            every rule are run through the config to find rules that never match, as the rules
+            before them take all their events, and rules overlapping rules of other configurations.
+            Patterns that backtrack catastrophically on a pumped input are reported as errors.
+            Exits non-zero if there are errors (or, with --strict, warnings).
+            """,
+        "manifest_dir": False,
+        "arguments": _add_check_arguments,
+    },
+    "diff": {
+        "help": "Compare the manifests of two configurations, or of one in two git revisions",
+        "description": """
+            Compares two manifests by repo, whatever order they list the repos in, and prints the
+            repos added, removed and rotated to another version. A manifest is named by its
+            configuration, read from the work tree, or configuration@revision, read from the git
+            objects of that revision without checking it out (qa and prod, or prod@HEAD~1 and prod).
+            """,
+        "manifest_dir": True,
+        "arguments": _add_diff_arguments,
+    },
+    "promote": {
+        "help": "Copy the versions of repos from the manifest of one configuration to another",
+        "description": """
+            Copies the version, ref_type and ref_name of every repo (or the --repos given) from
+            the manifest of one configuration to the manifest of another, like qa to prod. Every
+            repo must match a rule of the target configuration, or nothing is promoted. The target
+            manifest is written once, atomically, with one last_update for all promoted repos.
+            """,
+        "manifest_dir": True,
+        "arguments": _add_promote_arguments,
+    },
+    "migrate": {
+        "help": "Move manifests between the flat and the sharded layout, or the pretty and the compact format",
+        "description": """
+            Rewrites the manifest of a configuration as one file per shard of repos plus an index
+            (configurations/<name>/shards), so a rotation only rewrites the shard of the rotated
+            repo - or back into the single config-<name>-manifest.json. Also converts manifests
+            between the pretty and the compact format. Rotations keep the layout and format.
+            """,
+        "manifest_dir": True,
+        "arguments": _add_migrate_arguments,
+    },
+    "serve": {
+        "help": "Run as a daemon answering config, manifest and lock requests",
+        "description": """
+            Loads the product config and manifests once and answers config, manifest and lock
+            requests over a Unix socket (default: .git/gh-rotator/daemon.sock) or localhost HTTP.
+            Files changed on disk are reloaded. While the daemon runs, the CLI forwards these
+            commands to it automatically (set GH_ROTATOR_NO_DAEMON to opt out).
+            """,
+        "manifest_dir": True,
+        "arguments": _add_serve_arguments,
+    },
+}
+
+
+def _flag(argument):
+    return f"--{argument.replace('_', '-')}"
+
+
+def _check_events_file(parser, parsed):
+    """Check that a command taking --events-file is given either that, or the arguments of one event"""
+    if parsed.command not in EVENT_ARGUMENTS:
+        return
+    arguments, required = EVENT_ARGUMENTS[parsed.command]
+    if parsed.events_file is None:
+        missing = [arg for arg in required if getattr(parsed, arg) is None]
+        if missing:
+            parser.error(
+                f"{parsed.command}: the following arguments are required: "
+                + ", ".join(_flag(arg) for arg in missing)
+            )
+    elif any(getattr(parsed, arg) is not None for arg in arguments):
+        flags = [_flag(arg) for arg in arguments]
+        parser.error(
+            f"{parsed.command}: --events-file cannot be combined with "
+            f"{', '.join(flags[:-1])} or {flags[-1]}"
+        )
+
+
+def _check_commit(parser, parsed):
+    """Check that the options of lock --commit are only given with it, and make sense"""
+    if not parsed.commit:
+        given = [_flag(arg) for arg in COMMIT_ARGUMENTS if getattr(parsed, arg) is not None]
+        if given:
+            parser.error(f"lock: {', '.join(given)} can only be used with --commit")
+        return
+    if parsed.commit_retries is not None and parsed.commit_retries < 0:
+        parser.error("lock: --commit-retries cannot be negative")
+    if parsed.coalesce is not None and parsed.coalesce < 0:
+        parser.error("lock: --coalesce cannot be negative")
+
+
+def _check_products(parser, parsed):
+    """Check that the options of lock --products are only given with it, and make sense"""
+    if parsed.products is None:
+        given = [_flag(arg) for arg in PRODUCTS_ARGUMENTS if getattr(parsed, arg) is not None]
+        if given:
+            parser.error(f"lock: {', '.join(given)} can only be used with --products")
+        return
+    if parsed.events_file is not None or parsed.git_root is not None:
+        parser.error("lock: --products cannot be combined with --events-file or --git-root")
+    if parsed.workers is not None and parsed.workers < 1:
+        parser.error("lock: --workers must be at least 1")
+    if parsed.product_timeout is not None and parsed.product_timeout <= 0:
+        parser.error("lock: --product-timeout must be greater than 0")
+
+
+def _find_command(args):
+    """The subcommand on the command line - found without building the whole parser
+
+    Returns:
+        command (str): The subcommand (None if there is none, or help is asked for before it)
+    """
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ("-h", "--help"):
+            return None
+        elif arg in VALUE_OPTIONS:
+            skip = True
+        elif arg in SUBCOMMANDS:
+            return arg
+        elif not arg.startswith("-"):
+            return None
+    return None
+
+
+def rotator_parse(args=None):
+    """Parse command line arguments for the rotator tool.
+
+    Only the arguments of the subcommand being run are added to the parser, as the CLI is
+    started for every single call. The other subcommands are only registered by name, so they
+    are still listed in the help (and all of them are built when there is no subcommand).
+    """
+    if args is None:
+        args = sys.argv[1:]
+    command = _find_command(args)
+
+    # Define the parent parser with the --verbose argument
+    parent_parser = argparse.ArgumentParser(add_help=False)
+    parent_parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose output")
+    parent_parser.add_argument(
+        "--config-file",
+        type=str,
+        dest="config_file",
+        help="The path to the config file",
+        default=None,
+    )
+    parent_parser.add_argument(
+        "--git-root",
+        type=str,
+        dest="git_root",
+        help="The root of the product git repo - skips discovery (or set GH_ROTATOR_GIT_ROOT)",
+        default=None,
+    )
+    # Not defaulted, so given before the subcommand they aren't overridden by its defaults
+    parent_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the wall and CPU time of each phase of the run as a JSON line on stderr (or set GH_ROTATOR_PROFILE=1)",
+        default=argparse.SUPPRESS,
+    )
+    parent_parser.add_argument(
+        "--profile-file",
+        type=str,
+        dest="profile_file",
+        help="Append the JSON line with the timings of the run to this file instead (or set GH_ROTATOR_PROFILE to the file)",
+        default=argparse.SUPPRESS,
+    )
+    parent_parser.add_argument(
+        "--cprofile",
+        type=str,
+        help="Dump the cProfile stats of the run to this file, for python -m pstats (or set GH_ROTATOR_CPROFILE)",
+        default=argparse.SUPPRESS,
+    )
+
+    mainfestdir_parser = argparse.ArgumentParser(add_help=False)
+    mainfestdir_parser.add_argument(
+        "--manifest-dir",
+        type=str,
+        dest="manifest_dir",
+        help="The directory to save the manifest file",
+        default="configurations",
+    )
+
+    # Define command-line arguments
+    parser = argparse.ArgumentParser(
+        prog="rotator",
+        parents=[parent_parser, mainfestdir_parser],
+        description="""   
+            A command-line tool designed as a helper utility to the rotator.yml workflow.  
+            """,
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    for name, subcommand in SUBCOMMANDS.items():
+        if command is not None and name != command:
+            subparsers.add_parser(name, help=subcommand["help"])
+            continue
+        parents = (
+            [parent_parser, mainfestdir_parser] if subcommand["manifest_dir"] else [parent_parser]
+        )
+        subcommand["arguments"](
+            subparsers.add_parser(
+                name,
+                parents=parents,
+                help=subcommand["help"],
+                description=subcommand["description"],
+            )
+        )
+
+    parsed = parser.parse_args(args)
+
+    _check_events_file(parser, parsed)
+
+    if parsed.command == "migrate" and not (
+        parsed.layout or parsed.shard_by or parsed.manifest_format
+    ):
+        parser.error("migrate: one of the arguments --layout --shard-by --format is required")
+
+    if parsed.command == "lock":
+        _check_commit(parser, parsed)
+        _check_products(parser, parsed)
+
+    if parsed.command == "promote" and parsed.from_configuration == parsed.to_configuration:
+        parser.error("promote: --from and --to must be different configurations")
+
+    if parsed.command == "manifest" and parsed.repo and (parsed.repos or parsed.repos_file):
+        parser.error("manifest: --repo cannot be combined with --repos or --repos-file")
+
+    return parsed
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import http.client
+import json
+import socket
+from urllib.parse import urlsplit
+
+# How long to wait for the daemon to accept a connection
+CONNECT_TIMEOUT = 1.0
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connection(address):
+    if address.startswith("http://"):
+        url = urlsplit(address)
+        return http.client.HTTPConnection(url.hostname, url.port, timeout=CONNECT_TIMEOUT)
+    return UnixHTTPConnection(address, CONNECT_TIMEOUT)
+
+
+def request(address, method, path, payload=None, token=None):
+    """Send a request to the daemon at address
+
+    Args:
+        address (str): The Unix socket path or http://127.0.0.1:<port> of the daemon
+        method (str): The HTTP method
+        path (str): The HTTP path
+        payload (dict, optional): The JSON body of the request. Defaults to None.
+        token (str, optional): The token of a daemon listening on a port. Defaults to None.
+    Returns:
+        response (dict): The JSON body of the response (None if the request wasn't understood or
+            was refused)
+    Raises:
+        OSError: If the daemon couldn't be reached
+    """
+    connection = _connection(address)
+    try:
+        connection.connect()
+        # Only connecting is bounded, a lock may legitimately wait for a while
+        connection.sock.settimeout(None)
+        body = None if payload is None else json.dumps(payload)
+        headers = {"Content-Type": "application/json"}
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return json.loads(response.read()) if response.status == 200 else None
+    finally:
+        connection.close()
@@ -0,0 +1,82 @@
+"""Helpers for the tests that run the CLI against product repos in a temp directory"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+from gh_rotator import gh_rotator
+from gh_rotator.modules.rotator_client import NO_DAEMON_ENV
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+
+# The author and committer of the commits in the product repos
+IDENTITY = {
+    "GIT_AUTHOR_NAME": "rotator",
+    "GIT_AUTHOR_EMAIL": "rotator@example.com",
+    "GIT_COMMITTER_NAME": "rotator",
+    "GIT_COMMITTER_EMAIL": "rotator@example.com",
+}
+
+
+def git(cwd, *args):
+    """Run git in cwd - returns its stdout"""
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def make_product(root, config=None, manifests=True):
+    """Set up a product repo at root - a fake one (just a .git directory) unless it is a git repo
+
+    Args:
+        root (str): The root of the product repo (created if it doesn't exist)
+        config (dict, optional): The config to write. Defaults to None (the valid test config).
+        manifests (bool, optional): Whether to copy the test manifests. Defaults to True.
+    Returns:
+        root (str): The root of the product repo
+    """
+    os.makedirs(os.path.join(root, ".git"), exist_ok=True)
+    if config is None:
+        shutil.copy(
+            os.path.join(TEST_DATA_PATH, "config-rotator-valid.json"),
+            os.path.join(root, "config-rotator.json"),
+        )
+    else:
+        with open(os.path.join(root, "config-rotator.json"), "w") as f:
+            json.dump(config, f)
+    if manifests:
+        shutil.copytree(os.path.join(TEST_DATA_PATH, "manifests"), os.path.join(root, "configurations"))
+    return root
+
+
+class CliTestCase(unittest.TestCase):
+    """Runs every test in a temp directory (self.temp_dir), with the commands run in-process
+
+    The CLI is run with --git-root self.git_root (the temp directory, unless a test sets another
+    root - or None to leave --git-root out).
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        env = patch.dict(os.environ, {NO_DAEMON_ENV: "1", **IDENTITY})
+        env.start()
+        self.addCleanup(env.stop)
+        self.git_root = self.temp_dir
+
+    def main(self, *argv):
+        """Run the CLI - returns its exit code, stdout and stderr"""
+        if self.git_root is not None:
+            argv = [*argv, "--git-root", self.git_root]
+        with patch("sys.argv", ["gh-rotator", *argv]):
+            with patch("sys.stdout", new_callable=StringIO) as stdout:
+                with patch("sys.stderr", new_callable=StringIO) as stderr:
+                    with self.assertRaises(SystemExit) as cm:
+                        gh_rotator.main()
+        return cm.exception.code, stdout.getvalue(), stderr.getvalue()
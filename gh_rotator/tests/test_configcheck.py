@@ -0,0 +1,247 @@
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.repocontext import RepoContext
+from gh_rotator.modules import configcheck
+from gh_rotator.modules.rotator_handlers import handle_check
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+
+SEMVER = r"^\d+\.\d+\.\d+$"
+PRERELEASE = r"^\d+\.\d+\.\d+-[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*$"
+PATTERNS = [
+    SEMVER,
+    PRERELEASE,
+    "org/.*",
+    r"(?:team|squad)-\d/(?:api|web)-[a-z0-9]+(?:-v\d+)?",
+    r"release/[^/]+",
+    r"(?P<owner>[a-z]+)/(?P=owner)-app",
+    r"org/(?!legacy)[a-z]+",
+    r"feature/\w{2,5}-\d+",
+    r"[^a-z]+",
+    "main|develop",
+]
+
+
+def rule(repo, ref_type, ref_name):
+    return {"repo": repo, "ref_type": ref_type, "ref_name": ref_name}
+
+
+class TestValidate(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_valid_config(self):
+        with open(os.path.join(TEST_DATA_PATH, "config-rotator-valid.json")) as f:
+            self.assertEqual(configcheck.validate(json.load(f)), [])
+
+    @pytest.mark.unittest
+    def test_schema_errors(self):
+        config = {
+            "dev": [
+                {"repo": "org/a", "ref_type": "branch"},
+                rule("org/(a", "branch", "main"),
+                rule("org/a", "push", "main"),
+                {**rule("org/a", "branch", 5), "comment": "x"},
+                "org/a",
+            ],
+            "qa": {},
+            "prod": [],
+        }
+        findings = [
+            (f["level"], f["configuration"], f["rule"]) for f in configcheck.validate(config)
+        ]
+        self.assertEqual(
+            findings,
+            [
+                ("error", "dev", 0),
+                ("error", "dev", 1),
+                ("error", "dev", 2),
+                ("error", "dev", 3),
+                ("warning", "dev", 3),
+                ("error", "dev", 4),
+                ("error", "qa", None),
+                ("warning", "prod", None),
+            ],
+        )
+        messages = [configcheck.describe(f) for f in configcheck.validate(config)]
+        self.assertEqual(messages[0], "dev[0] has no ref_name")
+        self.assertIn("dev[1] has a repo that is not a valid regex", messages[1])
+        self.assertEqual(messages[4], "dev[3] has unknown keys (ignored): comment")
+        self.assertEqual(configcheck.validate([])[0]["level"], "error")
+
+
+class TestSamples(unittest.TestCase):
+    @pytest.mark.pbt
+    def test_samples_match(self):
+        for seed in range(20):
+            rng = random.Random(seed)
+            for pattern in PATTERNS:
+                with self.subTest(seed=seed, pattern=pattern):
+                    found = configcheck.samples(pattern, 8, rng)
+                    self.assertTrue(found)
+                    self.assertEqual(len(found), len(set(found)))
+                    for sample in found:
+                        self.assertTrue(re.fullmatch(pattern, sample), sample)
+
+    @pytest.mark.unittest
+    def test_literal_samples(self):
+        self.assertEqual(configcheck.samples(r"^org/repo\.js$"), ["org/repo.js"])
+
+
+class TestBacktracking(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_catastrophic_patterns(self):
+        for pattern in [r"(a+)+$", r"^(\w+\s?)*$", r"org/(a|aa)+x", r"(x+x+)+y"]:
+            with self.subTest(pattern=pattern):
+                seconds, length = configcheck.backtracking(pattern, 0.005)
+                self.assertGreater(seconds, 0.005)
+                self.assertGreater(length, 0)
+
+    @pytest.mark.unittest
+    def test_linear_patterns(self):
+        for pattern in [*PATTERNS, "org/backend"]:
+            with self.subTest(pattern=pattern):
+                seconds, _length = configcheck.backtracking(pattern, 0.05)
+                self.assertLess(seconds, 0.05)
+
+    @pytest.mark.unittest
+    def test_slow_patterns_are_errors(self):
+        config = {"dev": [rule("org/a", "branch", "main"), rule("org/b", "tag", r"(\d+)+\.0")]}
+        findings = configcheck.check(config, budget=0.005)
+        self.assertEqual(
+            [(f["level"], f["check"], f["rule"]) for f in findings], [("error", "backtracking", 1)]
+        )
+        self.assertIn("ref_name that backtracks catastrophically", findings[0]["message"])
+
+    @pytest.mark.unittest
+    def test_skipped_without_the_regex_parser(self):
+        # re._parser is a CPython internal - without it only the schema is checked
+        config = {"dev": [rule("org/a", "branch", "main"), rule("org/b", "tag", r"(\d+)+\.0")]}
+        with patch.object(configcheck, "_parser", return_value=None):
+            self.assertEqual(configcheck.check(config, budget=0.005), [])
+            self.assertEqual(configcheck.samples(r"org/[a-z]+"), [])
+            self.assertEqual(configcheck.samples(r"^org/a$"), ["org/a"])
+
+
+class TestOverlaps(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_shadowed_and_overlapping(self):
+        config = {
+            "dev": [
+                rule("org/.*", "branch", "main"),
+                # Same configuration - harmless
+                rule("org/backend", "branch", "main|develop"),
+            ],
+            "qa": [
+                # Taken by dev[0] for main, but not for develop
+                rule("org/frontend", "branch", "main|develop"),
+                # Never matches, dev[0] takes all its events
+                rule("org/api", "branch", "main"),
+                # Another ref_type - no overlap
+                rule("org/.*", "tag", SEMVER),
+            ],
+        }
+        findings = configcheck.overlaps(config)
+        self.assertEqual(
+            [(f["check"], f["configuration"], f["rule"]) for f in findings],
+            [("overlap", "qa", 0), ("shadowed", "qa", 1)],
+        )
+        self.assertEqual(
+            configcheck.describe(findings[0]),
+            "qa[0] overlaps dev[0]: events like org/frontend on branch main match both and rotate dev",
+        )
+        self.assertEqual(
+            configcheck.describe(findings[1]),
+            "qa[1] never matches: every sampled event is taken by dev[0] first",
+        )
+
+    @pytest.mark.unittest
+    def test_regex_overlap_found_from_the_other_rule(self):
+        # A sample of dev[0] matches qa[0], though no sample of qa[0] is likely to match dev[0]
+        config = {
+            "dev": [rule("org/backend", "tag", SEMVER)],
+            "qa": [rule("org/.*", "tag", r"\d+\.\d+\.\d+(?:-rc\d+)?")],
+        }
+        findings = configcheck.overlaps(config)
+        self.assertEqual([(f["check"], f["configuration"]) for f in findings], [("overlap", "qa")])
+
+
+class TestCheckCommand(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        self.config_file = os.path.join(self.temp_dir, "config-rotator.json")
+        shutil.copy(os.path.join(TEST_DATA_PATH, "config-rotator-valid.json"), self.config_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_config(self, config):
+        with open(self.config_file, "w") as f:
+            f.write(config if isinstance(config, str) else json.dumps(config))
+
+    def check(self, output_format="text", strict=False):
+        args = Namespace(
+            command="check",
+            config_file=None,
+            git_root=self.temp_dir,
+            samples=16,
+            budget_ms=10.0,
+            output_format=output_format,
+            strict=strict,
+        )
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with self.assertRaises(SystemExit) as cm:
+                handle_check(args)
+        return cm.exception.code, stdout.getvalue().splitlines()
+
+    @pytest.mark.unittest
+    def test_valid_config(self):
+        code, lines = self.check()
+        self.assertEqual(code, 0)
+        self.assertEqual(lines, [f"{self.config_file}: 0 error(s), 0 warning(s)"])
+
+    @pytest.mark.unittest
+    def test_warnings_only_fail_when_strict(self):
+        self.write_config(
+            {"dev": [rule("org/.*", "branch", "main")], "qa": [rule("org/a", "branch", "main")]}
+        )
+        code, lines = self.check()
+        self.assertEqual(code, 0)
+        self.assertEqual(lines[0], "⚠️ Warning: qa[0] never matches: every sampled event is taken by dev[0] first")
+        code, _lines = self.check(strict=True)
+        self.assertEqual(code, 1)
+
+    @pytest.mark.unittest
+    def test_errors_as_json(self):
+        self.write_config({"dev": [rule("org/a", "branch", "(main")]})
+        code, lines = self.check(output_format="json")
+        self.assertEqual(code, 1)
+        found = [json.loads(line) for line in lines]
+        self.assertEqual([(f["level"], f["check"], f["rule"]) for f in found], [("error", "schema", 0)])
+
+    @pytest.mark.unittest
+    def test_broken_json(self):
+        self.write_config('{"dev": [')
+        code, lines = self.check()
+        self.assertEqual(code, 1)
+        self.assertIn("The config is not valid JSON", lines[0])
+
+    @pytest.mark.unittest
+    def test_loading_an_invalid_rule_names_it(self):
+        self.write_config({"dev": [rule("org/a", "branch", "main"), rule("org/(b", "branch", "main")]})
+        with patch("sys.stderr", new_callable=StringIO) as stderr:
+            with self.assertRaises(SystemExit):
+                ProductConfig(context=RepoContext(git_root=self.temp_dir))
+        self.assertIn("dev[1] has a repo that is not a valid regex", stderr.getvalue())
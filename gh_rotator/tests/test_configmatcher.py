@@ -0,0 +1,199 @@
+import json
+import random
+import re
+import unittest
+
+import pytest
+
+from gh_rotator.classes.configmatcher import ConfigMatcher, literal_pattern, prefix_pattern
+
+SEMVER = r"^\d+\.\d+\.\d+$"
+PRERELEASE = r"^\d+\.\d+\.\d+-[0-9A-Za-z-]+$"
+
+
+def naive_match(config, repo, event_name, event_type):
+    """The original (uncompiled) lookup, used as the reference implementation"""
+    for configuration, rules in config.items():
+        for rule in rules:
+            if (
+                re.fullmatch(rule["repo"], repo)
+                and rule["ref_type"] == event_type
+                and re.fullmatch(rule["ref_name"], event_name)
+            ):
+                return configuration
+    return None
+
+
+class TestLiteralPattern(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_literal_patterns(self):
+        self.assertEqual(literal_pattern("config-rotator/backend"), "config-rotator/backend")
+        self.assertEqual(literal_pattern("^main$"), "main")
+        self.assertEqual(literal_pattern(r"config-rotator\/backend"), "config-rotator/backend")
+        self.assertEqual(literal_pattern(r"org/repo\.js"), "org/repo.js")
+
+    @pytest.mark.unittest
+    def test_regex_patterns(self):
+        for pattern in [r"[a-z]+/repo", "org/.*", r"\d+", "a|b", "org/repo?", r"org/repo\Z"]:
+            with self.subTest(pattern=pattern):
+                self.assertIsNone(literal_pattern(pattern))
+
+
+class TestPrefixPattern(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_prefix_patterns(self):
+        self.assertEqual(prefix_pattern("org/.*"), "org/")
+        self.assertEqual(prefix_pattern("^org/svc-.+$"), "org/svc-")
+        self.assertEqual(prefix_pattern(r"org/repo\.js.*"), "org/repo.js")
+        self.assertEqual(prefix_pattern(".*"), "")
+        self.assertEqual(prefix_pattern(r"org\\.*"), "org\\")
+
+    @pytest.mark.unittest
+    def test_not_prefix_patterns(self):
+        for pattern in ["org/backend", r"org\.*", "org/.*-api", "[a-z]+/.*", "org/.*?", "a|org/.*"]:
+            with self.subTest(pattern=pattern):
+                self.assertIsNone(prefix_pattern(pattern))
+
+
+class TestConfigMatcher(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            "dev": [
+                {"repo": "org/backend", "ref_type": "branch", "ref_name": "main"},
+                {"repo": "org/.*", "ref_type": "branch", "ref_name": "develop"},
+            ],
+            "qa": [
+                {"repo": "org/.*", "ref_type": "tag", "ref_name": PRERELEASE},
+            ],
+            "prod": [
+                {"repo": "org/backend", "ref_type": "tag", "ref_name": PRERELEASE},
+                {"repo": "org/backend", "ref_type": "tag", "ref_name": SEMVER},
+            ],
+        }
+        self.matcher = ConfigMatcher(self.config)
+
+    @pytest.mark.unittest
+    def test_literal_and_regex_rules(self):
+        self.assertEqual(self.matcher.match("org/backend", "main", "branch"), "dev")
+        self.assertEqual(self.matcher.match("org/frontend", "develop", "branch"), "dev")
+        self.assertEqual(self.matcher.match("org/backend", "1.0.0", "tag"), "prod")
+
+    @pytest.mark.unittest
+    def test_first_match_wins_in_file_order(self):
+        # The regex rule in 'qa' is declared before the literal rule in 'prod'
+        self.assertEqual(self.matcher.match("org/backend", "1.0.0-rc", "tag"), "qa")
+
+    @pytest.mark.unittest
+    def test_no_match(self):
+        self.assertIsNone(self.matcher.match("org/frontend", "main", "branch"))
+        self.assertIsNone(self.matcher.match("other/backend", "1.0.0", "tag"))
+        self.assertIsNone(self.matcher.match("org/backend", "main", "tag"))
+
+    @pytest.mark.unittest
+    def test_agrees_with_naive_lookup(self):
+        repos = ["org/backend", "org/frontend", "other/backend", "org/backend.js"]
+        events = [("main", "branch"), ("develop", "branch"), ("1.0.0", "tag"), ("1.0.0-rc", "tag")]
+        for repo in repos:
+            for event_name, event_type in events:
+                with self.subTest(repo=repo, event_name=event_name, event_type=event_type):
+                    self.assertEqual(
+                        self.matcher.match(repo, event_name, event_type),
+                        naive_match(self.config, repo, event_name, event_type),
+                    )
+
+    @pytest.mark.unittest
+    def test_match_all_in_file_order(self):
+        self.assertEqual(self.matcher.match_all("org/backend", "1.0.0-rc", "tag"), ["qa", "prod"])
+        self.assertEqual(self.matcher.match_all("org/backend", "1.0.0", "tag"), ["prod"])
+        self.assertEqual(self.matcher.match_all("org/backend", "main", "tag"), [])
+        # A configuration with several matching rules is listed once
+        self.matcher = ConfigMatcher({**self.config, "prod": self.config["prod"] * 2})
+        self.assertEqual(self.matcher.match_all("org/backend", "1.0.0-rc", "tag"), ["qa", "prod"])
+
+
+OWNERS = ["org", "org-2", "other", "o"]
+NAMES = ["backend", "svc-api", "svc-web", "svc-", "a", "ab", "frontend.js", ""]
+
+
+def random_repo_pattern(rng):
+    """A repo pattern of any kind: exact, literal prefix, regex, back reference or inline flag"""
+    owner, name = rng.choice(OWNERS), rng.choice(NAMES)
+    return rng.choice(
+        [
+            f"{owner}/{re.escape(name)}",
+            f"^{owner}/{re.escape(name)}$",
+            f"{owner}/.*",
+            f"{owner}/{re.escape(name[:2])}.*",
+            f"^{owner}/{re.escape(name[:3])}.+$",
+            f"{owner}.*",
+            f"{owner[:1]}.+",
+            ".*",
+            rf"{owner}/svc-\w+",
+            rf"(?:{owner}|other)/[a-z]+",
+            r"(?P<o>[a-z]+)/(?P=o)",
+            r"([a-z])[a-z-]*/\1.*",
+            rf"(?i){owner.upper()}/.*",
+            r"(?s)org/.*",
+            rf"{owner}/(?!svc).*",
+        ]
+    )
+
+
+def random_repo(rng):
+    owner, name = rng.choice(OWNERS), rng.choice(NAMES)
+    return rng.choice(
+        [
+            f"{owner}/{name}",
+            f"{owner}/{name}\n",
+            owner,
+            f"{owner.upper()}/{name}",
+            f"{owner}/{owner}",
+            f"{owner}{name}",
+            f"{owner}/{name}/x",
+        ]
+    )
+
+
+class TestConfigMatcherIndex(unittest.TestCase):
+    @pytest.mark.pbt
+    def test_agrees_with_naive_lookup(self):
+        for seed in range(40):
+            rng = random.Random(seed)
+            config = {
+                f"conf-{c}": [
+                    {
+                        "repo": random_repo_pattern(rng),
+                        "ref_type": rng.choice(["branch", "tag"]),
+                        "ref_name": rng.choice(["main", "develop", "main|develop", ".*"]),
+                    }
+                    for _ in range(rng.randint(0, 80))
+                ]
+                for c in range(rng.randint(1, 4))
+            }
+            matcher = ConfigMatcher(config)
+            restored = ConfigMatcher.from_cache(json.loads(json.dumps(matcher.to_cache())))
+            for _ in range(60):
+                repo = random_repo(rng)
+                event_name = rng.choice(["main", "develop", "feature"])
+                event_type = rng.choice(["branch", "tag"])
+                expected = [
+                    configuration
+                    for configuration, rules in config.items()
+                    for rule in rules
+                    if rule["ref_type"] == event_type
+                    and re.fullmatch(rule["repo"], repo)
+                    and re.fullmatch(rule["ref_name"], event_name)
+                ]
+                with self.subTest(seed=seed, repo=repo, event_name=event_name, event_type=event_type):
+                    for candidate in (matcher, restored):
+                        self.assertEqual(
+                            candidate.match(repo, event_name, event_type),
+                            naive_match(config, repo, event_name, event_type),
+                        )
+                        self.assertEqual(
+                            candidate.match_all(repo, event_name, event_type),
+                            list(dict.fromkeys(expected)),
+                        )
+                        self.assertEqual(
+                            len(candidate.match_rules(repo, event_name, event_type)), len(expected)
+                        )
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.modules.fileio import write_if_changed
+
+
+class TestWriteIfChanged(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.temp_dir, "dev", "config-dev-manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.unittest
+    def test_creates_missing_file_and_directory(self):
+        self.assertTrue(write_if_changed(self.file, b"{}"))
+        with open(self.file, "rb") as f:
+            self.assertEqual(f.read(), b"{}")
+
+    @pytest.mark.unittest
+    def test_unchanged_content_is_not_written(self):
+        write_if_changed(self.file, b"{}")
+        mtime = os.stat(self.file).st_mtime_ns
+
+        with patch("pathlib.Path.replace") as mock_replace:
+            self.assertFalse(write_if_changed(self.file, b"{}"))
+            mock_replace.assert_not_called()
+        self.assertEqual(os.stat(self.file).st_mtime_ns, mtime)
+
+    @pytest.mark.unittest
+    def test_changed_content_replaces_file(self):
+        write_if_changed(self.file, b"{}")
+        os.chmod(self.file, 0o640)
+
+        self.assertTrue(write_if_changed(self.file, b'{"dev": []}'))
+        with open(self.file, "rb") as f:
+            self.assertEqual(f.read(), b'{"dev": []}')
+        # The permissions of the replaced file are kept, and no temp files are left behind
+        self.assertEqual(os.stat(self.file).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(os.path.dirname(self.file)), ["config-dev-manifest.json"])
+
+    @pytest.mark.unittest
+    def test_failed_write_leaves_original(self):
+        write_if_changed(self.file, b"{}")
+
+        with patch("pathlib.Path.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                write_if_changed(self.file, b'{"dev": []}')
+        with open(self.file, "rb") as f:
+            self.assertEqual(f.read(), b"{}")
+        self.assertEqual(os.listdir(os.path.dirname(self.file)), ["config-dev-manifest.json"])
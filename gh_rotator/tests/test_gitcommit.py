@@ -0,0 +1,246 @@
+import json
+import os
+import time
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator import gh_rotator
+from gh_rotator.modules import commitqueue, gitcommit
+from gh_rotator.modules.fileio import file_lock
+from gh_rotator.tests.cli_helpers import CliTestCase, git, make_product
+
+BACKEND = "config-rotator/backend-component"
+FRONTEND = "config-rotator/frontend-component"
+DEV_MANIFEST = "configurations/dev/config-dev-manifest.json"
+PROD_MANIFEST = "configurations/prod/config-prod-manifest.json"
+def lock(repo, sha, event_type="branch", event_name="main"):
+    return ["lock", "--repo", repo, "--event-type", event_type, "--event-name", event_name, "--sha", sha]
+
+
+class TestLockCommit(CliTestCase):
+    def setUp(self):
+        """Set up a bare remote and a clone of it holding the test config and manifests"""
+        super().setUp()
+        self.remote = os.path.join(self.temp_dir, "remote.git")
+        git(self.temp_dir, "init", "--quiet", "--bare", "--initial-branch", "main", self.remote)
+        self.work = self.git_root = make_product(self.clone("work"))
+        git(self.work, "add", "-A")
+        git(self.work, "commit", "--quiet", "-m", "Initial product")
+        git(self.work, "push", "--quiet", "origin", "main")
+        self.initial = git(self.work, "rev-parse", "HEAD")
+
+    def clone(self, name):
+        path = os.path.join(self.temp_dir, name)
+        git(self.temp_dir, "clone", "--quiet", self.remote, path)
+        git(path, "checkout", "--quiet", "-B", "main")
+        return path
+
+    def versions(self, repo, commit, path=DEV_MANIFEST):
+        manifest = json.loads(git(repo, "show", f"{commit}:{path}"))
+        return {entry["repo"]: entry["version"] for entry in next(iter(manifest.values()))}
+
+    def assertUntouched(self):
+        """The work tree and index of the clone are as they were checked out"""
+        self.assertEqual(git(self.work, "status", "--porcelain", "--untracked-files=no"), "")
+        self.assertEqual(git(self.work, "rev-parse", "HEAD"), self.initial)
+
+    @pytest.mark.unittest
+    def test_commit_and_push(self):
+        code, _stdout, stderr = self.main(*lock(BACKEND, "a" * 40), "--commit", "--remote", "origin")
+        self.assertEqual((code, stderr), (0, ""))
+
+        head = git(self.remote, "rev-parse", "main")
+        self.assertEqual(git(self.remote, "rev-parse", "main^"), self.initial)
+        self.assertEqual(self.versions(self.remote, head)[BACKEND], "a" * 40)
+        self.assertEqual(
+            git(self.remote, "log", "-1", "--format=%s", "main"),
+            f"Update dev manifest ('branch:main') for {BACKEND}",
+        )
+        # Only the manifest changed - every other tree and blob is shared with the parent
+        self.assertEqual(
+            git(self.remote, "diff", "--name-only", "main^", "main"), DEV_MANIFEST
+        )
+        self.assertUntouched()
+
+    @pytest.mark.unittest
+    def test_commit_to_another_local_branch(self):
+        git(self.work, "branch", "manifests")
+        code, _stdout, stderr = self.main(*lock(BACKEND, "b" * 40), "--commit", "--branch", "manifests")
+        self.assertEqual((code, stderr), (0, ""))
+
+        self.assertEqual(self.versions(self.work, "manifests")[BACKEND], "b" * 40)
+        self.assertEqual(git(self.work, "rev-parse", "manifests^"), self.initial)
+        self.assertEqual(git(self.remote, "rev-parse", "main"), self.initial)
+        self.assertUntouched()
+
+    @pytest.mark.unittest
+    def test_checked_out_branch_is_not_moved(self):
+        code, _stdout, stderr = self.main(*lock(BACKEND, "b" * 40), "--commit")
+        self.assertEqual(code, 1)
+        self.assertIn("'main' is checked out - name another --branch, or a --remote", stderr)
+        self.assertUntouched()
+
+    @pytest.mark.unittest
+    def test_nothing_to_commit(self):
+        version = self.versions(self.work, "HEAD")[BACKEND]
+        code, stdout, _stderr = self.main(
+            *lock(BACKEND, version), "--commit", "--remote", "origin", "--verbose"
+        )
+        self.assertEqual(code, 0)
+        self.assertIn("nothing to commit", stdout)
+        self.assertEqual(git(self.remote, "rev-parse", "main"), self.initial)
+
+    @pytest.mark.unittest
+    def test_rebuilt_on_a_branch_that_moved_on(self):
+        # Another run pushes a rotation of the prod manifest between our fetch and push
+        other = self.clone("other")
+        push = gitcommit.push
+
+        def push_after_other(*args):
+            if git(self.remote, "rev-parse", "main") == self.initial:
+                manifest = os.path.join(other, PROD_MANIFEST)
+                with open(manifest) as f:
+                    content = f.read()
+                with open(manifest, "w") as f:
+                    f.write(content.replace('"version": "', '"version": "0', 1))
+                git(other, "commit", "--quiet", "-am", "Rotate prod")
+                git(other, "push", "--quiet", "origin", "main")
+            return push(*args)
+
+        with patch.object(gitcommit, "push", side_effect=push_after_other) as mock_push:
+            code, _stdout, stderr = self.main(
+                *lock(BACKEND, "c" * 40), "--commit", "--remote", "origin"
+            )
+        self.assertEqual((code, stderr), (0, ""))
+        self.assertEqual(mock_push.call_count, 2)
+
+        # Our commit is on top of theirs, with both rotations
+        theirs = git(other, "rev-parse", "HEAD")
+        self.assertEqual(git(self.remote, "rev-parse", "main^"), theirs)
+        self.assertEqual(self.versions(self.remote, "main")[BACKEND], "c" * 40)
+        self.assertEqual(
+            git(self.remote, "show", f"main:{PROD_MANIFEST}"),
+            git(other, "show", f"HEAD:{PROD_MANIFEST}"),
+        )
+        self.assertUntouched()
+
+    @pytest.mark.unittest
+    def test_gives_up_on_a_branch_that_keeps_moving(self):
+        with patch.object(gitcommit, "push", side_effect=gitcommit.BranchMovedError("rejected")):
+            code, _stdout, stderr = self.main(
+                *lock(BACKEND, "d" * 40), "--commit", "--remote", "origin", "--commit-retries", "2"
+            )
+        self.assertEqual(code, 1)
+        self.assertIn("moved on 3 times", stderr)
+        self.assertEqual(git(self.remote, "rev-parse", "main"), self.initial)
+
+    @pytest.mark.unittest
+    def test_coalesced_into_one_commit(self):
+        # A concurrent run queued its rotation before this one took the queue
+        queue = os.path.join(self.work, ".git", "gh-rotator", "commit-queue")
+        update = {
+            "repo": FRONTEND,
+            "version": "e" * 40,
+            "ref_type": "branch",
+            "ref_name": "main",
+            "last_update": "2025-05-15 (07:51:28) [UTC]",
+        }
+        queued = commitqueue.enqueue(queue, {"dev": [update]})
+
+        code, _stdout, stderr = self.main(
+            *lock(BACKEND, "f" * 40), "--commit", "--remote", "origin", "--coalesce", "0.01"
+        )
+        self.assertEqual((code, stderr), (0, ""))
+
+        head = git(self.remote, "rev-parse", "main")
+        self.assertEqual(git(self.remote, "rev-parse", "main^"), self.initial)
+        versions = self.versions(self.remote, head)
+        self.assertEqual((versions[FRONTEND], versions[BACKEND]), ("e" * 40, "f" * 40))
+        self.assertIn("with 2 rotations", git(self.remote, "log", "-1", "--format=%s", "main"))
+        # The concurrent run finds its rotation committed
+        self.assertEqual(commitqueue.result(queue, queued), {"commit": head})
+        self.assertEqual(commitqueue.take(queue), [])
+
+    @pytest.mark.unittest
+    def test_coalesced_rotations_of_unknown_configurations_are_left_queued(self):
+        queue = os.path.join(self.work, ".git", "gh-rotator", "commit-queue")
+        update = {"repo": FRONTEND, "version": "e" * 40, "ref_type": "branch", "ref_name": "main"}
+        # Queued by a run with another config
+        queued = commitqueue.enqueue(queue, {"staging": [update]})
+
+        code, _stdout, stderr = self.main(
+            *lock(BACKEND, "f" * 40), "--commit", "--remote", "origin", "--coalesce", "0.01"
+        )
+        self.assertEqual((code, stderr), (0, ""))
+        self.assertEqual(
+            git(self.remote, "log", "-1", "--format=%s", "main"),
+            f"Update dev manifest ('branch:main') for {BACKEND}",
+        )
+        self.assertIsNone(commitqueue.result(queue, queued))
+        self.assertEqual(commitqueue.take(queue), [(queued, {"staging": [update]})])
+
+    @pytest.mark.unittest
+    def test_results_left_behind_are_removed(self):
+        queue = os.path.join(self.work, ".git", "gh-rotator", "commit-queue")
+        # Results of runs that failed or timed out before picking them up - one long ago
+        old, recent = commitqueue.enqueue(queue, {}), commitqueue.enqueue(queue, {})
+        commitqueue.resolve(queue, [old, recent], {"commit": None})
+        os.utime(os.path.join(queue, f"{old}.done"), (0, 0))
+
+        code, _stdout, stderr = self.main(
+            *lock(BACKEND, "f" * 40), "--commit", "--remote", "origin", "--coalesce", "0.01"
+        )
+        self.assertEqual((code, stderr), (0, ""))
+        # Nor is a result left for this run itself
+        self.assertEqual(sorted(f for f in os.listdir(queue) if f.endswith(".done")), [f"{recent}.done"])
+
+    @pytest.mark.unittest
+    def test_coalesce_window_is_not_waited_under_the_queue_lock(self):
+        queue_lock = os.path.join(self.work, ".git", "gh-rotator", "commit-queue", "queue.lock")
+        sleep = time.sleep
+        windows = []
+
+        def wait(seconds):
+            if seconds == 5:
+                # A concurrent run gets the queue while this one waits for the window
+                with file_lock(queue_lock, timeout=0):
+                    windows.append(seconds)
+            else:
+                sleep(seconds)
+
+        with patch("time.sleep", side_effect=wait):
+            code, _stdout, stderr = self.main(
+                *lock(BACKEND, "f" * 40), "--commit", "--remote", "origin", "--coalesce", "5",
+                "--lock-timeout", "1",
+            )  # fmt: skip
+        self.assertEqual((code, stderr), (0, ""))
+        self.assertEqual(windows, [5])
+
+    @pytest.mark.unittest
+    def test_commit_options_need_commit(self):
+        with patch("sys.stderr", new_callable=StringIO) as stderr:
+            with self.assertRaises(SystemExit):
+                gh_rotator.rotator_parse([*lock(BACKEND, "a" * 40), "--remote", "origin"])
+        self.assertIn("--remote can only be used with --commit", stderr.getvalue())
+
+    @pytest.mark.unittest
+    def test_negative_commit_options(self):
+        for option, message in [
+            ("--commit-retries", "--commit-retries cannot be negative"),
+            ("--coalesce", "--coalesce cannot be negative"),
+        ]:
+            with self.subTest(option=option):
+                with patch("sys.stderr", new_callable=StringIO) as stderr:
+                    with self.assertRaises(SystemExit):
+                        gh_rotator.rotator_parse([*lock(BACKEND, "a" * 40), "--commit", option, "-1"])
+                self.assertIn(message, stderr.getvalue())
+
+    @pytest.mark.unittest
+    def test_sharded_manifests_are_not_committed(self):
+        code, _stdout, _stderr = self.main("migrate", "--configuration", "dev", "--layout", "sharded")
+        self.assertEqual(code, 0)
+        code, _stdout, stderr = self.main(*lock(BACKEND, "a" * 40), "--commit", "--remote", "origin")
+        self.assertEqual(code, 1)
+        self.assertIn("only flat manifests can be committed", stderr)
@@ -0,0 +1,185 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.modules import gitcommit, manifestdiff
+from gh_rotator.tests.cli_helpers import IDENTITY, CliTestCase, git, make_product
+
+BACKEND = "config-rotator/backend-component"
+DEV_MANIFEST = "configurations/dev/config-dev-manifest.json"
+
+
+def entry(repo, version):
+    return {"repo": repo, "ref_type": "tag", "ref_name": "1.0.0", "version": version}
+
+
+class TestDiff(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_added_removed_and_changed(self):
+        before = [entry("org/a", "1"), entry("org/b", "2"), entry("org/c", "3")]
+        after = [entry("org/d", "4"), entry("org/c", "3"), entry("org/a", "9")]
+        self.assertEqual(
+            manifestdiff.diff(before, after),
+            {
+                "added": [{"repo": "org/d", "version": "4"}],
+                "removed": [{"repo": "org/b", "version": "2"}],
+                "changed": [{"repo": "org/a", "from": "1", "to": "9"}],
+                "unchanged": 1,
+            },
+        )
+
+    @pytest.mark.unittest
+    def test_table(self):
+        before = [entry("org/a", "1"), entry("org/backend", "2")]
+        after = [entry("org/a", "10"), entry("org/new", None)]
+        self.assertEqual(
+            manifestdiff.table(manifestdiff.diff(before, after)),
+            [
+                "CHANGE   REPO         FROM  TO",
+                "changed  org/a        1     10",
+                "added    org/new      -     -",
+                "removed  org/backend  2     -",
+            ],
+        )
+
+    @pytest.mark.pbt
+    def test_agrees_with_set_difference_in_any_order(self):
+        for seed in range(50):
+            rng = random.Random(seed)
+            repos = [f"org/repo-{i}" for i in range(rng.randint(0, 60))]
+            before = {repo: str(rng.randrange(3)) for repo in repos if rng.random() < 0.7}
+            after = {repo: str(rng.randrange(3)) for repo in repos if rng.random() < 0.7}
+            before_entries = [entry(repo, version) for repo, version in before.items()]
+            after_entries = [entry(repo, version) for repo, version in after.items()]
+            rng.shuffle(before_entries)
+            rng.shuffle(after_entries)
+            with self.subTest(seed=seed):
+                changes = manifestdiff.diff(before_entries, after_entries)
+                self.assertEqual({c["repo"] for c in changes["added"]}, after.keys() - before.keys())
+                self.assertEqual({c["repo"] for c in changes["removed"]}, before.keys() - after.keys())
+                self.assertEqual(
+                    {(c["repo"], c["from"], c["to"]) for c in changes["changed"]},
+                    {
+                        (repo, before[repo], after[repo])
+                        for repo in before.keys() & after.keys()
+                        if before[repo] != after[repo]
+                    },
+                )
+                self.assertEqual(
+                    changes["unchanged"],
+                    sum(1 for repo in before.keys() & after.keys() if before[repo] == after[repo]),
+                )
+                # The order the repos are listed in doesn't make a difference
+                rng.shuffle(after_entries)
+                self.assertEqual(manifestdiff.diff(after_entries, after_entries)["unchanged"], len(after))
+
+
+class TestDiffCommand(CliTestCase):
+    def setUp(self):
+        """Set up a product repo with the test config and manifests in a first commit"""
+        super().setUp()
+        self.work = self.git_root = os.path.join(self.temp_dir, "product")
+        git(self.temp_dir, "init", "--quiet", "--initial-branch", "main", self.work)
+        make_product(self.work)
+        git(self.work, "add", "-A")
+        git(self.work, "commit", "--quiet", "-m", "Initial product")
+
+    def rotate(self, sha):
+        code, _stdout, stderr = self.main(
+            "lock", "--repo", BACKEND, "--event-type", "branch", "--event-name", "main", "--sha", sha
+        )
+        self.assertEqual((code, stderr), (0, ""))
+
+    @pytest.mark.unittest
+    def test_work_tree_against_a_revision(self):
+        before = json.loads(git(self.work, "show", f"HEAD:{DEV_MANIFEST}"))["dev"]
+        version = {e["repo"]: e["version"] for e in before}[BACKEND]
+        self.rotate("a" * 40)
+
+        code, stdout, _stderr = self.main("diff", "--from", "dev@HEAD", "--to", "dev", "--exit-code")
+        self.assertEqual(code, 1)
+        result = json.loads(stdout)
+        self.assertEqual((result["from"], result["to"]), ("dev@HEAD", "dev"))
+        self.assertEqual(result["changed"], [{"repo": BACKEND, "from": version, "to": "a" * 40}])
+        self.assertEqual((result["added"], result["removed"]), ([], []))
+        self.assertEqual(result["unchanged"], len(before) - 1)
+
+        git(self.work, "commit", "--quiet", "-am", "Rotate the backend")
+        code, stdout, _stderr = self.main("diff", "--from", "dev@HEAD", "--to", "dev", "--exit-code")
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(stdout)["changed"], [])
+
+    @pytest.mark.unittest
+    def test_two_configurations_as_a_table(self):
+        code, stdout, _stderr = self.main("diff", "--from", "dev", "--to", "prod", "--format", "table")
+        self.assertEqual(code, 0)
+        lines = stdout.splitlines()
+        self.assertEqual(lines[0].split(), ["CHANGE", "REPO", "FROM", "TO"])
+        self.assertTrue(all(line.split()[0] in ("changed", "added", "removed") for line in lines[1:]))
+
+    @pytest.mark.unittest
+    def test_sharded_manifest_in_a_revision(self):
+        self.rotate("b" * 40)
+        code, _stdout, _stderr = self.main("migrate", "--configuration", "dev", "--layout", "sharded")
+        self.assertEqual(code, 0)
+        git(self.work, "add", "-A")
+        git(self.work, "commit", "--quiet", "-m", "Shard the dev manifest")
+        self.rotate("c" * 40)
+
+        code, stdout, _stderr = self.main("diff", "--from", "dev@HEAD~1", "--to", "dev@HEAD")
+        self.assertEqual(code, 0)
+        result = json.loads(stdout)
+        self.assertEqual([c["repo"] for c in result["changed"]], [BACKEND])
+        self.assertEqual(result["changed"][0]["to"], "b" * 40)
+
+        code, stdout, _stderr = self.main("diff", "--from", "dev@HEAD", "--to", "dev")
+        self.assertEqual(json.loads(stdout)["changed"], [{"repo": BACKEND, "from": "b" * 40, "to": "c" * 40}])
+
+    @pytest.mark.unittest
+    def test_manifest_missing_in_a_revision(self):
+        git(self.work, "commit", "--quiet", "--allow-empty", "-m", "Nothing")
+        root = git(self.work, "rev-list", "--max-parents=0", "HEAD")
+        git(self.work, "checkout", "--quiet", "--orphan", "empty")
+        git(self.work, "rm", "-r", "--quiet", "--cached", ".")
+        git(self.work, "commit", "--quiet", "--allow-empty", "-m", "Empty")
+        code, stdout, _stderr = self.main("diff", "--from", "dev@empty", "--to", f"dev@{root}")
+        self.assertEqual(code, 0)
+        result = json.loads(stdout)
+        # Every repo of the manifest is new - there was no manifest before
+        self.assertEqual((result["removed"], result["changed"], result["unchanged"]), ([], [], 0))
+        self.assertIn(BACKEND, [c["repo"] for c in result["added"]])
+
+    @pytest.mark.unittest
+    def test_errors(self):
+        code, _stdout, stderr = self.main("diff", "--from", "dev@no-such-rev", "--to", "dev")
+        self.assertEqual(code, 1)
+        self.assertIn("'no-such-rev' is not a revision of the product repo", stderr)
+        code, _stdout, stderr = self.main("diff", "--from", "staging", "--to", "dev")
+        self.assertEqual(code, 1)
+        self.assertIn("There is no configuration 'staging' in the config", stderr)
+
+
+class TestReadFiles(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_read_files(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        with patch.dict(os.environ, IDENTITY):
+            git(temp_dir, "init", "--quiet")
+            for name, content in [("a.json", "[]\n"), ("dir name/b c.json", "x" * 5000)]:
+                os.makedirs(os.path.dirname(os.path.join(temp_dir, name)), exist_ok=True)
+                with open(os.path.join(temp_dir, name), "w") as f:
+                    f.write(content)
+            git(temp_dir, "add", "-A")
+            git(temp_dir, "commit", "--quiet", "-m", "Files")
+        commit = gitcommit.resolve(temp_dir, "HEAD")
+        self.assertEqual(
+            gitcommit.read_files(temp_dir, commit, ["dir name/b c.json", "missing file", "a.json", "dir name"]),
+            {"dir name/b c.json": b"x" * 5000, "missing file": None, "a.json": b"[]\n", "dir name": None},
+        )
@@ -0,0 +1,174 @@
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.modules.manifestformat import (
+    detect_format,
+    dumps_entries,
+    dumps_manifest,
+    timestamp,
+)
+from gh_rotator.modules.rotator_handlers import handle_lock, handle_manifest, handle_migrate
+from gh_rotator.modules.rotator_parser import rotator_parse
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+
+BACKEND = "config-rotator/backend-component"
+
+
+class TestManifestFormat(unittest.TestCase):
+    @pytest.mark.pbt
+    def test_both_formats_round_trip(self):
+        rng = random.Random(5)
+        for case in range(50):
+            entries = [
+                {
+                    "repo": f"org-{rng.randrange(3)}/repo-{rng.randrange(100)}",
+                    "version": f"{rng.getrandbits(160):040x}",
+                    "ref_type": rng.choice(["branch", "tag"]),
+                    "ref_name": rng.choice(["main", "1.2.3", 'quo"te', "ünïcode"]),
+                    "last_update": timestamp(rng.choice(["pretty", "compact"])),
+                }
+                for _ in range(rng.randrange(4))
+            ]
+            manifest = {"dev": entries}
+            with self.subTest(case=case):
+                pretty = dumps_manifest(manifest, "pretty").encode("utf-8")
+                compact = dumps_manifest(manifest, "compact").encode("utf-8")
+                self.assertEqual(json.loads(pretty), manifest)
+                by_repo = sorted(entries, key=lambda entry: entry["repo"])
+                self.assertEqual(json.loads(compact), {"dev": by_repo})
+                self.assertEqual(json.loads(dumps_entries(entries, "compact")), by_repo)
+                if entries:
+                    self.assertEqual(detect_format(pretty), "pretty")
+                    self.assertEqual(detect_format(dumps_entries(entries, "pretty").encode()), "pretty")
+                    self.assertEqual(detect_format(dumps_entries(entries, "compact").encode()), "compact")
+                self.assertEqual(detect_format(compact), "compact")
+                # Compact is canonical: the order of the entries and their keys doesn't matter
+                shuffled = [dict(reversed(entry.items())) for entry in reversed(entries)]
+                self.assertEqual(dumps_manifest({"dev": shuffled}, "compact").encode(), compact)
+
+    @pytest.mark.unittest
+    def test_other_formatting_is_pretty(self):
+        entry = {"repo": "org/a", "version": "1", "ref_type": "tag", "ref_name": "1.0.0"}
+        manifest = {"dev": [entry, {**entry, "repo": "org/b"}]}
+        for content in [
+            json.dumps(manifest, indent=2),
+            json.dumps(manifest, indent="\t"),
+            json.dumps(manifest, indent=0),
+            json.dumps(manifest),
+            json.dumps(manifest, separators=(",", ":")),
+            json.dumps([entry], indent=2),
+            '{"dev":[\n{"repo": "org/a",\n"version": "1"}\n]}',
+        ]:
+            with self.subTest(content=content):
+                self.assertEqual(detect_format(content.encode()), "pretty")
+        self.assertEqual(detect_format(b'{"dev":[\n{"repo":"org/a"},\n{"repo":"org/b"}\n]}'), "compact")
+        self.assertEqual(detect_format(b'{"dev":[\n{"repo":"' + b"a" * 5000), "compact")
+
+    @pytest.mark.unittest
+    def test_compact_timestamp_is_iso_utc(self):
+        parsed = datetime.datetime.fromisoformat(timestamp("compact"))
+        self.assertEqual(parsed.utcoffset(), datetime.timedelta(0))
+
+
+class TestCompactManifest(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config and manifests"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        shutil.copy(
+            os.path.join(TEST_DATA_PATH, "config-rotator-valid.json"),
+            os.path.join(self.temp_dir, "config-rotator.json"),
+        )
+        shutil.copytree(
+            os.path.join(TEST_DATA_PATH, "manifests"), os.path.join(self.temp_dir, "configurations")
+        )
+        self.dev_file = os.path.join(self.temp_dir, "configurations", "dev", "config-dev-manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_command(self, handler, *argv):
+        args = rotator_parse([*argv, "--git-root", self.temp_dir])
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with patch("sys.stderr", new_callable=StringIO):
+                with self.assertRaises(SystemExit) as cm:
+                    handler(args)
+        return cm.exception.code, stdout.getvalue()
+
+    def read_lines(self):
+        with open(self.dev_file) as f:
+            return f.read().splitlines()
+
+    @pytest.mark.unittest
+    def test_rotation_keeps_the_compact_format(self):
+        code, before = self.run_command(handle_manifest, "manifest", "--configuration", "dev")
+        self.assertEqual(code, 0)
+
+        self.run_command(handle_migrate, "migrate", "--configuration", "dev", "--format", "compact")
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 5)
+        code, after = self.run_command(handle_manifest, "manifest", "--configuration", "dev")
+        self.assertEqual(json.loads(after)["dev"], sorted(json.loads(before)["dev"], key=lambda e: e["repo"]))
+
+        event = ("--repo", BACKEND, "--event-type", "branch", "--event-name", "main")
+        self.assertEqual(self.run_command(handle_lock, "lock", *event, "--sha", "a" * 40)[0], 0)
+
+        rotated = self.read_lines()
+        changed = [i for i, (a, b) in enumerate(zip(lines, rotated, strict=True)) if a != b]
+        self.assertEqual(len(changed), 1)
+        entry = json.loads(rotated[changed[0]].rstrip(","))
+        self.assertEqual((entry["repo"], entry["version"]), (BACKEND, "a" * 40))
+        datetime.datetime.fromisoformat(entry["last_update"])
+
+        self.run_command(handle_migrate, "migrate", "--configuration", "dev", "--format", "pretty")
+        self.assertEqual(self.read_lines()[1], '    "dev": [')
+
+    @pytest.mark.unittest
+    def test_rotation_keeps_a_differently_indented_manifest_pretty(self):
+        with open(self.dev_file) as f:
+            manifest = json.load(f)
+        with open(self.dev_file, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        event = ("--repo", BACKEND, "--event-type", "branch", "--event-name", "main")
+        self.assertEqual(self.run_command(handle_lock, "lock", *event, "--sha", "a" * 40)[0], 0)
+        lines = self.read_lines()
+        self.assertEqual(lines[1], '    "dev": [')
+        entry = next(e for e in json.loads("\n".join(lines))["dev"] if e["repo"] == BACKEND)
+        self.assertTrue(entry["last_update"].endswith("]"))
+
+    @pytest.mark.unittest
+    def test_sharded_compact(self):
+        self.run_command(
+            handle_migrate, "migrate", "--configuration", "dev", "--layout", "sharded", "--format", "compact"
+        )
+        shards_dir = os.path.join(self.temp_dir, "configurations", "dev", "shards")
+        with open(os.path.join(shards_dir, "index.json")) as f:
+            self.assertEqual(json.load(f)["format"], "compact")
+        event = ("--repo", BACKEND, "--event-type", "branch", "--event-name", "main")
+        self.assertEqual(self.run_command(handle_lock, "lock", *event, "--sha", "b" * 40)[0], 0)
+        self.assertEqual(
+            self.run_command(handle_manifest, "manifest", "--configuration", "dev", "--repo", BACKEND),
+            (0, f"{'b' * 40}\n"),
+        )
+
+        # Re-sharding by owner drops the shards by hash
+        self.run_command(handle_migrate, "migrate", "--configuration", "dev", "--shard-by", "owner")
+        self.assertEqual(sorted(os.listdir(shards_dir)), ["index.json", "shard-config-rotator.json"])
+
+    @pytest.mark.unittest
+    def test_migrate_needs_a_target(self):
+        with patch("sys.stderr", new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                rotator_parse(["migrate", "--configuration", "dev"])
@@ -0,0 +1,217 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.classes.manifesthistory import ManifestHistory, parse_point, upsert
+from gh_rotator.modules.rotator_handlers import handle_lock, handle_manifest
+from gh_rotator.modules.rotator_parser import rotator_parse
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+
+BACKEND = "config-rotator/backend-component"
+ORIGINAL_DEV_VERSION = "1a0b35a3cf0416b9ae8017509941334608243840"
+
+
+def event(repo, version):
+    return {
+        "repo": repo,
+        "version": version,
+        "ref_type": "branch",
+        "ref_name": "main",
+        "last_update": "2025-05-15 (07:51:28) [UTC]",
+    }
+
+
+def replay(start, events):
+    entries = [dict(entry) for entry in start]
+    index = {entry["repo"]: entry for entry in entries}
+    for e in events:
+        upsert(entries, index, e)
+    return entries
+
+
+class TestManifestHistory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.history = ManifestHistory(os.path.join(self.temp_dir, "history"), snapshot_interval=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.unittest
+    def test_parse_point(self):
+        self.assertEqual(parse_point("42"), ("seq", 42))
+        self.assertEqual(parse_point("2025-05-15T07:51:28+00:00"), ("time", 1747295488.0))
+        with self.assertRaises(ValueError):
+            parse_point("yesterday")
+
+    @pytest.mark.pbt
+    def test_any_point_equals_a_full_replay(self):
+        rng = random.Random(11)
+        start = [event("org/seed", "0")]
+        self.history.start([dict(entry) for entry in start], when=1000.0)
+        entries = [dict(entry) for entry in start]
+        index = {entry["repo"]: entry for entry in entries}
+        log = []
+        boundaries = []
+
+        for batch in range(30):
+            events = [
+                event(f"org/repo-{rng.randrange(8)}", f"{batch}-{i}")
+                for i in range(rng.randrange(1, 5))
+            ]
+            for e in events:
+                upsert(entries, index, e)
+            seq = self.history.append(events, entries, when=1000.0 + batch)
+            log += events
+            boundaries.append(len(log))
+            self.assertEqual(seq, len(log))
+
+        for seq in range(len(log) + 1):
+            with self.subTest(seq=seq):
+                self.assertEqual(self.history.at("seq", seq), replay(start, log[:seq]))
+        for batch, boundary in enumerate(boundaries):
+            with self.subTest(batch=batch):
+                self.assertEqual(
+                    self.history.at("time", 1000.5 + batch), replay(start, log[:boundary])
+                )
+
+    @pytest.mark.unittest
+    def test_time_points(self):
+        self.history.start([], when=1000.0)
+        self.history.append([event("org/a", "1")], [event("org/a", "1")], when=1010.0)
+        self.history.append([event("org/a", "2")], [event("org/a", "2")], when=1020.0)
+        # An earlier clock never moves the history back in time
+        self.history.append([event("org/a", "3")], [event("org/a", "3")], when=1015.0)
+
+        self.assertIsNone(self.history.at("time", 999.0))
+        self.assertEqual(self.history.at("time", 1005.0), [])
+        self.assertEqual(self.history.at("time", 1010.0)[0]["version"], "1")
+        self.assertEqual(self.history.at("time", 1019.0)[0]["version"], "1")
+        self.assertEqual(self.history.at("time", 1020.0)[0]["version"], "3")
+
+    @pytest.mark.unittest
+    def test_events_moved_by_a_merge_or_line_endings(self):
+        self.history.start([], when=1000.0)
+        log = [event(f"org/repo-{i % 4}", str(i)) for i in range(10)]
+        for i, e in enumerate(log):
+            self.history.append([e], replay([], log[: i + 1]), when=1000.0 + i)
+        events_file = os.path.join(self.temp_dir, "history", "events.jsonl")
+        snapshots_file = os.path.join(self.temp_dir, "history", "snapshots.jsonl")
+        # Byte offsets kept by an older history no longer point at the events - as after autocrlf
+        # rewrote the line endings, and a merge put the events of another branch in between
+        with open(snapshots_file) as f:
+            snapshots = [{**json.loads(line), "offset": 5} for line in f]
+        with open(snapshots_file, "w") as f:
+            f.writelines(json.dumps(snapshot) + "\n" for snapshot in snapshots)
+        with open(events_file, "rb") as f:
+            lines = f.read().splitlines()
+        with open(events_file, "wb") as f:
+            f.write(b"\r\n".join(lines[:2] + [b""] + lines[2:]) + b"\r\n")
+
+        for seq in range(len(log) + 1):
+            with self.subTest(seq=seq):
+                self.assertEqual(self.history.at("seq", seq), replay([], log[:seq]))
+
+    @pytest.mark.unittest
+    def test_broken_history(self):
+        self.history.start([], when=1000.0)
+        self.history.append([event("org/a", "1")], [event("org/a", "1")], when=1010.0)
+        with open(os.path.join(self.temp_dir, "history", "events.jsonl"), "a") as f:
+            f.write('{"seq": 2, "time"\n')
+        with self.assertRaisesRegex(ValueError, "The history in .* is broken"):
+            self.history.at("seq", 2)
+
+        os.remove(os.path.join(self.temp_dir, "history", "snapshot-0.json"))
+        with self.assertRaisesRegex(ValueError, "snapshot-0.json"):
+            self.history.at("seq", 1)
+
+    @pytest.mark.unittest
+    def test_last_event_spanning_read_chunks(self):
+        self.history.start([], when=1000.0)
+        with patch("gh_rotator.classes.manifesthistory.TAIL_CHUNK", 7):
+            for i in range(5):
+                self.assertEqual(
+                    self.history.append([event("org/a", str(i))], [], when=1000.0), i + 1
+                )
+
+
+class TestManifestAt(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config and manifests"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        shutil.copy(
+            os.path.join(TEST_DATA_PATH, "config-rotator-valid.json"),
+            os.path.join(self.temp_dir, "config-rotator.json"),
+        )
+        shutil.copytree(
+            os.path.join(TEST_DATA_PATH, "manifests"), os.path.join(self.temp_dir, "configurations")
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_command(self, handler, *argv):
+        args = rotator_parse([*argv, "--git-root", self.temp_dir])
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with patch("sys.stderr", new_callable=StringIO):
+                with self.assertRaises(SystemExit) as cm:
+                    handler(args)
+        return cm.exception.code, stdout.getvalue()
+
+    def lock(self, sha):
+        event = ("--repo", BACKEND, "--event-type", "branch", "--event-name", "main")
+        return self.run_command(handle_lock, "lock", *event, "--sha", sha)
+
+    def version_at(self, point):
+        return self.run_command(
+            handle_manifest, "manifest", "--configuration", "dev", "--repo", BACKEND, "--at", point
+        )
+
+    @pytest.mark.unittest
+    def test_rotations_are_logged_and_replayed(self):
+        self.lock("a" * 40)
+        # Unchanged rotations are not logged
+        self.lock("a" * 40)
+        self.lock("b" * 40)
+
+        with open(
+            os.path.join(self.temp_dir, "configurations", "dev", "history", "events.jsonl")
+        ) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([e["seq"] for e in events], [1, 2])
+
+        self.assertEqual(self.version_at("0"), (0, f"{ORIGINAL_DEV_VERSION}\n"))
+        self.assertEqual(self.version_at("1"), (0, f"{'a' * 40}\n"))
+        self.assertEqual(self.version_at("2"), (0, f"{'b' * 40}\n"))
+        self.assertEqual(self.version_at("2999-01-01T00:00:00"), (0, f"{'b' * 40}\n"))
+        self.assertEqual(self.version_at("2000-01-01T00:00:00")[0], 1)
+        self.assertEqual(self.version_at("never")[0], 1)
+
+        code, output = self.run_command(
+            handle_manifest, "manifest", "--configuration", "dev", "--at", "1"
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(len(json.loads(output)["dev"]), 3)
+
+    @pytest.mark.unittest
+    def test_broken_history_is_an_error(self):
+        self.lock("a" * 40)
+        os.remove(os.path.join(self.temp_dir, "configurations", "dev", "history", "snapshot-0.json"))
+        args = rotator_parse(
+            ["manifest", "--configuration", "dev", "--repo", BACKEND, "--at", "1", "--git-root", self.temp_dir]
+        )
+        with patch("sys.stderr", new_callable=StringIO) as stderr:
+            with self.assertRaises(SystemExit) as cm:
+                handle_manifest(args)
+        self.assertEqual(cm.exception.code, 1)
+        self.assertRegex(stderr.getvalue(), r"Error: The history in .* is broken")
@@ -0,0 +1,123 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import RepoContext
+from gh_rotator.modules.manifestformat import dumps_entries, dumps_manifest
+from gh_rotator.modules.manifestscan import find_entry
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+
+BACKEND = "config-rotator/backend-component"
+# Values that look like JSON structure, or like the key searched for
+TRICKY = ["main", "{", "}", '"repo": "org/a"', '{"repo":"org/a"}', "\\", "ünï", "a},{b"]
+
+
+class TestFindEntry(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.temp_dir, "manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.pbt
+    def test_same_as_the_index(self):
+        rng = random.Random(17)
+        repos = [f"org/{name}" for name in ("a", "b", "c", "ü", 'q"uote', "d")]
+        for case in range(100):
+            entries = [
+                {
+                    "repo": rng.choice(repos),
+                    "version": f"{rng.getrandbits(64):016x}",
+                    "ref_type": "branch",
+                    "ref_name": rng.choice(TRICKY),
+                    "last_update": rng.choice(TRICKY),
+                }
+                for _ in range(rng.randrange(6))
+            ]
+            manifest_format = rng.choice(["pretty", "compact"])
+            content = dumps_manifest({"dev": entries}, manifest_format)
+            with open(self.file, "w") as f:
+                f.write(content)
+
+            index = {}
+            for entry in json.loads(content)["dev"]:
+                index.setdefault(entry["repo"], entry)
+            for repo in repos:
+                with self.subTest(case=case, repo=repo, manifest_format=manifest_format):
+                    self.assertEqual(find_entry(self.file, repo), index.get(repo))
+
+    @pytest.mark.unittest
+    def test_shard_file(self):
+        entries = [{"repo": "org/a", "version": "1"}, {"repo": "org/b", "version": "2"}]
+        for manifest_format in ("pretty", "compact"):
+            with open(self.file, "w") as f:
+                f.write(dumps_entries(entries, manifest_format))
+            self.assertEqual(find_entry(self.file, "org/b"), entries[1])
+            self.assertIsNone(find_entry(self.file, "org/c"))
+
+
+class TestStreamingLookup(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config and manifests"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        shutil.copy(
+            os.path.join(TEST_DATA_PATH, "config-rotator-valid.json"),
+            os.path.join(self.temp_dir, "config-rotator.json"),
+        )
+        shutil.copytree(
+            os.path.join(TEST_DATA_PATH, "manifests"), os.path.join(self.temp_dir, "configurations")
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def manifest(self):
+        config = ProductConfig(context=RepoContext(git_root=self.temp_dir))
+        return ProductManifest(config)
+
+    @pytest.mark.unittest
+    def test_large_manifest_is_not_loaded(self):
+        eager = self.manifest().get_version("dev", BACKEND)
+
+        manifest = self.manifest()
+        with patch("gh_rotator.modules.manifestscan.STREAM_THRESHOLD", 0):
+            with patch("json.load", wraps=json.load) as load:
+                self.assertEqual(manifest.get_version("dev", BACKEND), eager)
+                load.assert_not_called()
+                with self.assertRaises(SystemExit):
+                    manifest.get_version("dev", "config-rotator/unknown")
+                load.assert_not_called()
+        self.assertNotIn("dev_manifest", manifest.props)
+
+    @pytest.mark.unittest
+    def test_sharded_manifest_reads_one_shard(self):
+        manifest = self.manifest()
+        eager = manifest.get_version("dev", BACKEND)
+        manifest.migrate("dev", layout="sharded")
+
+        manifest = self.manifest()
+        with patch("gh_rotator.classes.manifestshards.ManifestShards.load") as load:
+            self.assertEqual(manifest.get_version("dev", BACKEND), eager)
+            with self.assertRaises(SystemExit):
+                manifest.get_version("dev", "config-rotator/unknown")
+            load.assert_not_called()
+
+    @pytest.mark.unittest
+    def test_loaded_manifest_is_used(self):
+        manifest = self.manifest()
+        manifest.rotate(BACKEND, "main", "branch", "c" * 40, save=False)
+        with patch("gh_rotator.modules.manifestscan.STREAM_THRESHOLD", 0):
+            # The rotation not saved yet is found
+            self.assertEqual(manifest.get_version("dev", BACKEND), "c" * 40)
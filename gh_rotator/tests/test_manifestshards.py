@@ -0,0 +1,205 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.classes.manifestshards import ManifestShards, shard_name
+from gh_rotator.modules.rotator_handlers import handle_lock, handle_manifest, handle_migrate
+from gh_rotator.modules.rotator_parser import rotator_parse
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+
+BACKEND = "config-rotator/backend-component"
+
+
+class TestManifestShards(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.shards = ManifestShards(os.path.join(self.temp_dir, "shards"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.unittest
+    def test_shard_name(self):
+        self.assertEqual(shard_name("org/repo", "owner"), "org")
+        self.assertEqual(shard_name("../repo", "owner"), "..")
+        self.assertEqual(shard_name("a b/repo", "owner"), "a_20b")
+        # The escapes of unsafe characters - and of "_" itself - never collide
+        self.assertEqual(shard_name("a_b/repo", "owner"), "a_5fb")
+        self.assertEqual(shard_name("a.b/repo", "owner"), "a.b")
+        self.assertEqual(shard_name("ü/repo", "owner"), "_c3_bc")
+        self.assertEqual(shard_name("/repo", "owner"), "")
+        self.assertRegex(shard_name("org/repo", "hash"), r"^[0-9a-f]{2}$")
+
+    @pytest.mark.unittest
+    def test_save_and_load(self):
+        entries = [{"repo": f"org-{i % 3}/repo-{i}", "version": str(i)} for i in range(9)]
+        self.assertFalse(self.shards.exists())
+        self.assertTrue(self.shards.save(entries, shard_by="owner"))
+        self.assertTrue(self.shards.exists())
+        self.assertEqual(
+            sorted(os.listdir(self.shards.get("directory"))),
+            ["index.json", "shard-org-0.json", "shard-org-1.json", "shard-org-2.json"],
+        )
+        self.assertCountEqual(self.shards.load(), entries)
+        # Nothing changed - nothing is written
+        self.assertFalse(self.shards.save(entries))
+
+        entries[4]["version"] = "new"
+        with patch("gh_rotator.modules.fileio.write_if_changed", return_value=True) as write:
+            self.shards.save(entries, repos=["org-1/repo-4"])
+        written = [os.path.basename(call.args[0]) for call in write.call_args_list]
+        self.assertEqual(written, ["shard-org-1.json", "index.json"])
+
+        # Writing all shards removes the shards no longer needed - and leaves other files alone
+        for name in (".gitkeep", ".shard-org-0.json.x1y2.tmp", "README.md"):
+            with open(os.path.join(self.shards.get("directory"), name), "w") as f:
+                f.write("")
+        self.assertTrue(self.shards.save([e for e in entries if not e["repo"].startswith("org-2/")]))
+        self.assertEqual(
+            sorted(os.listdir(self.shards.get("directory"))),
+            [".gitkeep", ".shard-org-0.json.x1y2.tmp", "README.md", "index.json", "shard-org-0.json", "shard-org-1.json"],
+        )
+
+        self.shards.remove()
+        self.assertFalse(os.path.exists(self.shards.get("directory")))
+
+    @pytest.mark.unittest
+    def test_owner_named_index(self):
+        entries = [{"repo": "index/repo", "version": "1"}, {"repo": "org/repo", "version": "2"}]
+        self.shards.save(entries, shard_by="owner")
+        self.assertEqual(self.shards.index()["shards"], ["index", "org"])
+        self.assertEqual(
+            sorted(os.listdir(self.shards.get("directory"))),
+            ["index.json", "shard-index.json", "shard-org.json"],
+        )
+        self.assertEqual(self.shards.load(), entries)
+
+        entries[0]["version"] = "new"
+        self.shards.save(entries, repos=["index/repo"])
+        self.assertEqual(self.shards.index()["shard_by"], "owner")
+        self.assertEqual(self.shards.load(), entries)
+
+    @pytest.mark.unittest
+    def test_shards_named_the_old_way(self):
+        entries = [{"repo": "a_b/repo", "version": "1"}, {"repo": "org/repo", "version": "2"}]
+        directory = self.shards.get("directory")
+        os.makedirs(directory)
+        for shard, shard_entries in (("a_b", entries[:1]), ("org", entries[1:])):
+            with open(os.path.join(directory, f"{shard}.json"), "w") as f:
+                json.dump(shard_entries, f)
+        with open(self.shards.get("index_file"), "w") as f:
+            json.dump({"shard_by": "owner", "shards": ["a_b", "org"]}, f)
+        self.assertEqual(self.shards.load(), entries)
+        # The shard of a repo can't be told from its name
+        with self.assertRaises(ValueError):
+            self.shards.shard_file_of("org/repo")
+
+        # Writing one shard renames them all
+        entries[1]["version"] = "new"
+        self.assertTrue(self.shards.save(entries, repos=["org/repo"]))
+        self.assertEqual(
+            sorted(os.listdir(directory)), ["index.json", "shard-a_5fb.json", "shard-org.json"]
+        )
+        self.assertEqual(self.shards.load(), entries)
+        self.assertEqual(self.shards.shard_file_of("org/repo"), os.path.join(directory, "shard-org.json"))
+
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config and manifests"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        shutil.copy(
+            os.path.join(TEST_DATA_PATH, "config-rotator-valid.json"),
+            os.path.join(self.temp_dir, "config-rotator.json"),
+        )
+        shutil.copytree(
+            os.path.join(TEST_DATA_PATH, "manifests"), os.path.join(self.temp_dir, "configurations")
+        )
+        self.dev_dir = os.path.join(self.temp_dir, "configurations", "dev")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_command(self, handler, *argv):
+        args = rotator_parse([*argv, "--git-root", self.temp_dir])
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with patch("sys.stderr", new_callable=StringIO):
+                with self.assertRaises(SystemExit) as cm:
+                    handler(args)
+        return cm.exception.code, stdout.getvalue()
+
+    def versions(self):
+        code, output = self.run_command(
+            handle_manifest, "manifest", "--all-configurations", "--format", "tsv"
+        )
+        self.assertEqual(code, 0)
+        return sorted(output.splitlines())
+
+    def migrate(self, *argv):
+        return self.run_command(handle_migrate, "migrate", *argv)
+
+    @pytest.mark.unittest
+    def test_both_layouts_read_the_same(self):
+        flat = self.versions()
+        self.assertEqual(self.migrate("--all-configurations", "--layout", "sharded")[0], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.dev_dir, "config-dev-manifest.json")))
+        self.assertTrue(os.path.exists(os.path.join(self.dev_dir, "shards", "index.json")))
+        self.assertEqual(self.versions(), flat)
+
+        self.assertEqual(self.migrate("--configuration", "dev", "--layout", "flat")[0], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.dev_dir, "shards")))
+        self.assertEqual(self.versions(), flat)
+
+    @pytest.mark.unittest
+    def test_rotation_rewrites_one_shard(self):
+        self.migrate("--configuration", "dev", "--layout", "sharded")
+        shards_dir = os.path.join(self.dev_dir, "shards")
+        for file in os.listdir(shards_dir):
+            os.utime(os.path.join(shards_dir, file), ns=(0, 0))
+
+        event = ("--repo", BACKEND, "--event-type", "branch", "--event-name", "main")
+        self.assertEqual(self.run_command(handle_lock, "lock", *event, "--sha", "a" * 40)[0], 0)
+
+        touched = [
+            file for file in os.listdir(shards_dir) if os.stat(os.path.join(shards_dir, file)).st_mtime_ns
+        ]
+        self.assertEqual(touched, [f"shard-{shard_name(BACKEND, 'hash')}.json"])
+        with open(os.path.join(shards_dir, touched[0])) as f:
+            self.assertEqual(json.load(f)[0]["version"], "a" * 40)
+
+        code, output = self.run_command(
+            handle_manifest, "manifest", "--configuration", "dev", "--repo", BACKEND
+        )
+        self.assertEqual((code, output), (0, f"{'a' * 40}\n"))
+
+    @pytest.mark.unittest
+    def test_migrate_renames_shards_named_the_old_way(self):
+        self.migrate("--configuration", "dev", "--layout", "sharded")
+        versions = self.versions()
+        shards = ManifestShards(os.path.join(self.dev_dir, "shards"))
+        index = shards.index()
+        for shard in index["shards"]:
+            directory = shards.get("directory")
+            os.rename(os.path.join(directory, f"shard-{shard}.json"), os.path.join(directory, f"{shard}.json"))
+        del index["prefix"]
+        with open(shards.get("index_file"), "w") as f:
+            json.dump(index, f)
+        self.assertEqual(self.versions(), versions)
+
+        self.assertEqual(self.migrate("--configuration", "dev", "--layout", "sharded")[0], 0)
+        self.assertEqual(shards.index()["prefix"], "shard-")
+        self.assertTrue(all(file.startswith("shard-") for file in os.listdir(shards.get("directory")) if file != "index.json"))
+        self.assertEqual(self.versions(), versions)
+
+    @pytest.mark.unittest
+    def test_unknown_configuration(self):
+        self.assertEqual(self.migrate("--configuration", "nope", "--layout", "sharded")[0], 1)
@@ -0,0 +1,145 @@
+import json
+import os
+import time
+from argparse import Namespace
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator import gh_rotator
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import RepoContext
+from gh_rotator.modules import multiproduct
+from gh_rotator.modules.fileio import file_lock
+from gh_rotator.tests.cli_helpers import CliTestCase, make_product
+
+BACKEND = "config-rotator/backend-component"
+DEV_MANIFEST = os.path.join("configurations", "dev", "config-dev-manifest.json")
+
+
+class TestLockProducts(CliTestCase):
+    def setUp(self):
+        """Set up product repos with the test config and manifests, and a file listing them"""
+        super().setUp()
+        # Every product is named in the products file, not with --git-root
+        self.git_root = None
+        self.products = [self.product(name) for name in ("alpha", "beta", "gamma")]
+        self.products_file = os.path.join(self.temp_dir, "products.txt")
+        self.write_products(self.products)
+
+    def product(self, name, config=None):
+        return make_product(os.path.join(self.temp_dir, name), config)
+
+    def write_products(self, roots):
+        with open(self.products_file, "w") as f:
+            f.write("# Products rotated on every release\n\n" + "\n".join(roots) + "\n")
+
+    def version(self, root, repo=BACKEND):
+        with open(os.path.join(root, DEV_MANIFEST)) as f:
+            return {entry["repo"]: entry["version"] for entry in json.load(f)["dev"]}[repo]
+
+    def lock(self, *argv, sha="a" * 40):
+        """Run lock --products - returns its exit code, the results and stderr"""
+        code, stdout, stderr = self.main(
+            "lock", "--repo", BACKEND, "--event-type", "branch", "--event-name", "main",
+            "--sha", sha, "--products", self.products_file, *argv,
+        )  # fmt: skip
+        return code, [json.loads(line) for line in stdout.splitlines()], stderr
+
+    @pytest.mark.unittest
+    def test_rotates_every_product(self):
+        code, results, stderr = self.lock("--workers", "2")
+        self.assertEqual(code, 0)
+        self.assertEqual([r["product"] for r in results], self.products)
+        self.assertEqual({r["status"] for r in results}, {"rotated"})
+        self.assertEqual(results[0]["configurations"], ["dev"])
+        for root in self.products:
+            self.assertEqual(self.version(root), "a" * 40)
+        self.assertIn("3 product(s): 3 rotated", stderr)
+
+        code, results, _stderr = self.lock()
+        self.assertEqual(code, 0)
+        self.assertEqual({r["status"] for r in results}, {"unchanged"})
+
+    @pytest.mark.unittest
+    def test_products_without_a_match_are_left_alone(self):
+        other = self.product("other", {"dev": [{"repo": "org/.*", "ref_type": "branch", "ref_name": "main"}]})
+        broken = self.product("broken")
+        with open(os.path.join(broken, "config-rotator.json"), "w") as f:
+            f.write('{"dev": [')
+        before = os.path.getmtime(os.path.join(other, DEV_MANIFEST))
+        self.write_products([self.products[0], other, broken])
+
+        code, results, stderr = self.lock()
+        self.assertEqual(code, 1)
+        self.assertEqual([r["status"] for r in results], ["rotated", "no-match", "error"])
+        self.assertIn("not a valid JSON file", results[2]["error"])
+        self.assertEqual(os.path.getmtime(os.path.join(other, DEV_MANIFEST)), before)
+        self.assertIn("1 rotated, 1 no-match, 1 error", stderr)
+
+    @pytest.mark.unittest
+    def test_product_timeout(self):
+        args = Namespace(product_timeout=0.05, verbose=False)
+        with patch.object(multiproduct, "_rotate", side_effect=lambda _args, _deadline: time.sleep(5)):
+            start = time.monotonic()
+            result = multiproduct.rotate_product(args, self.products[0])
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(result["status"], "timeout")
+        self.assertEqual(result["error"], "Timed out after 0.05s")
+
+    @pytest.mark.unittest
+    def test_product_timeout_while_writing(self):
+        args = Namespace(product_timeout=0.05, verbose=False)
+        written = []
+
+        def rotate(_args, deadline):
+            with deadline.shield():
+                time.sleep(0.2)
+                written.append(True)
+
+        with patch.object(multiproduct, "_rotate", side_effect=rotate):
+            result = multiproduct.rotate_product(args, self.products[0])
+        # The write wasn't interrupted, but the product still took too long
+        self.assertEqual(written, [True])
+        self.assertEqual(result["status"], "timeout")
+        self.assertEqual(result["error"], "Timed out after 0.05s - the manifests were written by then")
+
+    @pytest.mark.unittest
+    def test_product_timeout_waiting_for_a_lock(self):
+        config = ProductConfig(context=RepoContext(git_root=self.products[0]))
+        lock_file = ProductManifest(config)._ProductManifest__lock_file("dev")
+        before = os.path.getmtime(os.path.join(self.products[0], DEV_MANIFEST))
+        # Another run holds the lock on the manifest of the first product for longer than it may take
+        with file_lock(lock_file):
+            start = time.monotonic()
+            code, results, _stderr = self.lock("--product-timeout", "0.5", "--lock-timeout", "30")
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(code, 1)
+        self.assertEqual([r["status"] for r in results], ["timeout", "rotated", "rotated"])
+        self.assertEqual(results[0]["error"], "Timed out after 0.5s")
+        self.assertEqual(os.path.getmtime(os.path.join(self.products[0], DEV_MANIFEST)), before)
+
+    @pytest.mark.unittest
+    def test_missing_products_file(self):
+        os.remove(self.products_file)
+        code, _results, stderr = self.lock()
+        self.assertEqual(code, 1)
+        self.assertIn(f"Products file '{self.products_file}' not found", stderr)
+
+    @pytest.mark.unittest
+    def test_products_options(self):
+        for argv, message in [
+            (["lock", "--repo", BACKEND, "--event-type", "branch", "--event-name", "main",
+              "--sha", "a" * 40, "--workers", "2"], "--workers can only be used with --products"),
+            (["lock", "--repo", BACKEND, "--event-type", "branch", "--event-name", "main",
+              "--sha", "a" * 40, "--products", "p.txt", "--git-root", "."], "cannot be combined"),
+            (["lock", "--repo", BACKEND, "--event-type", "branch", "--event-name", "main",
+              "--sha", "a" * 40, "--products", "p.txt", "--workers", "0"], "at least 1"),
+        ]:  # fmt: skip
+            with self.subTest(argv=argv):
+                with patch("sys.stderr", new_callable=StringIO) as stderr:
+                    with self.assertRaises(SystemExit):
+                        gh_rotator.rotator_parse(argv)
+                self.assertIn(message, stderr.getvalue())
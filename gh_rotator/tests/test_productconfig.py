@@ -1,5 +1,7 @@
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 from io import StringIO
 from unittest.mock import patch
@@ -15,6 +17,7 @@ sys.path.append(class_path)
 TEST_DATA_PATH = os.path.join(test_dir, "data")
 
 from productconfig import ProductConfig
+from gh_rotator.classes.repocontext import RepoContext
 
 
 class TestProject(unittest.TestCase):
@@ -22,16 +25,23 @@ class TestProject(unittest.TestCase):
         """Set up test variables before each test"""
         self.valid_config_path = os.path.join(TEST_DATA_PATH, "config-rotator-valid.json")
         self.invalid_config_path = os.path.join(TEST_DATA_PATH, "config-rotator-invalid.json")
+        # A repo of its own, so the config cache is kept there, not in the checkout
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        self.context = RepoContext(git_root=self.temp_dir)
 
     @pytest.mark.unittest
     def test_load_config_success(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         # Assertions
         self.assertRegex(config.get("config_file"), r"config-rotator-valid.json")
+        cache_dir = os.path.join(self.temp_dir, ".git", "gh-rotator", "cache")
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
 
     @pytest.mark.unittest
     def test_load_explicit_config_success(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         # Assertions
         self.assertRegex(config.get("config_file"), r"config-rotator-valid.json")
 
@@ -41,7 +51,7 @@ class TestProject(unittest.TestCase):
         # capture stderr and check for error message
         with patch("sys.stderr", new_callable=StringIO) as mock_stderr:
             with self.assertRaises(SystemExit) as cm:
-                config = ProductConfig(file="blaha.json")
+                config = ProductConfig(file="blaha.json", context=self.context)
             stderr_output = mock_stderr.getvalue()
             self.assertRegex(stderr_output, "Error: Config file .* not found")
             self.assertEqual(cm.exception.code, 1)
@@ -51,7 +61,7 @@ class TestProject(unittest.TestCase):
         # Capture stderr and check for error message
         with patch("sys.stderr", new_callable=StringIO) as mock_stderr:
             with self.assertRaises(SystemExit) as cm:
-                config = ProductConfig(file=self.invalid_config_path)
+                config = ProductConfig(file=self.invalid_config_path, context=self.context)
             # Get the captured stderr content
             stderr_output = mock_stderr.getvalue()
 
@@ -60,9 +70,10 @@ class TestProject(unittest.TestCase):
             self.assertEqual(cm.exception.code, 1)
 
     @pytest.mark.unittest
+    @patch("gh_rotator.classes.repocontext.find_git_root", return_value=None)
     @patch("subprocess.check_output")
     @patch("os.path.exists")
-    def test_default_config_repo_root(self, mock_exists, mock_check_output):
+    def test_default_config_repo_root(self, mock_exists, mock_check_output, mock_find_git_root):
         """Test that the default config file is found in the repo root"""
         # Mock git command to return a fake repo root
         mock_check_output.return_value = b"/fake/path"
@@ -87,10 +98,13 @@ class TestProject(unittest.TestCase):
                 self.assertEqual(config.get("config_file"), "/fake/path/config-rotator.json")
 
     @pytest.mark.unittest
+    @patch("gh_rotator.classes.repocontext.find_git_root", return_value=None)
     @patch("subprocess.check_output")
     @patch("os.path.exists")
     @patch("os.path.dirname")
-    def test_default_config_fallback(self, mock_dirname, mock_exists, mock_check_output):
+    def test_default_config_fallback(
+        self, mock_dirname, mock_exists, mock_check_output, mock_find_git_root
+    ):
         """Test fallback to the built-in default config"""
         # Mock git command to return a fake repo root
         mock_check_output.return_value = b"/fake/path"
@@ -120,9 +134,10 @@ class TestProject(unittest.TestCase):
                 self.assertEqual(config.get("config_file"), "/fake/path/config/config-rotator.json")
 
     @pytest.mark.unittest
+    @patch("gh_rotator.classes.repocontext.find_git_root", return_value=None)
     @patch("subprocess.check_output")
     @patch("os.path.exists")
-    def test_no_default_config_found(self, mock_exists, mock_check_output):
+    def test_no_default_config_found(self, mock_exists, mock_check_output, mock_find_git_root):
         """Test error when no default config is found"""
         # Mock git command to return a fake repo root
         mock_check_output.return_value = b"/fake/path"
@@ -145,7 +160,7 @@ class TestProject(unittest.TestCase):
     @pytest.mark.unittest
     def test_get_config_name_successful_matches(self):
         """Test successful pattern matching"""
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         
         # Test dev (branch)
         result = config.get_config_name("config-rotator/backend-component", "main", "branch")
@@ -162,7 +177,7 @@ class TestProject(unittest.TestCase):
     @pytest.mark.unittest  
     def test_get_config_name_partial_match_rejection(self):
         """Test that partial matches are properly rejected (the bug we fixed)"""
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         
         test_cases = [
             ("config-rotator/backend-component", "mains", "branch"),  # Should NOT match "main"
@@ -180,7 +195,7 @@ class TestProject(unittest.TestCase):
     @pytest.mark.unittest
     def test_get_config_name_invalid_tag_formats(self):
         """Test various invalid tag formats that should be rejected"""
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         
         invalid_tags = [
             "1.2",          # Not enough version parts
@@ -204,7 +219,7 @@ class TestProject(unittest.TestCase):
     @pytest.mark.unittest
     def test_get_config_name_wrong_event_type(self):
         """Test that wrong event type is rejected"""
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         
         with patch("sys.stderr", new_callable=StringIO):
             with self.assertRaises(SystemExit) as cm:
@@ -218,7 +233,7 @@ class TestProject(unittest.TestCase):
     @pytest.mark.unittest
     def test_get_config_name_invalid_repo(self):
         """Test that non-matching repo is rejected"""
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         
         with patch("sys.stderr", new_callable=StringIO):
             with self.assertRaises(SystemExit) as cm:
@@ -0,0 +1,101 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.classes.configmatcher import CACHE_FORMAT, ConfigMatcher
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.repocontext import RepoContext
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+VALID_CONFIG_PATH = os.path.join(test_dir, "data", "config-rotator-valid.json")
+
+BACKEND = "config-rotator/backend-component"
+
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        self.config_file = os.path.join(self.temp_dir, "config-rotator.json")
+        shutil.copy(VALID_CONFIG_PATH, self.config_file)
+        self.cache_dir = os.path.join(self.temp_dir, ".git", "gh-rotator", "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def load(self):
+        return ProductConfig(context=RepoContext(git_root=self.temp_dir))
+
+    def cache_file(self):
+        (name,) = os.listdir(self.cache_dir)
+        return os.path.join(self.cache_dir, name)
+
+    @pytest.mark.unittest
+    def test_warm_load_skips_compiling(self):
+        cold = self.load()
+        self.assertTrue(os.path.exists(self.cache_file()))
+
+        with patch("re.compile", wraps=re.compile) as mock_compile:
+            warm = self.load()
+            mock_compile.assert_not_called()
+
+        self.assertEqual(warm.get("config"), cold.get("config"))
+        for event in [(BACKEND, "main", "branch"), (BACKEND, "1.0.0", "tag"), (BACKEND, "x", "tag")]:
+            self.assertEqual(warm.find_config_name(*event), cold.find_config_name(*event))
+
+    @pytest.mark.unittest
+    def test_changed_config_is_rebuilt(self):
+        self.load()
+        with open(self.config_file) as f:
+            config = json.load(f)
+        config["dev"][2]["ref_name"] = "develop"
+        with open(self.config_file, "w") as f:
+            json.dump(config, f)
+
+        config = self.load()
+        self.assertIsNone(config.find_config_name(BACKEND, "main", "branch"))
+        self.assertEqual(config.find_config_name(BACKEND, "develop", "branch"), "dev")
+
+    @pytest.mark.unittest
+    def test_corrupt_cache_is_rebuilt(self):
+        self.load()
+        for corrupt in ["{not json", '{"key": 1}', "[]"]:
+            with self.subTest(corrupt=corrupt):
+                with open(self.cache_file(), "w") as f:
+                    f.write(corrupt)
+                config = self.load()
+                self.assertEqual(config.find_config_name(BACKEND, "1.0.0", "tag"), "prod")
+                with open(self.cache_file()) as f:
+                    self.assertIn("matcher", json.load(f))
+
+    @pytest.mark.unittest
+    def test_new_version_is_rebuilt(self):
+        self.load()
+        with open(self.cache_file()) as f:
+            key = json.load(f)["key"]
+
+        with patch("gh_rotator.classes.productconfig.__version__", "99.0.0"):
+            self.load()
+        with open(self.cache_file()) as f:
+            self.assertNotEqual(json.load(f)["key"], key)
+
+    @pytest.mark.unittest
+    def test_new_cache_format_is_rebuilt(self):
+        self.load()
+        with open(self.cache_file()) as f:
+            key = json.load(f)["key"]
+
+        with patch("gh_rotator.classes.productconfig.CACHE_FORMAT", CACHE_FORMAT + 1):
+            with patch.object(ConfigMatcher, "from_cache", wraps=ConfigMatcher.from_cache) as restored:
+                config = self.load()
+            restored.assert_not_called()
+        self.assertEqual(config.find_config_name(BACKEND, "1.0.0", "tag"), "prod")
+        with open(self.cache_file()) as f:
+            self.assertNotEqual(json.load(f)["key"], key)
@@ -1,8 +1,11 @@
+import json
 import unittest
 import os
 import sys
 import shutil
+import subprocess
 import tempfile
+import time
 from unittest.mock import patch, MagicMock
 from unittest.mock import Mock
 from io import StringIO
@@ -15,6 +18,8 @@ sys.path.append(class_path)
 
 from productconfig import ProductConfig
 from productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import RepoContext
+from gh_rotator.modules.fileio import file_lock
 
 # Define data paths relative to this test file
 TEST_DATA_PATH = os.path.join(test_dir, "data")
@@ -30,6 +35,9 @@ class ManifestTestBase(unittest.TestCase):
     original manifest files. Tests can modify these copies without affecting
     the original files. The temporary directory is automatically cleaned up
     after each test.
+
+    The temporary directory is also the git repo of self.context, so the locks
+    (and other state) of the tests are kept there, not in the checkout.
     """
 
     def setUp(self):
@@ -37,6 +45,8 @@ class ManifestTestBase(unittest.TestCase):
         # Create a temporary directory for manifest files
         self.temp_dir = tempfile.mkdtemp()
         self.MANIFESTS_PATH = os.path.join(self.temp_dir, "manifests")
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        self.context = RepoContext(git_root=self.temp_dir)
 
         # Copy the original manifest directory structure
         if os.path.exists(ORIGINAL_MANIFESTS_PATH):
@@ -57,7 +67,7 @@ class TestProject(ManifestTestBase):
 
     @pytest.mark.unittest
     def test_load_empty_manifest_success(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         manifest = ProductManifest(config, directory=NO_MANIFESTS_PATH)
 
         # Assertions
@@ -68,16 +78,37 @@ class TestProject(ManifestTestBase):
     @pytest.mark.unittest
     def test_load_manifest_bad_json(self):
         valid_config_path = os.path.join(TEST_DATA_PATH, "config-rotator-valid.json")
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
+
+        # Manifests are loaded lazily, so the bad JSON is only detected when accessed
+        manifest = ProductManifest(config, directory=BAD_MANIFESTS_PATH)
 
         # Use a context manager to capture stderr output
         with patch("sys.stderr", new_callable=StringIO) as mock_stderr:
             with self.assertRaises(SystemExit) as cm:
-                manifest = ProductManifest(config, directory=BAD_MANIFESTS_PATH)
+                manifest.get("dev_manifest")
+            self.assertRegex(mock_stderr.getvalue(), r"Error: Manifest file .* is not a valid JSON file")
+            self.assertEqual(cm.exception.code, 1)
+
+    @pytest.mark.unittest
+    def test_load_manifest_is_lazy(self):
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
+
+        with patch("json.load", wraps=json.load) as mock_load:
+            manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
+            mock_load.assert_not_called()
+
+            # Only the manifest of the configuration that is accessed gets parsed
+            sha1 = manifest.get_version(configuration="prod", repo="config-rotator/backend-component")
+            self.assertRegex(sha1, r"[0-9a-f]{7,40}")
+            self.assertEqual(mock_load.call_count, 1)
+
+            manifest.get("prod_manifest")
+            self.assertEqual(mock_load.call_count, 1)
 
     @pytest.mark.unittest
     def test_load_manifest_from_alternate_source(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
 
         # Assertions
@@ -87,7 +118,7 @@ class TestProject(ManifestTestBase):
 
     @pytest.mark.unittest
     def test_rotate_manifest_dev_success(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
         manifest.rotate(
             event_type="branch",
@@ -118,10 +149,13 @@ class TestProject(ManifestTestBase):
         )
         self.assertEqual(manifest.get("dev_manifest")["dev"][2]["ref_name"], "main")
         self.assertEqual(manifest.get("dev_manifest")["dev"][2]["ref_type"], "branch")
+        # The manifest was locked within the temp repo
+        locks = os.path.join(self.temp_dir, ".git", "gh-rotator", "locks")
+        self.assertEqual(len([f for f in os.listdir(locks) if f.startswith("dev-")]), 1)
 
     @pytest.mark.unittest
     def test_rotate_manifest_qa_success(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
         manifest.rotate(
             event_type="tag",
@@ -143,7 +177,7 @@ class TestProject(ManifestTestBase):
 
     @pytest.mark.unittest
     def test_rotate_manifest_prod_success(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
         manifest.rotate(
             event_type="tag",
@@ -165,7 +199,7 @@ class TestProject(ManifestTestBase):
 
     @pytest.mark.unittest
     def test_rotate_manifest_bad_repo(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
 
         # Capture stderr and check for error message
@@ -190,7 +224,184 @@ class TestProject(ManifestTestBase):
 
     @pytest.mark.unittest
     def test_get_version_success(self):
-        config = ProductConfig(file=self.valid_config_path)
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
         manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
         sha1 = manifest.get_version(configuration="dev", repo="config-rotator/backend-component")
         self.assertRegex(sha1, r"[0-9a-f]{7,40}")
+
+    @pytest.mark.unittest
+    def test_index_follows_rotations(self):
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
+        manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
+
+        manifest.rotate(
+            event_type="branch",
+            event_name="main",
+            repo="config-rotator/backend-component",
+            sha="2b0b35a3cf0416b9ae8017509941334608243840",
+            save=False,
+        )
+        self.assertEqual(
+            manifest.get_version(configuration="dev", repo="config-rotator/backend-component"),
+            "2b0b35a3cf0416b9ae8017509941334608243840",
+        )
+
+        # A repo appended by a rotation is found without rebuilding the index
+        manifest.get("dev_index").pop("config-rotator/backend-component")
+        manifest.get("dev_manifest")["dev"].pop()
+        manifest.rotate(
+            event_type="branch",
+            event_name="main",
+            repo="config-rotator/backend-component",
+            sha="3c0b35a3cf0416b9ae8017509941334608243840",
+            save=False,
+        )
+        self.assertEqual(len(manifest.get("dev_manifest")["dev"]), 3)
+        self.assertEqual(
+            manifest.get_version(configuration="dev", repo="config-rotator/backend-component"),
+            "3c0b35a3cf0416b9ae8017509941334608243840",
+        )
+
+    @pytest.mark.unittest
+    def test_get_version_not_found(self):
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
+        manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
+
+        with patch("sys.stderr", new_callable=StringIO) as mock_stderr:
+            with self.assertRaises(SystemExit) as cm:
+                manifest.get_version(configuration="dev", repo="config-rotator/blaha-component")
+            self.assertRegex(mock_stderr.getvalue(), r"Error: Repository .* not found")
+            self.assertEqual(cm.exception.code, 1)
+
+    @pytest.mark.unittest
+    def test_rotate_same_version_does_not_rewrite(self):
+        config = ProductConfig(file=self.valid_config_path, context=self.context)
+        manifest = ProductManifest(config, directory=self.MANIFESTS_PATH)
+        manifest_file = manifest.get("dev_file")
+        with open(manifest_file, "rb") as f:
+            before = f.read()
+
+        # The dev manifest already holds this version of the backend component
+        with patch("pathlib.Path.replace") as mock_replace:
+            manifest.rotate(
+                event_type="branch",
+                event_name="main",
+                repo="config-rotator/backend-component",
+                sha="1a0b35a3cf0416b9ae8017509941334608243840",
+            )
+            mock_replace.assert_not_called()
+        self.assertFalse(manifest.save("dev"))
+
+        with open(manifest_file, "rb") as f:
+            self.assertEqual(f.read(), before)
+
+
+# Rotates `count` repos, each saved on its own, in a separate process
+ROTATE_SCRIPT = """
+import sys
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import RepoContext
+
+root, worker, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+config = ProductConfig(file="config-rotator.json", context=RepoContext(git_root=root))
+manifest = ProductManifest(config, directory="configurations", lock_timeout=60)
+for i in range(count):
+    manifest.rotate(
+        repo=f"org/component-{worker}-{i}", event_name="main", event_type="branch", sha=f"{i:040x}"
+    )
+"""
+
+
+class TestConcurrentRotation(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo where any org/ repo rotates the dev configuration"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        with open(os.path.join(self.temp_dir, "config-rotator.json"), "w") as f:
+            f.write('{"dev": [{"repo": "org/.*", "ref_type": "branch", "ref_name": "main"}]}')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def load_manifest(self, lock_timeout=None):
+        context = RepoContext(git_root=self.temp_dir)
+        config = ProductConfig(file="config-rotator.json", context=context)
+        return ProductManifest(config, directory="configurations", lock_timeout=lock_timeout)
+
+    @pytest.mark.unittest
+    def test_parallel_rotations_lose_no_updates(self):
+        workers, rotations = 8, 10
+        repo_root = os.path.dirname(os.path.dirname(test_dir))
+        env = {**os.environ, "PYTHONPATH": repo_root}
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", ROTATE_SCRIPT, self.temp_dir, str(worker), str(rotations)],
+                env=env,
+            )
+            for worker in range(workers)
+        ]
+        for process in processes:
+            self.assertEqual(process.wait(timeout=120), 0)
+
+        manifest = self.load_manifest()
+        repos = {entry["repo"] for entry in manifest.get("dev_manifest")["dev"]}
+        self.assertEqual(
+            repos,
+            {f"org/component-{w}-{i}" for w in range(workers) for i in range(rotations)},
+        )
+
+    @pytest.mark.unittest
+    def test_save_merges_with_concurrent_update(self):
+        first = self.load_manifest()
+        second = self.load_manifest()
+        # Both runs have read the (empty) manifest before either of them saves
+        first.get("dev_manifest")
+        second.get("dev_manifest")
+
+        first.rotate(repo="org/a", event_name="main", event_type="branch", sha="a" * 40)
+        second.rotate(repo="org/b", event_name="main", event_type="branch", sha="b" * 40)
+
+        repos = [entry["repo"] for entry in self.load_manifest().get("dev_manifest")["dev"]]
+        self.assertEqual(repos, ["org/a", "org/b"])
+
+    @pytest.mark.unittest
+    def test_save_only_reads_a_manifest_written_since_it_was_loaded(self):
+        manifest_file = os.path.join(self.temp_dir, "configurations", "dev", "config-dev-manifest.json")
+        self.load_manifest().rotate(repo="org/a", event_name="main", event_type="branch", sha="a" * 40)
+        # Written a while ago - a manifest written just now is read again anyway (racy)
+        os.utime(manifest_file, (time.time() - 60, time.time() - 60))
+
+        first = self.load_manifest()
+        with patch("json.load", wraps=json.load) as load:
+            first.rotate(repo="org/b", event_name="main", event_type="branch", sha="b" * 40)
+        self.assertEqual(load.call_count, 1)
+
+        # Written by another run since it was loaded - the manifest is read again under the lock
+        os.utime(manifest_file, (time.time() - 60, time.time() - 60))
+        second = self.load_manifest()
+        second.get("dev_manifest")
+        self.load_manifest().rotate(repo="org/c", event_name="main", event_type="branch", sha="c" * 40)
+        with patch("json.load", wraps=json.load) as load:
+            second.rotate(repo="org/d", event_name="main", event_type="branch", sha="d" * 40)
+        self.assertEqual(load.call_count, 1)
+
+        repos = [entry["repo"] for entry in self.load_manifest().get("dev_manifest")["dev"]]
+        self.assertEqual(repos, ["org/a", "org/b", "org/c", "org/d"])
+        with open(os.path.join(os.path.dirname(manifest_file), "history", "events.jsonl")) as f:
+            self.assertEqual([json.loads(line)["repo"] for line in f], ["org/a", "org/b", "org/c", "org/d"])
+
+    @pytest.mark.unittest
+    def test_lock_timeout(self):
+        manifest = self.load_manifest(lock_timeout=0.1)
+        manifest.rotate(repo="org/a", event_name="main", event_type="branch", sha="a" * 40, save=False)
+        lock_dir = os.path.join(self.temp_dir, ".git", "gh-rotator", "locks")
+        manifest.save("dev")
+        lock_file = os.path.join(lock_dir, os.listdir(lock_dir)[0])
+
+        with file_lock(lock_file):
+            with patch("sys.stderr", new_callable=StringIO) as mock_stderr:
+                with self.assertRaises(SystemExit) as cm:
+                    manifest.save("dev")
+        self.assertRegex(mock_stderr.getvalue(), r"Error: Timed out after 0.1s waiting for the lock")
+        self.assertEqual(cm.exception.code, 1)
@@ -0,0 +1,74 @@
+import json
+import os
+import pstats
+from argparse import Namespace
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.modules import profiling
+from gh_rotator.tests.cli_helpers import CliTestCase, make_product
+
+BACKEND = "config-rotator/backend-component"
+LOCK = ["lock", "--repo", BACKEND, "--event-type", "branch", "--event-name", "main", "--sha", "a" * 40]
+
+
+class TestProfiling(CliTestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config and manifests"""
+        super().setUp()
+        make_product(self.temp_dir)
+        for name in (profiling.PROFILE_ENV, profiling.CPROFILE_ENV):
+            os.environ.pop(name, None)
+
+    @pytest.mark.unittest
+    def test_settings(self):
+        self.assertEqual(profiling.settings(Namespace()), (None, None))
+        self.assertEqual(profiling.settings(Namespace(profile=True)), ("-", None))
+        self.assertEqual(
+            profiling.settings(Namespace(profile_file="p.jsonl", cprofile="c.prof")),
+            ("p.jsonl", "c.prof"),
+        )
+        with patch.dict(os.environ, {profiling.PROFILE_ENV: "1"}):
+            self.assertEqual(profiling.settings(Namespace()), ("-", None))
+        with patch.dict(os.environ, {profiling.PROFILE_ENV: "0"}):
+            self.assertEqual(profiling.settings(Namespace()), (None, None))
+        with patch.dict(os.environ, {profiling.PROFILE_ENV: "/tmp/p.jsonl"}):
+            self.assertEqual(profiling.settings(Namespace()), ("/tmp/p.jsonl", None))
+
+    @pytest.mark.unittest
+    def test_phases_are_not_timed_unless_profiled(self):
+        self.assertIs(profiling.phase("save"), profiling.phase("rotate"))
+        code, _stdout, stderr = self.main(*LOCK)
+        self.assertEqual((code, stderr), (0, ""))
+
+    @pytest.mark.unittest
+    def test_profile_on_stderr(self):
+        code, _stdout, stderr = self.main("--profile", *LOCK)
+        self.assertEqual(code, 0)
+        record = json.loads(stderr.splitlines()[-1])
+        self.assertEqual((record["command"], record["exit_code"]), ("lock", 0))
+        for phase in ("git_root", "config_load", "manifest_init", "match", "rotate", "save", "write"):
+            with self.subTest(phase=phase):
+                self.assertEqual(record["phases"][phase]["calls"], 1)
+                self.assertGreaterEqual(record["wall_ms"], record["phases"][phase]["wall_ms"])
+        # Phases nest - the save is part of the rotation
+        self.assertGreaterEqual(record["phases"]["rotate"]["wall_ms"], record["phases"]["save"]["wall_ms"])
+
+    @pytest.mark.unittest
+    def test_profile_file_and_cprofile(self):
+        profile_file = os.path.join(self.temp_dir, "profile.jsonl")
+        cprofile_file = os.path.join(self.temp_dir, "lock.prof")
+        self.main(*LOCK, "--profile-file", profile_file, "--cprofile", cprofile_file)
+        with patch.dict(os.environ, {profiling.PROFILE_ENV: profile_file}):
+            code, _stdout, stderr = self.main("manifest", "--configuration", "dev", "--repo", "nope/nope")
+        self.assertEqual(code, 1)
+        self.assertNotIn('"phases"', stderr)
+
+        with open(profile_file) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([(r["command"], r["exit_code"]) for r in records], [("lock", 0), ("manifest", 1)])
+        self.assertIn("lookup", records[1]["phases"])
+
+        stats = pstats.Stats(cprofile_file)
+        self.assertTrue(any(name == "rotate" for _file, _line, name in stats.stats))
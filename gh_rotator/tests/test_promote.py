@@ -0,0 +1,153 @@
+import json
+import os
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator import gh_rotator
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.productmanifest import ProductManifest
+from gh_rotator.classes.repocontext import RepoContext
+from gh_rotator.tests.cli_helpers import CliTestCase, make_product
+
+SEMVER = r"^\d+\.\d+\.\d+$"
+BACKEND = "org/backend"
+FRONTEND = "org/frontend"
+IAC = "org/iac"
+
+CONFIG = {
+    "qa": [
+        {"repo": "org/.*", "ref_type": "tag", "ref_name": r"^\d+\.\d+\.\d+(?:-rc\d+)?$"},
+    ],
+    "prod": [
+        {"repo": BACKEND, "ref_type": "tag", "ref_name": SEMVER},
+        {"repo": FRONTEND, "ref_type": "tag", "ref_name": SEMVER},
+    ],
+}
+
+
+def entry(repo, version, ref_name, last_update="2025-05-15 (07:51:28) [UTC]"):
+    return {
+        "repo": repo,
+        "ref_type": "tag",
+        "ref_name": ref_name,
+        "version": version,
+        "last_update": last_update,
+    }
+
+
+class TestPromote(CliTestCase):
+    def setUp(self):
+        """Set up a product repo with a qa manifest ahead of the prod manifest"""
+        super().setUp()
+        make_product(self.temp_dir, CONFIG, manifests=False)
+        self.write_manifest(
+            "qa",
+            [
+                entry(BACKEND, "b" * 40, "1.1.0"),
+                entry(FRONTEND, "f" * 40, "2.0.0"),
+                entry(IAC, "i" * 40, "3.0.0-rc1"),
+            ],
+        )
+        self.write_manifest("prod", [entry(BACKEND, "0" * 40, "1.0.0")])
+
+    def manifest_file(self, configuration):
+        return os.path.join(
+            self.temp_dir, "configurations", configuration, f"config-{configuration}-manifest.json"
+        )
+
+    def write_manifest(self, configuration, entries):
+        os.makedirs(os.path.dirname(self.manifest_file(configuration)), exist_ok=True)
+        with open(self.manifest_file(configuration), "w") as f:
+            json.dump({configuration: entries}, f, indent=4)
+
+    def read_manifest(self, configuration):
+        with open(self.manifest_file(configuration)) as f:
+            return {e["repo"]: e for e in json.load(f)[configuration]}
+
+    @pytest.mark.unittest
+    def test_promote_repos(self):
+        code, stdout, stderr = self.main(
+            "promote", "--from", "qa", "--to", "prod", "--repos", f"{BACKEND},{FRONTEND}"
+        )
+        self.assertEqual((code, stderr), (0, ""))
+        self.assertEqual(
+            [json.loads(line) for line in stdout.splitlines()],
+            [
+                {"repo": BACKEND, "version": "b" * 40, "status": "updated"},
+                {"repo": FRONTEND, "version": "f" * 40, "status": "added"},
+            ],
+        )
+
+        prod = self.read_manifest("prod")
+        self.assertEqual(list(prod), [BACKEND, FRONTEND])
+        self.assertEqual((prod[BACKEND]["version"], prod[BACKEND]["ref_name"]), ("b" * 40, "1.1.0"))
+        self.assertEqual(prod[FRONTEND]["ref_name"], "2.0.0")
+        # One last_update for the promotion - not the one of qa, nor one per repo
+        self.assertNotEqual(prod[BACKEND]["last_update"], "2025-05-15 (07:51:28) [UTC]")
+        self.assertEqual(prod[BACKEND]["last_update"], prod[FRONTEND]["last_update"])
+        # The history has both promotions
+        with open(os.path.join(os.path.dirname(self.manifest_file("prod")), "history", "events.jsonl")) as f:
+            self.assertEqual([json.loads(line)["repo"] for line in f], [BACKEND, FRONTEND])
+
+        # Promoting again changes nothing
+        mtime = os.path.getmtime(self.manifest_file("prod"))
+        code, stdout, _stderr = self.main("promote", "--from", "qa", "--to", "prod", "--repos", BACKEND)
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(stdout)["status"], "unchanged")
+        self.assertEqual(os.path.getmtime(self.manifest_file("prod")), mtime)
+
+    @pytest.mark.unittest
+    def test_nothing_promoted_if_a_repo_does_not_match_the_target(self):
+        before = self.read_manifest("prod")
+        # All of qa: the release candidate of org/iac matches no rule of prod
+        code, stdout, stderr = self.main("promote", "--from", "qa", "--to", "prod")
+        self.assertEqual((code, stdout), (1, ""))
+        self.assertIn(f"{IAC} at 'tag:3.0.0-rc1' doesn't match any rule of configuration prod", stderr)
+        self.assertIn("Nothing promoted from qa to prod", stderr)
+        self.assertEqual(self.read_manifest("prod"), before)
+
+    @pytest.mark.unittest
+    def test_missing_repos_and_configurations(self):
+        code, _stdout, stderr = self.main(
+            "promote", "--from", "qa", "--to", "prod", "--repos", f"{BACKEND},org/unknown"
+        )
+        self.assertEqual(code, 1)
+        self.assertIn("Repository org/unknown not found in configuration qa", stderr)
+        self.assertEqual(self.read_manifest("prod")[BACKEND]["version"], "0" * 40)
+
+        code, _stdout, stderr = self.main("promote", "--from", "qa", "--to", "staging")
+        self.assertEqual(code, 1)
+        self.assertIn("There is no configuration 'staging' in the config", stderr)
+
+    @pytest.mark.unittest
+    def test_dry_run(self):
+        code, stdout, _stderr = self.main(
+            "promote", "--from", "qa", "--to", "prod", "--repos", FRONTEND, "--dry-run"
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(stdout), {"repo": FRONTEND, "version": "f" * 40, "status": "added"})
+        self.assertNotIn(FRONTEND, self.read_manifest("prod"))
+
+    @pytest.mark.unittest
+    def test_dry_run_leaves_the_manifest_as_it_was(self):
+        config = ProductConfig(context=RepoContext(git_root=self.temp_dir))
+        manifest = ProductManifest(config)
+        promoted = manifest.promote("qa", "prod", repos=[BACKEND, FRONTEND], save=False)
+        self.assertEqual(promoted, {BACKEND: "updated", FRONTEND: "added"})
+
+        self.assertEqual(manifest.get("prod_pending"), [])
+        self.assertEqual(manifest.get("prod_applied"), [])
+        self.assertEqual(manifest.get("prod_index")[BACKEND]["version"], "0" * 40)
+        self.assertNotIn(FRONTEND, manifest.get("prod_index"))
+        # Nothing of the dry run is written by a later save
+        self.assertFalse(manifest.save("prod"))
+        self.assertEqual(list(self.read_manifest("prod")), [BACKEND])
+
+    @pytest.mark.unittest
+    def test_from_and_to_differ(self):
+        with patch("sys.stderr", new_callable=StringIO) as stderr:
+            with self.assertRaises(SystemExit):
+                gh_rotator.rotator_parse(["promote", "--from", "qa", "--to", "qa"])
+        self.assertIn("--from and --to must be different configurations", stderr.getvalue())
@@ -0,0 +1,76 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.classes.repocontext import GIT_ROOT_ENV, RepoContext, find_git_root
+
+
+class TestRepoContext(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake repo with a nested directory to start discovery from"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.repo = Path(self.temp_dir) / "product"
+        self.nested = self.repo / "configurations" / "dev"
+        self.nested.mkdir(parents=True)
+        (self.repo / ".git").mkdir()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.unittest
+    def test_find_git_root_walks_up(self):
+        self.assertEqual(find_git_root(str(self.nested)), str(self.repo))
+        self.assertEqual(find_git_root(str(self.repo)), str(self.repo))
+
+    @pytest.mark.unittest
+    def test_find_git_root_accepts_git_file(self):
+        # Worktrees and submodules have a .git file rather than a directory
+        worktree = Path(self.temp_dir) / "worktree"
+        worktree.mkdir()
+        (worktree / ".git").write_text("gitdir: ../product/.git/worktrees/worktree\n")
+        self.assertEqual(find_git_root(str(worktree)), str(worktree))
+
+    @pytest.mark.unittest
+    @patch("subprocess.check_output")
+    def test_discovery_does_not_fork_git(self, mock_check_output):
+        with patch("os.getcwd", return_value=str(self.nested)):
+            context = RepoContext()
+        self.assertEqual(context.get("git_root"), str(self.repo))
+        mock_check_output.assert_not_called()
+
+    @pytest.mark.unittest
+    @patch("subprocess.check_output")
+    def test_explicit_root_and_env_override(self, mock_check_output):
+        with patch.dict(os.environ, {GIT_ROOT_ENV: "/from/env"}):
+            self.assertEqual(RepoContext().get("git_root"), "/from/env")
+            self.assertEqual(RepoContext(git_root="/from/flag").get("git_root"), "/from/flag")
+        mock_check_output.assert_not_called()
+
+    @pytest.mark.unittest
+    @patch("gh_rotator.classes.repocontext.find_git_root", return_value=None)
+    @patch("subprocess.check_output", return_value=b"/from/git\n")
+    def test_falls_back_to_git(self, mock_check_output, mock_find_git_root):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(RepoContext().get("git_root"), "/from/git")
+        mock_check_output.assert_called_once()
+
+    @pytest.mark.unittest
+    @patch("gh_rotator.classes.repocontext.find_git_root", return_value=None)
+    @patch(
+        "subprocess.check_output",
+        side_effect=subprocess.CalledProcessError(128, ["git", "rev-parse"]),
+    )
+    def test_not_in_a_git_repo(self, mock_check_output, mock_find_git_root):
+        with patch.dict(os.environ, {}, clear=True):
+            with patch("sys.stderr", new_callable=StringIO) as mock_stderr:
+                with self.assertRaises(SystemExit) as cm:
+                    RepoContext()
+        self.assertRegex(mock_stderr.getvalue(), r"Error: Not in a git repository")
+        self.assertEqual(cm.exception.code, 1)
@@ -0,0 +1,228 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import HTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.modules.rotator_client import DAEMON_ENV, NO_DAEMON_ENV, TOKEN_ENV, forward
+from gh_rotator.modules.rotator_daemon import ProductCache, RequestHandler, UnixHTTPServer
+from gh_rotator.modules.rotator_handlers import load_config, load_manifest
+from gh_rotator.modules.rotator_parser import rotator_parse
+from gh_rotator.modules.rotator_transport import request
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+ORIGINAL_MANIFESTS_PATH = os.path.join(TEST_DATA_PATH, "manifests")
+VALID_CONFIG_PATH = os.path.join(TEST_DATA_PATH, "config-rotator-valid.json")
+
+BACKEND = "config-rotator/backend-component"
+
+
+class DaemonTestBase(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config and manifests"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        shutil.copy(VALID_CONFIG_PATH, os.path.join(self.temp_dir, "config-rotator.json"))
+        shutil.copytree(ORIGINAL_MANIFESTS_PATH, os.path.join(self.temp_dir, "configurations"))
+        self.cache = ProductCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def payload(self, *argv):
+        return vars(rotator_parse([*argv, "--git-root", self.temp_dir]))
+
+    def manifest_file(self, configuration):
+        return os.path.join(
+            self.temp_dir, "configurations", configuration, f"config-{configuration}-manifest.json"
+        )
+
+
+class TestProductCache(DaemonTestBase):
+    @pytest.mark.unittest
+    def test_run_config_and_manifest(self):
+        result = self.cache.run(
+            self.payload("config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0")
+        )
+        self.assertEqual(result, {"exit_code": 0, "stdout": "prod\n", "stderr": ""})
+
+        result = self.cache.run(self.payload("manifest", "--configuration", "dev", "--repo", BACKEND))
+        self.assertEqual(result["stdout"], "1a0b35a3cf0416b9ae8017509941334608243840\n")
+
+    @pytest.mark.unittest
+    def test_run_reports_errors_and_exit_codes(self):
+        result = self.cache.run(
+            self.payload("config", "--repo", "x/y", "--event-type", "tag", "--event-name", "1.0.0")
+        )
+        self.assertEqual(result["exit_code"], 1)
+        self.assertRegex(result["stderr"], r"Error: No matching configuration found")
+
+    @pytest.mark.unittest
+    def test_config_and_manifests_are_cached(self):
+        args = self.payload("manifest", "--configuration", "dev", "--repo", BACKEND)
+        self.cache.run(args)
+
+        with patch("json.load", wraps=json.load) as mock_load:
+            self.cache.run(args)
+            mock_load.assert_not_called()
+
+    @pytest.mark.unittest
+    def test_misses_keep_the_cache(self):
+        self.cache.run(self.payload("manifest", "--configuration", "dev", "--repo", BACKEND))
+        for argv in [
+            ("config", "--repo", "x/y", "--event-type", "tag", "--event-name", "1.0.0"),
+            ("manifest", "--configuration", "dev", "--repo", "x/y"),
+        ]:
+            with self.subTest(argv=argv):
+                self.assertEqual(self.cache.run(self.payload(*argv))["exit_code"], 1)
+                self.assertEqual(len(self.cache.configs), 1)
+                self.assertEqual(len(self.cache.manifests), 1)
+
+    @pytest.mark.unittest
+    def test_failed_lock_forgets_the_cache(self):
+        self.cache.run(self.payload("manifest", "--configuration", "dev", "--repo", BACKEND))
+        with patch(
+            "gh_rotator.classes.productmanifest.ProductManifest.save", side_effect=TimeoutError
+        ):
+            result = self.cache.run(
+                self.payload(
+                    "lock",
+                    *("--repo", BACKEND, "--event-type", "branch", "--event-name", "main"),
+                    *("--sha", "f" * 40),
+                )
+            )
+        self.assertEqual(result["exit_code"], 1)
+        self.assertEqual((self.cache.configs, self.cache.manifests), ({}, {}))
+
+    @pytest.mark.unittest
+    def test_changed_files_are_reloaded(self):
+        args = self.payload("manifest", "--configuration", "dev", "--repo", BACKEND)
+        self.cache.run(args)
+
+        with open(self.manifest_file("dev")) as f:
+            content = f.read().replace("1a0b35a3", "2b0b35a3")
+        # Make sure the mtime moves, even on file systems with a coarse resolution
+        time.sleep(0.01)
+        with open(self.manifest_file("dev"), "w") as f:
+            f.write(content)
+
+        self.assertEqual(
+            self.cache.run(args)["stdout"], "2b0b35a3cf0416b9ae8017509941334608243840\n"
+        )
+
+    @pytest.mark.unittest
+    def test_lock(self):
+        sha = "f" * 40
+        result = self.cache.run(
+            self.payload(
+                "lock",
+                *("--repo", BACKEND, "--event-type", "branch", "--event-name", "main"),
+                *("--sha", sha),
+            )
+        )
+        self.assertEqual(result["exit_code"], 0)
+        with open(self.manifest_file("dev")) as f:
+            self.assertIn(sha, f.read())
+
+        result = self.cache.run(self.payload("manifest", "--configuration", "dev", "--repo", BACKEND))
+        self.assertEqual(result["stdout"], f"{sha}\n")
+
+
+class TestForward(DaemonTestBase):
+    def setUp(self):
+        super().setUp()
+        self.socket = os.path.join(self.temp_dir, ".git", "gh-rotator", "daemon.sock")
+        os.makedirs(os.path.dirname(self.socket))
+        self.server = UnixHTTPServer(self.socket, RequestHandler)
+        self.server.cache = self.cache
+        self.server.root = os.path.realpath(self.temp_dir)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        super().tearDown()
+
+    def args(self, *argv):
+        return rotator_parse([*argv, "--git-root", self.temp_dir])
+
+    @pytest.mark.unittest
+    def test_forward_to_daemon(self):
+        args = self.args("config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0")
+        with patch.dict(os.environ, {}, clear=False) as env:
+            env.pop(DAEMON_ENV, None)
+            env.pop(NO_DAEMON_ENV, None)
+            self.assertEqual(forward(args), {"exit_code": 0, "stdout": "prod\n", "stderr": ""})
+
+    @pytest.mark.unittest
+    def test_no_forward_when_disabled_or_absent(self):
+        args = self.args("config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0")
+        with patch.dict(os.environ, {NO_DAEMON_ENV: "1"}):
+            self.assertIsNone(forward(args))
+        with patch.dict(os.environ, {DAEMON_ENV: os.path.join(self.temp_dir, "nothing.sock")}):
+            self.assertIsNone(forward(args))
+
+    @pytest.mark.unittest
+    def test_context_is_resolved_once(self):
+        args = self.args("config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0")
+        with patch.dict(os.environ, {DAEMON_ENV: os.path.join(self.temp_dir, "nothing.sock")}):
+            self.assertIsNone(forward(args))
+        # The command run by the CLI itself reuses the context resolved to look for a daemon
+        with patch("gh_rotator.classes.repocontext.RepoContext") as context:
+            config = load_config(args)
+            manifest = load_manifest(args, config)
+        context.assert_not_called()
+        self.assertIs(config.get("context"), args.context)
+        self.assertIs(manifest.get("context"), args.context)
+        self.assertEqual(args.context.get("git_root"), self.temp_dir)
+
+    @pytest.mark.unittest
+    def test_other_repos_are_refused(self):
+        payload = self.payload("config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0")
+        self.assertIsNone(request(self.socket, "POST", "/run", {**payload, "git_root": "/"}))
+        self.assertEqual(request(self.socket, "POST", "/run", payload)["stdout"], "prod\n")
+
+
+class TestPortToken(DaemonTestBase):
+    def setUp(self):
+        super().setUp()
+        self.server = HTTPServer(("127.0.0.1", 0), RequestHandler)
+        self.server.cache = self.cache
+        self.server.root = os.path.realpath(self.temp_dir)
+        self.server.token = "secret"
+        self.address = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        super().tearDown()
+
+    @pytest.mark.unittest
+    def test_token_is_required(self):
+        payload = self.payload("config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0")
+        self.assertIsNone(request(self.address, "POST", "/run", payload))
+        self.assertIsNone(request(self.address, "POST", "/run", payload, token="guess"))
+        self.assertEqual(request(self.address, "POST", "/run", payload, token="secret")["exit_code"], 0)
+
+        args = rotator_parse(["config", "--repo", BACKEND, "--event-type", "tag", "--event-name", "1.0.0",
+                              "--git-root", self.temp_dir])  # fmt: skip
+        with patch.dict(os.environ, {DAEMON_ENV: self.address}) as env:
+            env.pop(NO_DAEMON_ENV, None)
+            env.pop(TOKEN_ENV, None)
+            self.assertIsNone(forward(args))
+            # The token file the daemon writes to the state directory
+            with open(os.path.join(self.temp_dir, ".git", "gh-rotator", "daemon.token"), "w") as f:
+                f.write("secret\n")
+            self.assertEqual(forward(args)["stdout"], "prod\n")
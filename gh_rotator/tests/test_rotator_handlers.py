@@ -0,0 +1,317 @@
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from gh_rotator.classes.productconfig import ProductConfig
+from gh_rotator.classes.repocontext import RepoContext
+from gh_rotator.modules.rotator_handlers import handle_config, handle_lock, handle_manifest
+from gh_rotator.modules.rotator_parser import rotator_parse
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(test_dir, "data")
+ORIGINAL_MANIFESTS_PATH = os.path.join(TEST_DATA_PATH, "manifests")
+VALID_CONFIG_PATH = os.path.join(TEST_DATA_PATH, "config-rotator-valid.json")
+
+
+class TestLockEvents(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary copy of the manifests and an events file, in a repo of their own"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        self.manifests_path = os.path.join(self.temp_dir, "manifests")
+        shutil.copytree(ORIGINAL_MANIFESTS_PATH, self.manifests_path)
+        self.events_file = os.path.join(self.temp_dir, "events.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_events(self, lines):
+        with open(self.events_file, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def run_lock(self):
+        args = Namespace(
+            command="lock",
+            config_file=VALID_CONFIG_PATH,
+            git_root=self.temp_dir,
+            manifest_dir=self.manifests_path,
+            events_file=self.events_file,
+            verbose=False,
+        )
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            with self.assertRaises(SystemExit) as cm:
+                handle_lock(args)
+        results = [json.loads(line) for line in mock_stdout.getvalue().splitlines()]
+        return cm.exception.code, results
+
+    def read_manifest(self, configuration):
+        file = os.path.join(
+            self.manifests_path, configuration, f"config-{configuration}-manifest.json"
+        )
+        with open(file) as f:
+            return {entry["repo"]: entry for entry in json.load(f)[configuration]}
+
+    def event(self, repo, event_type, event_name, sha):
+        return json.dumps(
+            {"repo": repo, "event_type": event_type, "event_name": event_name, "sha": sha}
+        )
+
+    @pytest.mark.unittest
+    def test_lock_events_success(self):
+        self.write_events(
+            [
+                self.event("config-rotator/backend-component", "branch", "main", "a" * 40),
+                self.event("config-rotator/frontend-component", "branch", "main", "b" * 40),
+                self.event("config-rotator/backend-component", "tag", "1.2.3", "c" * 40),
+            ]
+        )
+        code, results = self.run_lock()
+
+        self.assertEqual(code, 0)
+        self.assertEqual([r["configuration"] for r in results], ["dev", "dev", "prod"])
+        dev = self.read_manifest("dev")
+        self.assertEqual(dev["config-rotator/backend-component"]["version"], "a" * 40)
+        self.assertEqual(dev["config-rotator/frontend-component"]["version"], "b" * 40)
+        self.assertEqual(
+            self.read_manifest("prod")["config-rotator/backend-component"]["version"], "c" * 40
+        )
+
+    @pytest.mark.unittest
+    def test_lock_events_reports_failures_per_event(self):
+        self.write_events(
+            [
+                self.event("config-rotator/backend-component", "branch", "main", "a" * 40),
+                self.event("config-rotator/blaha-component", "branch", "main", "b" * 40),
+                "not json",
+                json.dumps({"repo": "config-rotator/backend-component"}),
+            ]
+        )
+        code, results = self.run_lock()
+
+        self.assertEqual(code, 1)
+        self.assertEqual(
+            [r["status"] for r in results], ["rotated", "no-match", "invalid", "invalid"]
+        )
+        # The valid event is still applied
+        self.assertEqual(
+            self.read_manifest("dev")["config-rotator/backend-component"]["version"], "a" * 40
+        )
+
+    @pytest.mark.unittest
+    def test_lock_events_writes_each_manifest_once(self):
+        self.write_events(
+            [
+                self.event("config-rotator/backend-component", "branch", "main", "a" * 40),
+                self.event("config-rotator/frontend-component", "branch", "main", "b" * 40),
+                self.event("config-rotator/iac-component", "branch", "main", "c" * 40),
+            ]
+        )
+        with patch(
+            "gh_rotator.classes.productmanifest.ProductManifest.save", autospec=True
+        ) as mock_save:
+            code, _results = self.run_lock()
+
+        self.assertEqual(code, 0)
+        mock_save.assert_called_once()
+        self.assertEqual(mock_save.call_args.args[1], "dev")
+
+
+class TestManifestVersions(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config and manifests"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        shutil.copy(VALID_CONFIG_PATH, os.path.join(self.temp_dir, "config-rotator.json"))
+        shutil.copytree(ORIGINAL_MANIFESTS_PATH, os.path.join(self.temp_dir, "configurations"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_manifest(self, *argv):
+        args = rotator_parse(["manifest", *argv, "--git-root", self.temp_dir])
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with patch("sys.stderr", new_callable=StringIO) as stderr:
+                with self.assertRaises(SystemExit) as cm:
+                    handle_manifest(args)
+        return cm.exception.code, stdout.getvalue(), stderr.getvalue()
+
+    @pytest.mark.unittest
+    def test_misses_are_reported_per_repo(self):
+        repos = "config-rotator/backend-component,nobody/nothing"
+        code, stdout, stderr = self.run_manifest("--configuration", "dev", "--repos", repos)
+
+        self.assertEqual(code, 1)
+        self.assertEqual(
+            json.loads(stdout),
+            {
+                "dev": {
+                    "config-rotator/backend-component": "1a0b35a3cf0416b9ae8017509941334608243840",
+                    "nobody/nothing": None,
+                }
+            },
+        )
+        self.assertIn("nobody/nothing not found in configuration dev", stderr)
+
+    @pytest.mark.unittest
+    def test_all_configurations_from_a_repos_file(self):
+        repos_file = os.path.join(self.temp_dir, "repos.txt")
+        with open(repos_file, "w") as f:
+            f.write("# components\nconfig-rotator/backend-component\n\n")
+
+        code, stdout, _stderr = self.run_manifest(
+            "--all-configurations", "--repos-file", repos_file, "--format", "tsv"
+        )
+        self.assertEqual(code, 0)
+        rows = [line.split("\t") for line in stdout.splitlines()]
+        self.assertEqual([row[0] for row in rows], ["dev", "qa", "prod"])
+        self.assertTrue(all(row[1] == "config-rotator/backend-component" for row in rows))
+
+    @pytest.mark.unittest
+    def test_env_format_lists_the_whole_manifest(self):
+        code, stdout, _stderr = self.run_manifest("--configuration", "dev", "--format", "env")
+        self.assertEqual(code, 0)
+        self.assertIn(
+            "DEV_CONFIG_ROTATOR_BACKEND_COMPONENT=1a0b35a3cf0416b9ae8017509941334608243840",
+            stdout.splitlines(),
+        )
+
+
+class TestConfigEvents(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo with a copy of the test config"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        shutil.copy(VALID_CONFIG_PATH, os.path.join(self.temp_dir, "config-rotator.json"))
+        self.events_file = os.path.join(self.temp_dir, "events.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def event(self, repo, event_type, event_name):
+        return {"repo": repo, "event_type": event_type, "event_name": event_name}
+
+    @pytest.mark.unittest
+    def test_config_events_file(self):
+        with open(self.events_file, "w") as f:
+            f.write(json.dumps(self.event("config-rotator/backend-component", "tag", "1.0.0")) + "\n")
+            f.write(json.dumps(self.event("nobody/nothing", "tag", "1.0.0")) + "\n")
+            f.write("{not json\n")
+
+        args = rotator_parse(
+            ["config", "--events-file", self.events_file, "--git-root", self.temp_dir]
+        )
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with self.assertRaises(SystemExit) as cm:
+                handle_config(args)
+
+        self.assertEqual(cm.exception.code, 1)
+        results = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(
+            [(r.get("configuration"), r["status"]) for r in results],
+            [("prod", "matched"), (None, "no-match"), (None, "invalid")],
+        )
+
+    @pytest.mark.unittest
+    def test_resolve_many_streams(self):
+        config = ProductConfig(context=RepoContext(git_root=self.temp_dir))
+        # An endless stream - results must come out as the events go in
+        events = (
+            self.event("config-rotator/backend-component", "tag", f"1.0.{i}")
+            for i in itertools.count()
+        )
+        results = list(itertools.islice(config.resolve_many(events), 100))
+        self.assertEqual({configuration for _event, configuration in results}, {"prod"})
+        self.assertEqual(results[42][0]["event_name"], "1.0.42")
+
+
+class TestLockAllMatches(unittest.TestCase):
+    def setUp(self):
+        """Set up a fake product repo where a 'perf' configuration overlaps with 'prod'"""
+        self.temp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.temp_dir, ".git"))
+        with open(VALID_CONFIG_PATH) as f:
+            config = json.load(f)
+        config["perf"] = config["prod"]
+        with open(os.path.join(self.temp_dir, "config-rotator.json"), "w") as f:
+            json.dump(config, f)
+        shutil.copytree(ORIGINAL_MANIFESTS_PATH, os.path.join(self.temp_dir, "configurations"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def lock(self, *options):
+        args = rotator_parse(
+            [
+                *("lock", "--repo", "config-rotator/backend-component", "--event-type", "tag"),
+                *("--event-name", "1.2.3", "--sha", "a" * 40, *options),
+                *("--git-root", self.temp_dir),
+            ]
+        )
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with self.assertRaises(SystemExit) as cm:
+                handle_lock(args)
+        self.assertEqual(cm.exception.code, 0)
+        return stdout.getvalue().splitlines()
+
+    def version(self, configuration):
+        file = os.path.join(
+            self.temp_dir, "configurations", configuration, f"config-{configuration}-manifest.json"
+        )
+        with open(file) as f:
+            entries = json.load(f)[configuration]
+        return {entry["repo"]: entry["version"] for entry in entries}.get(
+            "config-rotator/backend-component"
+        )
+
+    @pytest.mark.unittest
+    def test_first_match_by_default(self):
+        self.lock()
+        self.assertEqual(self.version("prod"), "a" * 40)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, "configurations", "perf")))
+
+    @pytest.mark.unittest
+    def test_all_matches_reports_changed_configurations(self):
+        self.assertEqual(self.lock("--all-matches"), ["prod", "perf"])
+        self.assertEqual(self.version("prod"), "a" * 40)
+        self.assertEqual(self.version("perf"), "a" * 40)
+        # Nothing changes the second time
+        self.assertEqual(self.lock("--all-matches"), [])
+
+
+class TestLockParser(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_lock_requires_event_or_events_file(self):
+        with patch("sys.stderr", new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                rotator_parse(["lock", "--repo", "org/repo"])
+            with self.assertRaises(SystemExit):
+                rotator_parse(["lock", "--events-file", "events.jsonl", "--repo", "org/repo"])
+
+        args = rotator_parse(["lock", "--events-file", "-"])
+        self.assertEqual(args.events_file, "-")
+
+
+class TestParser(unittest.TestCase):
+    @pytest.mark.unittest
+    def test_only_the_command_being_run_is_built(self):
+        # A value of a top level option is never taken for the command
+        args = rotator_parse(
+            ["--manifest-dir", "lock", "config", "--event-type", "tag", "--event-name", "1.0.0"]
+        )
+        self.assertEqual(args.manifest_dir, "lock")
+        self.assertEqual(args.command, "config")
+        self.assertEqual(args.event_name, "1.0.0")
+
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with self.assertRaises(SystemExit):
+                rotator_parse(["--help"])
+        for command in ("lock", "manifest", "config", "serve"):
+            self.assertIn(command, stdout.getvalue())